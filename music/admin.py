@@ -18,10 +18,13 @@ class TrackAdmin(admin.ModelAdmin):
     ordering=('record_fk', 'number')
     filter_horizontal=('feat',)
 
+class ReviewAdmin(admin.ModelAdmin):
+    readonly_fields = ('like_counter',)
+
 admin.site.register(Band)
 admin.site.register(Label)
 admin.site.register(Genre)
 admin.site.register(Record, RecordAdmin)
 admin.site.register(Track, TrackAdmin)
 admin.site.register(OwnedRecord)
-admin.site.register(Review)
+admin.site.register(Review, ReviewAdmin)
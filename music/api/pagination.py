@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from music.pagination import KeysetPaginator, InvalidCursor
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Cursor pagination seeking on a unique indexed sort key, so that every
+    page costs the same however deep the client goes. Views choose the key
+    with keyset_ordering, (name, pk) by default. ?page_size= is capped at
+    MUSIC_API_MAX_PAGE_SIZE
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('name', 'pk')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return max(1, min(page_size, settings.MUSIC_API_MAX_PAGE_SIZE))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = getattr(view, 'keyset_ordering', self.ordering)
+        paginator = KeysetPaginator(queryset, ordering,
+                                    self.get_page_size(request))
+        try:
+            self.page = paginator.page(
+                request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return list(self.page)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.page.next_cursor())),
+            ('previous', self.get_link(self.page.previous_cursor())),
+            ('results', data),
+        ]))
@@ -1,8 +1,10 @@
 from rest_framework.serializers import (
+    CharField,
     ModelSerializer,
     SerializerMethodField)
 
-from music.models import Band, Label, Genre, Record, Track
+from music.models import Band, Label, Genre, Record, SearchDocument
+from music.models import RecordSummary
 
 
 class BandCreateUpdateSerializer(ModelSerializer):
@@ -113,8 +115,9 @@ class RecordDetailSerializer(ModelSerializer):
     class Meta:
         model = Record
         fields = ('id', 'title', 'bands', 'release_date', 'label', 'genres',
-                 'create_by', 'create_date')
-        read_only_fields = ('id', 'create_date', 'create_by')
+                 'runtime_seconds', 'track_count', 'create_by', 'create_date')
+        read_only_fields = ('id', 'create_date', 'create_by',
+                            'runtime_seconds', 'track_count')
 
     def get_create_by(self, obj):
         return str(obj.create_by.username)
@@ -139,7 +142,8 @@ class RecordListSerializer(ModelSerializer):
 
     class Meta:
         model = Record
-        fields = ('title', 'bands', 'release_date', 'label', 'genres')
+        fields = ('title', 'bands', 'release_date', 'label', 'genres',
+                  'runtime_seconds', 'track_count')
 
     def get_label(self, obj):
         return str(obj.label_fk.name)
@@ -153,5 +157,30 @@ class RecordListSerializer(ModelSerializer):
         return str(', '.join(band_list))
 
 
+class RecordSummaryListSerializer(ModelSerializer):
+    """
+    RecordListSerializer output read from the record summary
+    """
+    label = CharField(source='label_name')
+    genres = CharField(source='genre_names')
+    bands = CharField(source='band_names')
+
+    class Meta:
+        model = RecordSummary
+        fields = ('title', 'bands', 'release_date', 'label', 'genres',
+                  'runtime_seconds', 'track_count')
+
+
+class SearchResultSerializer(ModelSerializer):
+    url = SerializerMethodField()
+    rank = SerializerMethodField()
+
+    class Meta:
+        model = SearchDocument
+        fields = ('kind', 'title', 'slug', 'url', 'rank')
 
+    def get_url(self, obj):
+        return obj.get_absolute_url()
 
+    def get_rank(self, obj):
+        return obj.rank
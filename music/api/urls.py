@@ -48,10 +48,23 @@ urlpatterns = [
         #    name='record_create'),
         url(r'^record/(?P<slug>[-\w]+)/$', RecordDetailAPIView.as_view(),
             name='record_detail'),
+        url(r'^record/(?P<slug>[-\w]+)/other/$',
+            RecordOtherRecordsAPIView.as_view(), name='record_other'),
+        url(r'^record/(?P<slug>[-\w]+)/similar/$',
+            RecordSimilarAPIView.as_view(), name='record_similar'),
         #url(r'^record/(?P<slug>[-\w]+)/update/$', RecordUpdateAPIView.as_view(),
         #    name='record_update'),
         url(r'^record/(?P<slug>[-\w]+)/delete/$', RecordDeleteAPIView.as_view(),
             name='record_delete'),
 
+        url(r'^review/(?P<pk>[0-9]+)/like/$', ReviewLikeAPIView.as_view(),
+            name='review_like'),
+
+        url(r'^search/$', SearchAPIView.as_view(), name='search'),
+        url(r'^export/$', CatalogueExportAPIView.as_view(), name='export'),
+        url(r'^typeahead/$', TypeaheadAPIView.as_view(), name='typeahead'),
+        url(r'^typeahead/stats/$', TypeaheadStatsAPIView.as_view(),
+            name='typeahead_stats'),
+
 
 ]
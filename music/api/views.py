@@ -1,3 +1,7 @@
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.generics import (
     ListAPIView,
     RetrieveAPIView,
@@ -6,24 +10,81 @@ from rest_framework.generics import (
     CreateAPIView,
 )
 
-from music.models import Band, Label, Genre, Record
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from music.models import Band, Label, Genre, Record, Review, RecordSummary
 from music.api.serializers import *
-
-
-
-class BandCreateAPIView(CreateAPIView):
-    serializer_class = BandCreateUpdateSerializer
-
+from music import search, pagecache
+from music.conditional import conditional
+from music.typeahead import typeahead
+from music import export
+from music.importer import bulk_created
+from music.middleware import accepted_encodings
+
+
+# Querysets loading exactly what the serializers touch, so that the number
+# of queries does not depend on the number of objects
+BAND_DETAIL_QUERYSET = Band.objects.select_related('create_by').\
+        prefetch_related('record_set')
+RECORD_LIST_QUERYSET = Record.objects.select_related('label_fk').\
+        prefetch_related('genres', 'bands')
+RECORD_DETAIL_QUERYSET = RECORD_LIST_QUERYSET.select_related('create_by')
+
+
+class BulkCreateMixin(object):
+    """
+    Create view accepting a single object or a JSON array of them. Arrays
+    are validated item by item and valid items are written in one
+    transaction with one INSERT; errors are reported by item index
+    """
     def perform_create(self, serializer):
-        serializer.save(create_by=self.request.user)
-        serializer.save(modify_by=self.request.user)
+        serializer.save(create_by=self.request.user,
+                        modify_by=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super(BulkCreateMixin, self).create(request, *args,
+                                                       **kwargs)
+        if len(request.data) > settings.MUSIC_API_MAX_BULK_CREATE:
+            return Response(
+                {'detail': 'At most %d objects per request' %
+                 settings.MUSIC_API_MAX_BULK_CREATE},
+                status=status.HTTP_400_BAD_REQUEST)
+        model = self.get_serializer_class().Meta.model
+        objects = []
+        errors = []
+        for index, item in enumerate(request.data):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                objects.append(model(create_by=request.user,
+                                     modify_by=request.user,
+                                     **serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+        if objects:
+            with transaction.atomic():
+                bulk_created(model, objects)
+        data = {'created': self.get_serializer(objects, many=True).data,
+                'errors': errors}
+        if not objects and errors:
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class BandCreateAPIView(BulkCreateMixin, CreateAPIView):
+    serializer_class = BandCreateUpdateSerializer
 
 class BandListAPIView(ListAPIView):
     queryset = Band.objects.all()
     serializer_class = BandListSerializer
 
+@method_decorator(conditional(Band), name='dispatch')
 class BandDetailAPIView(RetrieveAPIView):
-    queryset = Band.objects.all()
+    queryset = BAND_DETAIL_QUERYSET
     serializer_class = BandDetailSerializer
     lookup_field = 'slug'
 
@@ -36,25 +97,22 @@ class BandUpdateAPIView(RetrieveUpdateAPIView):
         serializer.save(modify_by=self.request.user)
 
 class BandDeleteAPIView(RetrieveDestroyAPIView):
-    queryset = Band.objects.all()
+    queryset = BAND_DETAIL_QUERYSET
     serializer_class = BandDetailSerializer
     lookup_field = 'slug'
 
 
 
-class LabelCreateAPIView(CreateAPIView):
+class LabelCreateAPIView(BulkCreateMixin, CreateAPIView):
     serializer_class = LabelCreateUpdateSerializer
 
-    def perform_create(self, serializer):
-        serializer.save(create_by=self.request.user)
-        serializer.save(modify_by=self.request.user)
-
 class LabelListAPIView(ListAPIView):
     queryset = Label.objects.all()
     serializer_class = LabelListSerializer
 
+@method_decorator(conditional(Label), name='dispatch')
 class LabelDetailAPIView(RetrieveAPIView):
-    queryset = Label.objects.all()
+    queryset = Label.objects.select_related('create_by')
     serializer_class = LabelDetailSerializer
     lookup_field = 'slug'
 
@@ -67,24 +125,21 @@ class LabelUpdateAPIView(RetrieveUpdateAPIView):
         serializer.save(modify_by=self.request.user)
 
 class LabelDeleteAPIView(RetrieveDestroyAPIView):
-    queryset = Label.objects.all()
+    queryset = Label.objects.select_related('create_by')
     serializer_class = LabelDetailSerializer
     lookup_field = 'slug'
 
 
-class GenreCreateAPIView(CreateAPIView):
+class GenreCreateAPIView(BulkCreateMixin, CreateAPIView):
     serializer_class = GenreCreateUpdateSerializer
 
-    def perform_create(self, serializer):
-        serializer.save(create_by=self.request.user)
-        serializer.save(modify_by=self.request.user)
-
 class GenreListAPIView(ListAPIView):
     queryset = Genre.objects.all()
     serializer_class = GenreListSerializer
 
+@method_decorator(conditional(Genre), name='dispatch')
 class GenreDetailAPIView(RetrieveAPIView):
-    queryset = Genre.objects.all()
+    queryset = Genre.objects.select_related('create_by')
     serializer_class = GenreDetailSerializer
     lookup_field = 'slug'
 
@@ -97,7 +152,7 @@ class GenreUpdateAPIView(RetrieveUpdateAPIView):
         serializer.save(modify_by=self.request.user)
 
 class GenreDeleteAPIView(RetrieveDestroyAPIView):
-    queryset = Genre.objects.all()
+    queryset = Genre.objects.select_related('create_by')
     serializer_class = GenreDetailSerializer
     lookup_field = 'slug'
 
@@ -111,14 +166,68 @@ class RecordCreateAPIView(CreateAPIView):
 """
 
 class RecordListAPIView(ListAPIView):
-    queryset = Record.objects.all()
-    serializer_class = RecordListSerializer
-
+    """
+    Records by title, ?ordering=runtime or -runtime sorts by runtime and
+    ?min_runtime= / ?max_runtime= filter it, in seconds
+    """
+    serializer_class = RecordSummaryListSerializer
+
+    def get_queryset(self):
+        return RecordSummary.objects.runtime_between(
+            self.request.query_params)
+
+    @property
+    def keyset_ordering(self):
+        return Record.LIST_ORDERINGS.get(
+            self.request.query_params.get('ordering'),
+            Record.LIST_ORDERINGS['title'])
+
+@method_decorator(conditional(Record), name='dispatch')
 class RecordDetailAPIView(RetrieveAPIView):
-    queryset = Record.objects.all()
+    queryset = RECORD_DETAIL_QUERYSET
     serializer_class = RecordDetailSerializer
     lookup_field = 'slug'
 
+class RecordOtherRecordsAPIView(ListAPIView):
+    """
+    Latest other records of the bands of a record, ?limit= up to max_limit
+    """
+    serializer_class = RecordListSerializer
+    pagination_class = None
+    max_limit = 100
+
+    def get_queryset(self):
+        record = get_object_or_404(Record, slug=self.kwargs['slug'])
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = settings.MUSIC_OTHER_RECORDS_LIMIT
+        limit = max(1, min(limit, self.max_limit))
+        return Record.objects.other_records_of(record).\
+                select_related('label_fk').\
+                prefetch_related('genres', 'bands')[0:limit]
+
+
+class RecordSimilarAPIView(ListAPIView):
+    """
+    Records most similar to a record, precomputed by
+    compute_similar_records, ?limit= up to max_limit
+    """
+    serializer_class = RecordListSerializer
+    pagination_class = None
+    max_limit = 100
+
+    def get_queryset(self):
+        record = get_object_or_404(Record, slug=self.kwargs['slug'])
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = settings.MUSIC_SIMILAR_RECORDS_LIMIT
+        limit = max(1, min(limit, self.max_limit))
+        return RECORD_LIST_QUERYSET.filter(
+            similar_to__record_fk=record).\
+                order_by('-similar_to__score', 'pk')[0:limit]
+
 """
 class RecordUpdateAPIView(RetrieveUpdateAPIView):
     queryset = Record.objects.all()
@@ -130,7 +239,94 @@ class RecordUpdateAPIView(RetrieveUpdateAPIView):
 """
 
 class RecordDeleteAPIView(RetrieveDestroyAPIView):
-    queryset = Record.objects.all()
+    queryset = RECORD_DETAIL_QUERYSET
     serializer_class = RecordDetailSerializer
     lookup_field = 'slug'
 
+
+class SearchAPIView(ListAPIView):
+    """
+    Ranked full-text search over the catalogue, ?q=words&limit=N
+    """
+    serializer_class = SearchResultSerializer
+    pagination_class = None
+    max_limit = 100
+
+    def get_queryset(self):
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = 20
+        limit = max(1, min(limit, self.max_limit))
+        return search.search(self.request.query_params.get('q', ''), limit)
+
+
+class TypeaheadAPIView(APIView):
+    """
+    Bands, records and labels with a name starting with ?q=, most popular
+    first, served from the in-memory prefix index
+    """
+    max_limit = 20
+
+    def get(self, request, format=None):
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = 10
+        limit = max(1, min(limit, self.max_limit))
+        results = typeahead.lookup(request.query_params.get('q', ''), limit)
+        return Response({'results': [{'kind': kind, 'name': name, 'slug': slug}
+                                     for kind, name, slug in results]})
+
+
+class TypeaheadStatsAPIView(APIView):
+    """
+    Size and memory use of the prefix index of this worker
+    """
+    def get(self, request, format=None):
+        return Response(typeahead.stats())
+
+
+class CatalogueExportAPIView(APIView):
+    """
+    Whole catalogue streamed as newline-delimited JSON, one record with its
+    bands, label, genres and tracks per line. Gzipped on the fly for
+    clients accepting it
+    """
+    def get(self, request, format=None):
+        chunks = export.ndjson_chunks(settings.MUSIC_EXPORT_CHUNK_SIZE)
+        gzipped = 'gzip' in accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING'))
+        if gzipped:
+            chunks = export.gzip_chunks(chunks)
+        response = StreamingHttpResponse(
+            chunks, content_type='application/x-ndjson; charset=utf-8')
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class ReviewLikeAPIView(APIView):
+    """
+    POST likes a review, DELETE takes the like back. Every user likes a
+    review at most once
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def react(self, request, pk, like):
+        review = get_object_or_404(Review.objects.only('pk', 'record_fk'),
+                                   pk=pk)
+        if like:
+            changed = review.like(request.user)
+        else:
+            changed = review.unlike(request.user)
+        if changed:
+            pagecache.invalidate('record:%d' % review.record_fk_id)
+        return Response({'liked': like, 'changed': changed})
+
+    def post(self, request, pk, format=None):
+        return self.react(request, pk, True)
+
+    def delete(self, request, pk, format=None):
+        return self.react(request, pk, False)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MusicConfig(AppConfig):
     name = 'music'
+
+    def ready(self):
+        import music.signals
@@ -0,0 +1,91 @@
+import hashlib
+
+from django.db.models import Count, Max, Q, Sum
+from django.views.decorators.http import condition
+from music.models import (Band, Label, Genre, Record, Track, Review,
+                          SimilarRecord)
+from music import pagecache
+
+
+# Querysets of objects shown on the page of an object, by its model. Each
+# is summarized by its latest modify_date and its size, so that deletes
+# and new relations change the ETag as well. Reviews add their likes,
+# which are counted without touching modify_date
+DEPENDENTS = {
+    Band: lambda pk: [
+        Record.objects.filter(Q(bands=pk) | Q(track__feat=pk)),
+        Label.objects.filter(record__bands=pk),
+        Track.objects.filter(feat=pk),
+    ],
+    Record: lambda pk: [
+        Track.objects.filter(record_fk=pk),
+        Review.objects.filter(record_fk=pk),
+        Band.objects.filter(Q(record=pk) | Q(track__record_fk=pk)),
+        Record.objects.filter(bands__record=pk),
+        SimilarRecord.objects.filter(record_fk=pk),
+        Label.objects.filter(record=pk),
+        Genre.objects.filter(record=pk),
+    ],
+    Label: lambda pk: [Record.objects.filter(label_fk=pk)],
+    Genre: lambda pk: [Record.objects.filter(genres=pk)],
+}
+
+
+def resource_state(model, slug):
+    """
+    Return (last modified, etag) of the object with given slug and its
+    dependents, None if there is no such object
+    """
+    rows = model.objects.filter(slug=slug).order_by().\
+            values_list('pk', 'modify_date')[0:1]
+    if not rows:
+        return None
+    pk, last_modified = rows[0]
+    parts = [model._meta.model_name, pk, last_modified]
+    for queryset in DEPENDENTS[model](pk):
+        extra = {}
+        if queryset.model is Review:
+            extra['likes'] = Sum('like_counter')
+        stats = queryset.order_by().aggregate(
+            latest=Max('modify_date'), count=Count('pk', distinct=True),
+            **extra)
+        parts += [stats['latest'], stats['count'], stats.get('likes')]
+        if stats['latest'] is not None and stats['latest'] > last_modified:
+            last_modified = stats['latest']
+    etag = hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+    return last_modified, etag
+
+
+def conditional(model, per_user=False):
+    """
+    Decorator of slug detail views answering conditional GETs with 304 Not
+    Modified before the view runs. Pages showing the logged user (per_user)
+    get the user in their ETag and no Last-Modified for logged users.
+
+    Validators are kept on request.resource_state, which the page cache
+    stores with the page, so that pages in cache are validated without
+    any query
+    """
+    def state(request, slug, *args, **kwargs):
+        # etag and last modified functions share one computation
+        if not hasattr(request, 'resource_state'):
+            request.resource_state = pagecache.get_validators(request) or \
+                    resource_state(model, slug)
+        return request.resource_state
+
+    def etag(request, *args, **kwargs):
+        result = state(request, *args, **kwargs)
+        if result is None:
+            return None
+        if per_user:
+            return '%s-%s' % (result[1], request.user.pk or 0)
+        return result[1]
+
+    def last_modified(request, *args, **kwargs):
+        result = state(request, *args, **kwargs)
+        if result is None or \
+                (per_user and request.user.is_authenticated()):
+            return None
+        return result[0]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -0,0 +1,64 @@
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from music.models import Record, Track
+
+
+def record_chunks(chunk_size):
+    """
+    Yield lists of records in pk order, chunk_size at a time. Every chunk
+    is read with a pk range scan and its relations are loaded with one
+    query per relation, so memory use only depends on chunk_size
+    """
+    queryset = Record.objects.select_related('label_fk').prefetch_related(
+        'bands', 'genres',
+        Prefetch('track_set', queryset=Track.objects.order_by('number')))
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                     [0:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def record_document(record):
+    """
+    Return exported representation of a record with loaded relations
+    """
+    return {
+        'id': record.pk,
+        'slug': record.slug,
+        'title': record.title,
+        'release_date': record.release_date,
+        'label': record.label_fk.name,
+        'bands': [band.name for band in record.bands.all()],
+        'genres': [genre.name for genre in record.genres.all()],
+        'tracks': [{'number': track.number, 'name': track.name,
+                    'length': track.length}
+                   for track in record.track_set.all()],
+    }
+
+
+def ndjson_chunks(chunk_size):
+    """
+    Yield catalogue as newline-delimited JSON, one string per chunk
+    """
+    encoder = DjangoJSONEncoder()
+    for chunk in record_chunks(chunk_size):
+        yield ''.join(encoder.encode(record_document(record)) + '\n'
+                      for record in chunk)
+
+
+def gzip_chunks(chunks):
+    """
+    Compress a stream of strings into a gzip stream on the fly
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
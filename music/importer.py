@@ -0,0 +1,232 @@
+import csv
+import json
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.six import StringIO
+from django.utils.text import slugify
+from music.models import Band, Label, Genre, Record, Track, RowCount
+from music.models import to_seconds, MAX_TRACK_SECONDS
+from music import search, pagecache, summaries
+
+
+def read_ndjson(stream):
+    """
+    Yield catalogue entries of a newline-delimited JSON dump, the format
+    written by the catalogue export
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    """
+    Yield catalogue entries of a CSV dump with title, release_date, label,
+    bands and genres columns, band and genre names separated with '|'
+    """
+    for row in csv.DictReader(stream):
+        yield {
+            'title': row['title'],
+            'release_date': row['release_date'],
+            'label': row['label'],
+            'bands': [name for name in row.get('bands', '').split('|') if name],
+            'genres': [name for name in row.get('genres', '').split('|')
+                       if name],
+        }
+
+
+def make_slug(name):
+    return slugify(name)[0:50]
+
+
+def track_length(track):
+    """
+    Return length of a track entry in seconds, 'HH:MM:SS' in dumps. Lengths
+    of a day or more are cut to MAX_TRACK_SECONDS
+    """
+    return min(to_seconds(track.get('length') or 0), MAX_TRACK_SECONDS)
+
+
+def bulk_insert(model, objects):
+    """
+    Insert objects with bulk INSERTs and set their pks. Databases which
+    can't return ids of bulk inserts get them read back by pk order, so
+    nothing else may insert into the table meanwhile
+    """
+    if connection.features.can_return_ids_from_bulk_insert:
+        return model.objects.bulk_create(objects)
+    last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).\
+            first() or 0
+    model.objects.bulk_create(objects)
+    pks = model.objects.filter(pk__gt=last_pk).order_by('pk').\
+            values_list('pk', flat=True)
+    for obj, pk in zip(objects, pks):
+        obj.pk = pk
+    return objects
+
+
+def bulk_created(model, objects):
+    """
+    Insert new bands, labels or genres with bulk INSERTs and do what their
+    save() and save signals would: slugs, search documents, row counts
+    and cached lists
+    """
+    for obj in objects:
+        obj.slug = make_slug(obj.name)
+    bulk_insert(model, objects)
+    search.index_objects(model, objects)
+    RowCount.add(model, len(objects))
+    pagecache.invalidate('list:' + model._meta.model_name)
+    return objects
+
+
+def copy_rows(model, fields, rows):
+    """
+    Insert rows of values of fields, with COPY on PostgreSQL and bulk
+    INSERTs elsewhere
+    """
+    if not rows:
+        return
+    if connection.vendor != 'postgresql':
+        model.objects.bulk_create(model(**dict(zip(fields, row)))
+                                  for row in rows)
+        return
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(field).column)
+                        for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert('COPY %s (%s) FROM STDIN WITH (FORMAT csv)' %
+                           (quote(model._meta.db_table), columns), buffer)
+
+
+class CatalogueImporter(object):
+    """
+    Writes batches of catalogue entries with bulk inserts. Bands, labels
+    and genres are resolved by name through in-memory maps loaded once,
+    missing ones are created
+    """
+    def __init__(self, user):
+        self.user_id = user.pk
+        self.names = {}
+        for model in (Band, Label, Genre):
+            self.names[model] = dict(
+                (name, pk) for pk, name in
+                model.objects.order_by('-pk').values_list('pk', 'name'))
+        self.records = 0
+        self.rows = 0
+
+    def authored(self, **fields):
+        fields.update(create_by_id=self.user_id, modify_by_id=self.user_id)
+        return fields
+
+    def resolve(self, model, names):
+        """
+        Return dict of pks of objects with given names, creating missing
+        """
+        known = self.names[model]
+        missing = sorted(set(name for name in names if name not in known))
+        if missing:
+            objects = bulk_created(model, [
+                model(**self.authored(name=name)) for name in missing])
+            for obj in objects:
+                known[obj.name] = obj.pk
+            self.rows += len(objects)
+        return known
+
+    def import_batch(self, entries):
+        """
+        Write records of entries with their tracks and relations
+        """
+        bands = self.resolve(Band, [name for entry in entries
+                                    for name in self.band_names(entry)])
+        labels = self.resolve(Label, [entry['label'] for entry in entries])
+        genres = self.resolve(Genre, [name for entry in entries
+                                      for name in entry.get('genres', [])])
+        records = bulk_insert(Record, [
+            Record(**self.authored(
+                title=entry['title'], slug=make_slug(entry['title']),
+                release_date=parse_date(entry['release_date']),
+                label_fk_id=labels[entry['label']],
+                # track aggregates the track signals would maintain
+                runtime_seconds=sum(track_length(track)
+                                    for track in entry.get('tracks', [])),
+                track_count=len(entry.get('tracks', []))))
+            for entry in entries])
+        record_bands = set()
+        record_genres = set()
+        tracks = []
+        for entry, record in zip(entries, records):
+            record_bands.update((record.pk, bands[name])
+                                for name in entry.get('bands', []))
+            record_genres.update((record.pk, genres[name])
+                                 for name in entry.get('genres', []))
+            for track in entry.get('tracks', []):
+                tracks.append((record, track))
+        copy_rows(Record.bands.through, ('record_id', 'band_id'),
+                  sorted(record_bands))
+        copy_rows(Record.genres.through, ('record_id', 'genre_id'),
+                  sorted(record_genres))
+        track_objects = self.import_tracks(tracks, bands)
+        search.index_objects(Record, records)
+        search.index_objects(Track, track_objects)
+        summaries.refresh([record.pk for record in records])
+        # counted with the batch, so that interrupted imports are counted too
+        RowCount.add(Record, len(records))
+        self.records += len(records)
+        self.rows += len(records) + len(record_bands) + len(record_genres)
+        pagecache.invalidate(
+            *['band:%d' % pk for record_id, pk in record_bands] +
+            ['genre:%d' % pk for record_id, pk in record_genres] +
+            ['label:%d' % record.label_fk_id for record in records])
+
+    def band_names(self, entry):
+        names = list(entry.get('bands', []))
+        for track in entry.get('tracks', []):
+            names.extend(track.get('feat', []))
+        return names
+
+    def import_tracks(self, tracks, bands):
+        """
+        Write tracks given as (record, track entry) pairs with featured
+        bands, tracks without features go through COPY
+        """
+        objects = [Track(**self.authored(
+            record_fk=record, name=track['name'], slug=make_slug(track['name']),
+            number=track.get('number', 0), length_seconds=track_length(track)))
+                   for record, track in tracks]
+        if any(track.get('feat') for record, track in tracks):
+            bulk_insert(Track, objects)
+            feats = set()
+            for obj, (record, track) in zip(objects, tracks):
+                feats.update((obj.pk, bands[name])
+                             for name in track.get('feat', []))
+            copy_rows(Track.feat.through, ('track_id', 'band_id'),
+                      sorted(feats))
+            self.rows += len(feats)
+        elif objects:
+            now = timezone.now()
+            copy_rows(Track, ('record_fk_id', 'name', 'slug', 'number',
+                              'length_seconds', 'create_by_id', 'create_date',
+                              'modify_by_id', 'modify_date'),
+                      [(obj.record_fk_id, obj.name, obj.slug, obj.number,
+                        obj.length_seconds, self.user_id, now, self.user_id,
+                        now)
+                       for obj in objects])
+            # tracks loaded with COPY have no pks, index them by record
+            objects = list(Track.objects.filter(
+                record_fk__in=[record for record, track in tracks]).
+                           select_related('record_fk'))
+        self.rows += len(objects)
+        return objects
+
+    def finish(self):
+        """
+        Update list pages after the last batch
+        """
+        pagecache.invalidate('list:record')
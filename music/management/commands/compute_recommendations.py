@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from music import recommendations
+
+
+class Command(BaseCommand):
+    """
+    Factorize the user x record matrix of review scores with alternating
+    least squares and store best scored records every user has neither
+    reviewed nor owns
+    """
+    help = 'Compute recommended records of every reviewing user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=20,
+                            help='Number of latent factors')
+        parser.add_argument('--regularization', type=float, default=0.1,
+                            help='Regularization weight')
+        parser.add_argument('--iterations', type=int, default=10,
+                            help='Number of ALS iterations')
+        parser.add_argument('--top-n', type=int,
+                            default=settings.MUSIC_RECOMMENDATIONS_LIMIT,
+                            help='Number of recommendations kept per user')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of users or records solved at once')
+
+    def handle(self, *args, **options):
+        timer = recommendations.Timer()
+        with transaction.atomic():
+            ratings, stored = recommendations.compute(
+                options['factors'], options['regularization'],
+                options['iterations'], options['top_n'],
+                options['chunk_size'], timer)
+        self.stdout.write('%d users, %d records, %d ratings' %
+                          (len(ratings.users), len(ratings.records),
+                           ratings.matrix.nnz))
+        for line in timer.report():
+            self.stdout.write(line)
+        self.stdout.write('Done: %d recommendations' % stored)
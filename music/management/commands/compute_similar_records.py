@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from music.models import Record
+from music import similarity
+
+
+class Command(BaseCommand):
+    """
+    Precompute similar records from shared genres, bands, featured artists
+    and users. Only records changed since the last run, and records which
+    may take them as neighbours, are refreshed unless --full is given
+    """
+    help = 'Compute top similar records of every record'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute all records')
+        parser.add_argument('--top-k', type=int,
+                            default=settings.MUSIC_SIMILAR_RECORDS_LIMIT,
+                            help='Number of similar records kept per record')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of records computed per product')
+
+    def handle(self, *args, **options):
+        only = None
+        last_run = Record.objects.aggregate(
+            last=Max('similar_date'))['last']
+        if not options['full'] and last_run is not None:
+            only = similarity.changed_record_ids(last_run)
+            self.stdout.write('%d records changed since %s' %
+                              (len(only), last_run))
+        with transaction.atomic():
+            done = 0
+            for done in similarity.compute(options['top_k'],
+                                           options['chunk_size'], only):
+                self.stdout.write('Computed %d records' % done)
+        self.stdout.write('Done: %d records' % done)
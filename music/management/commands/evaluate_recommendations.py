@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from music import recommendations
+
+
+class Command(BaseCommand):
+    """
+    Offline evaluation of recommendations: factorize a random part of the
+    review scores and measure prediction error and precision of top
+    recommendations on the held-out rest. Nothing is stored
+    """
+    help = 'Report RMSE and precision@K of recommendations on held-out reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test-fraction', type=float, default=0.2,
+                            help='Share of reviews held out for testing')
+        parser.add_argument('--k', type=int,
+                            default=settings.MUSIC_RECOMMENDATIONS_LIMIT,
+                            help='Number of recommendations evaluated per user')
+        parser.add_argument('--relevant-score', type=int, default=4,
+                            help='Lowest held-out score counted as a hit')
+        parser.add_argument('--factors', type=int, default=20)
+        parser.add_argument('--regularization', type=float, default=0.1)
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the train/test split')
+
+    def handle(self, *args, **options):
+        timer = recommendations.Timer()
+        ratings = recommendations.Ratings.from_reviews()
+        train, test = recommendations.split(
+            ratings.matrix, options['test_fraction'], options['seed'])
+        timer.step('load')
+        users, records, mean = recommendations.factorize(
+            train, options['factors'], options['regularization'],
+            options['iterations'], options['chunk_size'], timer=timer)
+        rmse = recommendations.rmse(users, records, mean, test)
+        precision = recommendations.precision_at_k(
+            users, records, mean, train, test, options['k'],
+            options['relevant_score'], options['chunk_size'])
+        timer.step('evaluate')
+        self.stdout.write('%d users, %d records, %d train / %d test ratings' %
+                          (len(ratings.users), len(ratings.records),
+                           train.nnz, test.nnz))
+        self.stdout.write('RMSE: %.4f' % rmse)
+        self.stdout.write('Precision@%d: %.4f' % (options['k'], precision))
+        for line in timer.report():
+            self.stdout.write(line)
@@ -0,0 +1,85 @@
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from music.importer import CatalogueImporter, read_ndjson, read_csv
+
+
+class Command(BaseCommand):
+    """
+    Load records with their bands, labels, genres and tracks from a
+    newline-delimited JSON (as written by the catalogue export) or CSV dump
+    """
+    help = 'Bulk import catalogue from an NDJSON or CSV dump'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Dump file, .csv or NDJSON')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of records written per transaction')
+        parser.add_argument('--user', default=None,
+                            help='Username set as author, user 1 by default')
+        parser.add_argument('--checkpoint', default=None,
+                            help='File keeping progress, a rerun resumes '
+                                 'after the last imported batch')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        try:
+            if options['user']:
+                user = User.objects.get(username=options['user'])
+            else:
+                user = User.objects.get(pk=1)
+        except User.DoesNotExist:
+            raise CommandError('Author user does not exist')
+        done = self.read_checkpoint(options['checkpoint'], path)
+        reader = read_csv if path.endswith('.csv') else read_ndjson
+        importer = CatalogueImporter(user)
+        start = time.time()
+        with io.open(path, encoding='utf-8', newline='') as stream:
+            entries = islice(reader(stream), done, None)
+            if done:
+                self.stdout.write('Resuming after %d records' % done)
+            imported = 0
+            while True:
+                batch = list(islice(entries, batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    importer.import_batch(batch)
+                imported += len(batch)
+                self.write_checkpoint(options['checkpoint'], path,
+                                      done + imported)
+                self.report(imported, importer.rows, start)
+        importer.finish()
+        self.stdout.write('Done: %d records imported' % imported)
+
+    def report(self, imported, rows, start):
+        elapsed = max(time.time() - start, 1e-6)
+        self.stdout.write('%d records, %d rows in %.1fs (%d rows/s)' %
+                          (imported, rows, elapsed, rows / elapsed))
+
+    def read_checkpoint(self, checkpoint, path):
+        """
+        Return number of records of path already imported
+        """
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as stream:
+            state = json.load(stream)
+        if state['path'] != os.path.abspath(path):
+            raise CommandError('Checkpoint belongs to %s' % state['path'])
+        return state['done']
+
+    def write_checkpoint(self, checkpoint, path, done):
+        if not checkpoint:
+            return
+        with open(checkpoint + '.tmp', 'w') as stream:
+            json.dump({'path': os.path.abspath(path), 'done': done}, stream)
+        # replaced at once, a crash never leaves a half written checkpoint
+        os.replace(checkpoint + '.tmp', checkpoint)
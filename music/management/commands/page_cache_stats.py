@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from music import pagecache
+
+
+class Command(BaseCommand):
+    """
+    Show page cache hit ratio, used to size the page cache
+    """
+    help = 'Show full-page cache hits and misses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Reset counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = pagecache.stats()
+        total = stats['hits'] + stats['misses']
+        ratio = 100.0 * stats['hits'] / total if total else 0
+        self.stdout.write('hits: %d, misses: %d, hit ratio: %.1f%%' %
+                          (stats['hits'], stats['misses'], ratio))
+        if options['reset']:
+            pagecache.reset_stats()
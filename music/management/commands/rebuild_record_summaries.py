@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from music import summaries
+
+
+class Command(BaseCommand):
+    """
+    Rewrite the record summary read model from records, labels, bands,
+    genres and record aggregates
+    """
+    help = 'Rebuild summaries of all records'
+
+    def handle(self, *args, **options):
+        done = 0
+        for done in summaries.rebuild():
+            self.stdout.write('Rebuilt summaries of %d records' % done)
+        self.stdout.write('Done: %d records' % done)
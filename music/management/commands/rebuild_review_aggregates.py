@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from music.models import Record, RecordSummary, Review
+
+
+class Command(BaseCommand):
+    """
+    Recompute review count, score sum and score histogram of every record,
+    together with their copies in record summaries
+    """
+    help = 'Rebuild review aggregates of all records in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of records processed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(Record.objects.filter(pk__gt=last_id).order_by('pk').\
+                         values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            self.rebuild_batch(batch)
+            last_id = batch[-1]
+            total += len(batch)
+            self.stdout.write('Rebuilt aggregates of %d records' % total)
+
+    def rebuild_batch(self, record_ids):
+        """
+        Recompute aggregates of given records from one grouped query
+        """
+        empty = dict(('score_%d' % score, 0) for score in Record.SCORES)
+        empty.update(review_count=0, score_sum=0)
+        stats = dict((record_id, dict(empty)) for record_id in record_ids)
+        rows = Review.objects.filter(record_fk__in=record_ids).\
+                values('record_fk', 'score').annotate(n=Count('id')).order_by()
+        for row in rows:
+            record_stats = stats[row['record_fk']]
+            record_stats['review_count'] += row['n']
+            record_stats['score_sum'] += row['n'] * row['score']
+            if row['score'] in Record.SCORES:
+                record_stats['score_%d' % row['score']] += row['n']
+
+        # records with identical aggregates (mostly unreviewed ones) share
+        # a single UPDATE
+        groups = {}
+        for record_id, record_stats in stats.items():
+            key = tuple(sorted(record_stats.items()))
+            groups.setdefault(key, []).append(record_id)
+        with transaction.atomic():
+            for key, ids in groups.items():
+                record_stats = dict(key)
+                Record.objects.filter(pk__in=ids).update(**record_stats)
+                RecordSummary.objects.filter(record_id__in=ids).update(
+                    review_count=record_stats['review_count'],
+                    score_sum=record_stats['score_sum'])
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from music.models import Track, SearchDocument
+from music import search
+
+
+class Command(BaseCommand):
+    """
+    Recreate search documents of all catalogue objects
+    """
+    help = 'Rebuild full-text search documents in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of objects indexed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, kind in search.KINDS.items():
+            SearchDocument.objects.filter(kind=kind).exclude(
+                object_id__in=model.objects.values('pk')).delete()
+            queryset = model.objects.order_by('pk')
+            if model is Track:
+                queryset = queryset.select_related('record_fk')
+            last_id = 0
+            total = 0
+            while True:
+                batch = list(queryset.filter(pk__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+                with transaction.atomic():
+                    search.index_objects(model, batch)
+                last_id = batch[-1].pk
+                total += len(batch)
+            self.stdout.write('Indexed %d %s objects' % (total, kind))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from music.models import Record, RecordSummary, Track
+
+
+class Command(BaseCommand):
+    """
+    Recompute runtime and track count of every record, together with their
+    copies in record summaries
+    """
+    help = 'Rebuild track aggregates of all records in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of records processed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(Record.objects.filter(pk__gt=last_id).order_by('pk').\
+                         values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            self.rebuild_batch(batch)
+            last_id = batch[-1]
+            total += len(batch)
+            self.stdout.write('Rebuilt aggregates of %d records' % total)
+
+    def rebuild_batch(self, record_ids):
+        """
+        Recompute aggregates of given records from one grouped query
+        """
+        stats = dict((record_id, (0, 0)) for record_id in record_ids)
+        rows = Track.objects.filter(record_fk__in=record_ids).\
+                values('record_fk').annotate(runtime=Sum('length_seconds'),
+                                             n=Count('id')).order_by()
+        for row in rows:
+            stats[row['record_fk']] = (row['runtime'], row['n'])
+
+        # records with identical aggregates (mostly ones without tracks)
+        # share a single UPDATE
+        groups = {}
+        for record_id, key in stats.items():
+            groups.setdefault(key, []).append(record_id)
+        with transaction.atomic():
+            for (runtime, count), ids in groups.items():
+                Record.objects.filter(pk__in=ids).update(
+                    runtime_seconds=runtime, track_count=count)
+                RecordSummary.objects.filter(record_id__in=ids).update(
+                    runtime_seconds=runtime, track_count=count)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from music.models import RowCount
+from music.signals import COUNTED_MODELS
+
+
+class Command(BaseCommand):
+    """
+    Recount rows of counted models, e.g. after bulk inserts
+    """
+    help = 'Refresh row counts kept in RowCount table'
+
+    def handle(self, *args, **options):
+        for model in COUNTED_MODELS:
+            count = model.objects.count()
+            RowCount.objects.update_or_create(
+                table=model._meta.db_table, defaults={'count': count})
+            self.stdout.write('%s: %d' % (model._meta.db_table, count))
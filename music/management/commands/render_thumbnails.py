@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from music import thumbnails
+
+
+class Command(BaseCommand):
+    """
+    Render thumbnails of stored images in parallel worker processes. Images
+    saved with MUSIC_THUMBNAIL_WORKERS above 0 are left without thumbnails
+    until it runs, the worker process of the Procfile runs it with
+    --interval
+    """
+    help = 'Render thumbnails of images which have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Render thumbnails of every image again')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes, '
+                                 'MUSIC_THUMBNAIL_WORKERS by default, 0 '
+                                 'renders in this process')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running, looking for new images '
+                                 'every that many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            self.render_pending(options)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def render_pending(self, options):
+        """
+        Render thumbnails of images which have none, or of all with --all
+        """
+        started = time.time()
+        jobs = []
+        for model, field_name in thumbnails.THUMBNAIL_FIELDS:
+            objects = model.objects.exclude(**{field_name: ''})
+            if not options['all']:
+                objects = objects.filter(**{field_name + '_thumbnails': ''})
+            names = sorted(set(objects.values_list(field_name, flat=True)))
+            for name in names:
+                job = thumbnails.render_job(name)
+                if job is not None:
+                    jobs.append((model, field_name, name, job))
+        workers = options['workers']
+        if workers is None:
+            workers = settings.MUSIC_THUMBNAIL_WORKERS
+        if not workers:
+            results = [self.run(thumbnails.render, job)
+                       for model, field_name, name, job in jobs]
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                futures = [executor.submit(thumbnails.render, *job)
+                           for model, field_name, name, job in jobs]
+                results = [self.run(future.result) for future in futures]
+        done = 0
+        for (model, field_name, name, job), suffixes in zip(jobs, results):
+            if suffixes is None:
+                self.stderr.write('Could not render %s' % name)
+                continue
+            thumbnails.finish(model, field_name, name, suffixes)
+            done += 1
+        self.stdout.write('Rendered thumbnails of %d images in %.1fs' %
+                          (done, time.time() - started))
+
+    def run(self, function, args=()):
+        """
+        Return result of function, None if the image could not be rendered
+        """
+        try:
+            return function(*args)
+        except (IOError, OSError, ValueError):
+            return None
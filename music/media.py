@@ -0,0 +1,136 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import condition, require_safe
+from music.storage import is_content_hashed
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def media_path(path):
+    """
+    Return file system path of a media file, Http404 if there is none
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+    if not os.path.isfile(full_path):
+        raise Http404('No such file')
+    return full_path
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) of a single byte range, end inclusive, None for
+    a missing or multiple range and ValueError for an unsatisfiable one
+    """
+    match = RANGE_RE.match(header or '')
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range: the last n bytes
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def etag(request, path):
+    # content-hashed names are their own validators, older uploads are
+    # told apart by modification time and size
+    full_path = media_path(path)
+    if is_content_hashed(path):
+        return os.path.basename(path)
+    stat = os.stat(full_path)
+    return '%x-%x' % (int(stat.st_mtime), stat.st_size)
+
+
+@require_safe
+@condition(etag_func=etag)
+def serve(request, path):
+    """
+    Serve a media file, cached forever if its name is its content hash.
+    With MUSIC_MEDIA_ACCEL the transfer is handed to the front server
+    (X-Accel-Redirect for nginx, X-Sendfile otherwise); Django streams
+    the file through wsgi.file_wrapper, which WSGI servers like gunicorn
+    send with sendfile(). Single byte ranges are honoured
+    """
+    full_path = media_path(path)
+    stat = os.stat(full_path)
+    content_type = mimetypes.guess_type(full_path)[0] or \
+            'application/octet-stream'
+    accel = settings.MUSIC_MEDIA_ACCEL
+    if accel:
+        response = HttpResponse(content_type=content_type)
+        if accel == 'nginx':
+            response['X-Accel-Redirect'] = \
+                    settings.MUSIC_MEDIA_ACCEL_PREFIX + path
+        else:
+            response['X-Sendfile'] = full_path
+    else:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'),
+                                     stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % stat.st_size
+            return response
+        stream = open(full_path, 'rb')
+        if byte_range is None:
+            response = FileResponse(stream, content_type=content_type)
+            response['Content-Length'] = stat.st_size
+        else:
+            start, end = byte_range
+            stream.seek(start)
+            response = FileResponse(RangeFile(stream, end - start + 1),
+                                    content_type=content_type, status=206)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end,
+                                                            stat.st_size)
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if is_content_hashed(path):
+        response['Cache-Control'] = 'public, max-age=%d, immutable' % \
+                settings.MUSIC_MEDIA_MAX_AGE
+    else:
+        response['Cache-Control'] = 'public, max-age=%d' % \
+                settings.MUSIC_MEDIA_UNHASHED_MAX_AGE
+    return response
+
+
+class RangeFile(object):
+    """
+    File object reading at most length bytes from the current position.
+    Keeps fileno so that the WSGI server can still send it with sendfile()
+    limited by Content-Length
+    """
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    def close(self):
+        self.stream.close()
@@ -0,0 +1,107 @@
+import mimetypes
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+
+
+def accepted_encodings(header):
+    """
+    Return content codings accepted by an Accept-Encoding header
+    """
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q=') and quality[2:] in ('0', '0.0', '0.00',
+                                                        '0.000'):
+            continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFile(object):
+    """
+    Static file with its precompressed variants, as (path, size) by
+    content coding, None standing for the file itself
+    """
+    def __init__(self, name, immutable):
+        self.content_type = mimetypes.guess_type(name)[0] or \
+                'application/octet-stream'
+        self.immutable = immutable
+        self.variants = {}
+        path = staticfiles_storage.path(name)
+        for encoding, suffix in [(None, '')] + [
+                (encoding, suffix) for encoding, suffix, compress in
+                getattr(staticfiles_storage, 'encodings', [])]:
+            if os.path.isfile(path + suffix):
+                self.variants[encoding] = (path + suffix,
+                                           os.path.getsize(path + suffix))
+
+
+class StaticFilesMiddleware(object):
+    """
+    Serve files collected by CompressedManifestStaticFilesStorage. Every
+    file listed in the manifest is looked up once, on the first request;
+    afterwards requests go straight to open() of the best variant the
+    client accepts. Hashed names are cached forever as immutable
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.files = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Index static files of the manifest by URL path
+        """
+        hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+        hashed_names = set(hashed_files.values())
+        files = {}
+        for name in set(hashed_files) | hashed_names:
+            static_file = StaticFile(name, name in hashed_names)
+            if None in static_file.variants:
+                files[settings.STATIC_URL + name] = static_file
+        return files
+
+    def get_files(self):
+        with self.lock:
+            if self.files is None:
+                self.files = self.load()
+            return self.files
+
+    def __call__(self, request):
+        static_file = None
+        if request.method in ('GET', 'HEAD') and \
+                request.path_info.startswith(settings.STATIC_URL):
+            static_file = self.get_files().get(request.path_info)
+        if static_file is None:
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    def serve(self, request, static_file):
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING'))
+        encoding = None
+        for candidate in ('br', 'gzip'):
+            if candidate in accepted and candidate in static_file.variants:
+                encoding = candidate
+                break
+        path, size = static_file.variants[encoding]
+        response = FileResponse(open(path, 'rb'),
+                                content_type=static_file.content_type)
+        response['Content-Length'] = size
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if len(static_file.variants) > 1:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        if static_file.immutable:
+            response['Cache-Control'] = 'public, max-age=%d, immutable' % \
+                    settings.MUSIC_STATIC_MAX_AGE
+        else:
+            response['Cache-Control'] = 'public, max-age=%d' % \
+                    settings.MUSIC_STATIC_UNHASHED_MAX_AGE
+        return response
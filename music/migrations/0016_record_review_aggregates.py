@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_review_aggregates(apps, schema_editor):
+    Record = apps.get_model('music', 'Record')
+    Review = apps.get_model('music', 'Review')
+    stats = {}
+    for row in Review.objects.values('record_fk', 'score').\
+            annotate(n=Count('id')).order_by():
+        record_stats = stats.setdefault(row['record_fk'],
+                                        {'review_count': 0, 'score_sum': 0})
+        record_stats['review_count'] += row['n']
+        record_stats['score_sum'] += row['n'] * row['score']
+        if 0 <= row['score'] <= 5:
+            record_stats['score_%d' % row['score']] = row['n']
+    for record_id, record_stats in stats.items():
+        Record.objects.filter(pk=record_id).update(**record_stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0015_label_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_0',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_1',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_2',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_3',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_4',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_5',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_review_aggregates,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:25
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('music', '0016_record_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='record',
+            name='release_date',
+            field=models.DateField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='record',
+            name='title',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AlterIndexTogether(
+            name='ownedrecord',
+            index_together=set([('user_fk', 'purchase_date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='review',
+            index_together=set([('record_fk', 'create_by'), ('record_fk', 'modify_date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='track',
+            index_together=set([('record_fk', 'number')]),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0017_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='record',
+            name='title',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterIndexTogether(
+            name='band',
+            index_together=set([('name', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='genre',
+            index_together=set([('name', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='label',
+            index_together=set([('name', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='record',
+            index_together=set([('title', 'id')]),
+        ),
+    ]
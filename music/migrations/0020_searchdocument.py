@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+POSTGRESQL_FORWARD = [
+    'ALTER TABLE music_searchdocument ADD COLUMN search_vector tsvector',
+    'CREATE INDEX music_searchdocument_vector_gin '
+    'ON music_searchdocument USING GIN (search_vector)',
+    """
+    CREATE FUNCTION music_searchdocument_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.body, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    'CREATE TRIGGER music_searchdocument_vector_update '
+    'BEFORE INSERT OR UPDATE ON music_searchdocument '
+    'FOR EACH ROW EXECUTE PROCEDURE music_searchdocument_vector()',
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP TRIGGER music_searchdocument_vector_update ON music_searchdocument',
+    'DROP FUNCTION music_searchdocument_vector()',
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE music_searchdocument_fts USING fts5("
+    "title, body, content='music_searchdocument', content_rowid='id')",
+    "CREATE TRIGGER music_searchdocument_fts_insert AFTER INSERT "
+    "ON music_searchdocument BEGIN "
+    "INSERT INTO music_searchdocument_fts(rowid, title, body) "
+    "VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER music_searchdocument_fts_delete AFTER DELETE "
+    "ON music_searchdocument BEGIN "
+    "INSERT INTO music_searchdocument_fts(music_searchdocument_fts, rowid, "
+    "title, body) VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER music_searchdocument_fts_update AFTER UPDATE "
+    "ON music_searchdocument BEGIN "
+    "INSERT INTO music_searchdocument_fts(music_searchdocument_fts, rowid, "
+    "title, body) VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO music_searchdocument_fts(rowid, title, body) "
+    "VALUES (new.id, new.title, new.body); END",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER music_searchdocument_fts_insert',
+    'DROP TRIGGER music_searchdocument_fts_delete',
+    'DROP TRIGGER music_searchdocument_fts_update',
+    'DROP TABLE music_searchdocument_fts',
+]
+
+
+def run_vendor_sql(statements):
+    """
+    Return migration function executing statements for the current vendor
+    """
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0019_rowcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('band', 'Band'), ('record', 'Record'), ('track', 'Track'), ('label', 'Label'), ('genre', 'Genre')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField(blank=True)),
+                ('slug', models.SlugField(allow_unicode=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchdocument',
+            unique_together=set([('kind', 'object_id')]),
+        ),
+        migrations.RunPython(
+            run_vendor_sql({'postgresql': POSTGRESQL_FORWARD,
+                            'sqlite': SQLITE_FORWARD}),
+            run_vendor_sql({'postgresql': POSTGRESQL_BACKWARD,
+                            'sqlite': SQLITE_BACKWARD})),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:43
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('music', '0020_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewReaction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_date', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='review',
+            index_together=set([('record_fk', 'like_counter'), ('record_fk', 'modify_date'), ('record_fk', 'create_by')]),
+        ),
+        migrations.AddField(
+            model_name='reviewreaction',
+            name='review_fk',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='music.Review'),
+        ),
+        migrations.AddField(
+            model_name='reviewreaction',
+            name='user_fk',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='reviewreaction',
+            unique_together=set([('review_fk', 'user_fk')]),
+        ),
+    ]
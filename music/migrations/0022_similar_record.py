@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0021_review_reaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('modify_date', models.DateTimeField(auto_now=True)),
+                ('record_fk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_set', to='music.Record')),
+                ('similar_fk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='music.Record')),
+            ],
+            options={
+                'ordering': ['-score'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='similarrecord',
+            unique_together=set([('record_fk', 'similar_fk')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='similarrecord',
+            index_together=set([('record_fk', 'score')]),
+        ),
+    ]
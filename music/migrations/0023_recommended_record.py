@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:50
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('music', '0022_similar_record'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendedRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('modify_date', models.DateTimeField(auto_now=True)),
+                ('record_fk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='music.Record')),
+                ('user_fk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_set', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-score'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='recommendedrecord',
+            unique_together=set([('user_fk', 'record_fk')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='recommendedrecord',
+            index_together=set([('user_fk', 'score')]),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_track_seconds(apps, schema_editor):
+    Record = apps.get_model('music', 'Record')
+    Track = apps.get_model('music', 'Track')
+    # one UPDATE per distinct length rather than per track
+    for length in Track.objects.values_list('length', flat=True).\
+            distinct().order_by():
+        seconds = length.hour * 3600 + length.minute * 60 + length.second
+        Track.objects.filter(length=length).update(length_seconds=seconds)
+    for row in Track.objects.values('record_fk').annotate(
+            runtime=Sum('length_seconds'), n=Count('id')).order_by():
+        Record.objects.filter(pk=row['record_fk']).update(
+            runtime_seconds=row['runtime'], track_count=row['n'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0023_recommended_record'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='runtime_seconds',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='track_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='length_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_track_seconds,
+                             migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='track',
+            name='length',
+        ),
+        migrations.AlterIndexTogether(
+            name='record',
+            index_together=set([('runtime_seconds', 'id'), ('title', 'id')]),
+        ),
+    ]
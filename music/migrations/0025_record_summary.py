@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_record_summaries(apps, schema_editor):
+    Record = apps.get_model('music', 'Record')
+    RecordSummary = apps.get_model('music', 'RecordSummary')
+    records = Record.objects.select_related('label_fk').\
+            prefetch_related('bands', 'genres')
+    RecordSummary.objects.bulk_create(
+        [RecordSummary(
+            record_id=record.pk, title=record.title, slug=record.slug,
+            release_date=record.release_date,
+            label_name=record.label_fk.name,
+            band_names=', '.join(sorted(b.name for b in record.bands.all())),
+            genre_names=', '.join(sorted(g.name
+                                         for g in record.genres.all())),
+            review_count=record.review_count, score_sum=record.score_sum,
+            runtime_seconds=record.runtime_seconds,
+            track_count=record.track_count) for record in records],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0024_track_length_seconds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordSummary',
+            fields=[
+                ('record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='music.Record')),
+                ('title', models.CharField(max_length=200)),
+                ('slug', models.SlugField(allow_unicode=True)),
+                ('release_date', models.DateField(db_index=True)),
+                ('label_name', models.CharField(max_length=200)),
+                ('band_names', models.TextField(blank=True)),
+                ('genre_names', models.TextField(blank=True)),
+                ('review_count', models.IntegerField(default=0)),
+                ('score_sum', models.IntegerField(default=0)),
+                ('runtime_seconds', models.IntegerField(default=0)),
+                ('track_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-release_date'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='recordsummary',
+            index_together=set([('runtime_seconds', 'record'), ('title', 'record')]),
+        ),
+        migrations.RunPython(fill_record_summaries,
+                             migrations.RunPython.noop),
+    ]
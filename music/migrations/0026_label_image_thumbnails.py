@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0025_record_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='label',
+            name='image_thumbnails',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:15
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0026_label_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='track',
+            name='length_seconds',
+            field=models.PositiveIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(86399)]),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:24
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('music', '0027_track_length_max'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='review',
+            index_together=set([('record_fk', 'like_counter', 'id'), ('record_fk', 'create_by'), ('record_fk', 'modify_date')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0028_review_likes_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='similar_date',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
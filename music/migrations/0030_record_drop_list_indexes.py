@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:52
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0029_record_similar_date'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='record',
+            index_together=set([]),
+        ),
+    ]
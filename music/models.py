@@ -1,8 +1,42 @@
-from django.db import models
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.validators import MaxValueValidator
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import ExtractYear
 from django.utils import timezone
+from django.utils.dateparse import parse_time
 from django.contrib.auth.models import User
 from django.utils.text import slugify
-from django.db.models import Avg
+from django.urls import reverse
+
+
+def to_seconds(value):
+    """
+    Return number of seconds of a duration given as seconds, time,
+    timedelta or 'HH:MM[:SS]' string
+    """
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds())
+    if isinstance(value, str):
+        parsed = parse_time(value)
+        if parsed is None:
+            raise ValueError('Invalid duration: %r' % value)
+        value = parsed
+    if isinstance(value, datetime.time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    return int(value)
+
+
+# Longest track length, lengths are read back as time of day
+MAX_TRACK_SECONDS = 24 * 3600 - 1
+
+
+def seconds_to_time(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return datetime.time(hours, minutes, seconds)
 
 
 class Band(models.Model):
@@ -31,6 +65,7 @@ class Band(models.Model):
 
     class Meta:
         ordering = ['name']
+        index_together = [('name', 'id')]
 
 
 class Label(models.Model):
@@ -54,6 +89,9 @@ class Label(models.Model):
     modify_date = models.DateTimeField(auto_now=True)
     slug = models.SlugField(max_length=50, allow_unicode=True)
     image = models.ImageField(upload_to = 'labels', blank=True)
+    # suffixes of rendered thumbnails, see music.thumbnails
+    image_thumbnails = models.CharField(max_length=200, blank=True,
+                                        editable=False)
 
 
     def save(self, *args, **kwargs):
@@ -73,6 +111,7 @@ class Label(models.Model):
 
     class Meta:
         ordering = ['name']
+        index_together = [('name', 'id')]
 
 
 class Genre(models.Model):
@@ -114,6 +153,39 @@ class Genre(models.Model):
 
     class Meta:
         ordering = ['name']
+        index_together = [('name', 'id')]
+
+
+class RuntimeQuerySet(models.QuerySet):
+    """
+    Queries of models with a runtime_seconds column
+    """
+    def runtime_between(self, params):
+        """
+        Filter records by min_runtime and max_runtime (in seconds) of
+        request parameters, invalid values are ignored
+        """
+        queryset = self
+        for param, lookup in (('min_runtime', 'gte'), ('max_runtime', 'lte')):
+            try:
+                value = int(params[param])
+            except (KeyError, ValueError):
+                continue
+            queryset = queryset.filter(**{'runtime_seconds__' + lookup: value})
+        return queryset
+
+
+class RecordQuerySet(RuntimeQuerySet):
+    """
+    Reusable record queries
+    """
+    def other_records_of(self, record):
+        """
+        Return distinct records sharing at least one band with given record,
+        latest first
+        """
+        return self.filter(bands__record=record).exclude(pk=record.pk).\
+                distinct().order_by('-release_date', '-pk')
 
 
 class Record(models.Model):
@@ -123,11 +195,23 @@ class Record(models.Model):
     def __str__(self):
         return self.title
 
+    # Scores accepted by ReviewForm, one histogram column per score
+    SCORES = range(0, 6)
+
+    # Sort keys of record lists selectable with ?ordering=
+    LIST_ORDERINGS = {
+        'title': ('title', 'pk'),
+        'runtime': ('runtime_seconds', 'pk'),
+        '-runtime': ('-runtime_seconds', '-pk'),
+    }
+
+    objects = RecordQuerySet.as_manager()
+
     bands = models.ManyToManyField(Band)
     title = models.CharField(max_length=200)
     label_fk= models.ForeignKey(Label, on_delete=models.CASCADE)
     genres= models.ManyToManyField(Genre)
-    release_date = models.DateField()
+    release_date = models.DateField(db_index=True)
     create_by = models.ForeignKey(User, default = 1,
                                   on_delete=models.CASCADE,
                                  related_name='record_create_by')
@@ -138,21 +222,56 @@ class Record(models.Model):
     modify_date = models.DateTimeField(auto_now=True)
     slug = models.SlugField(max_length=50, allow_unicode=True)
 
+    # Review aggregates, maintained by music.signals on every review change
+    review_count = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+    score_0 = models.IntegerField(default=0)
+    score_1 = models.IntegerField(default=0)
+    score_2 = models.IntegerField(default=0)
+    score_3 = models.IntegerField(default=0)
+    score_4 = models.IntegerField(default=0)
+    score_5 = models.IntegerField(default=0)
+
+    # Track aggregates, maintained by music.signals on every track change
+    runtime_seconds = models.IntegerField(default=0)
+    track_count = models.IntegerField(default=0)
+
+    # When similar records were last computed, by music.similarity
+    similar_date = models.DateTimeField(null=True, editable=False)
+
+    # Columns changed by music.signals and batch jobs with UPDATEs only
+    AGGREGATE_FIELDS = ('review_count', 'score_sum', 'score_0', 'score_1',
+                        'score_2', 'score_3', 'score_4', 'score_5',
+                        'runtime_seconds', 'track_count', 'similar_date')
+
     def save(self, *args, **kwargs):
         if not self.id:
             self.slug = slugify(self.title)
+        if not self._state.adding and 'update_fields' not in kwargs:
+            # writing back loaded aggregates would undo reviews and tracks
+            # saved since the record was loaded
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in self.AGGREGATE_FIELDS]
         super(Record, self).save(*args, **kwargs)
 
     def get_avg_score(self):
         """
         Return average score of an album or '-' if there are no reviews
         """
-        avg_score = self.review_set.all().aggregate(Avg('score'))['score__avg']
-        if avg_score:
-            return str(round(float(avg_score),2))
+        if self.review_count:
+            return round(float(self.score_sum) / self.review_count, 2)
         else:
             return '-'
 
+    def get_score_distribution(self):
+        """
+        Return a list of (score, number of reviews) pairs for every score
+        """
+        return [(score, getattr(self, 'score_%d' % score))
+                for score in self.SCORES]
+
     def get_related_tracks(self):
         """
         return a list of tracks from the record
@@ -165,7 +284,8 @@ class Record(models.Model):
         """
         try:
             if user.is_authenticated():
-                return self.review_set.get(create_by = user)
+                return self.review_set.select_related('create_by').\
+                        get(create_by = user)
             else:
                 return None
         except Review.DoesNotExist:
@@ -173,25 +293,37 @@ class Record(models.Model):
         except:
             return None
 
-    def get_related_reviews(self, user):
+    def get_related_reviews(self, user, by_likes=False, limit=10):
         """
-        Return list of 10 latest reviews written by other users
+        Return list of 10 (or limit) latest or most liked reviews written by
+        other users
         """
+        reviews = self.review_set.select_related('create_by')
+        if by_likes:
+            reviews = reviews.order_by('-like_counter', '-pk')
         if user.is_authenticated():
-            return self.review_set.all().exclude(create_by=user)[0:10]
+            return reviews.exclude(create_by=user)[0:limit]
         else:
-            return self.review_set.all()[0:10]
+            return reviews[0:limit]
+
+    def get_similar_records(self, limit=None):
+        """
+        Return a list of records most similar to this one, precomputed by
+        compute_similar_records, MUSIC_SIMILAR_RECORDS_LIMIT (10) by default
+        """
+        if limit is None:
+            limit = settings.MUSIC_SIMILAR_RECORDS_LIMIT
+        return [similar.similar_fk for similar in
+                self.similar_set.select_related('similar_fk')[0:limit]]
 
-    def get_bands_other_records(self):
+    def get_bands_other_records(self, limit=None):
         """
-        Return a list of 10 latest other records of bands responsible for
-        current record
+        Return a list of latest other records of bands responsible for
+        current record, MUSIC_OTHER_RECORDS_LIMIT (10) by default
         """
-        record_list = []
-        for band in self.bands.all():
-            for record in band.record_set.exclude(id = self.id):
-                record_list.append(record)
-        return record_list
+        if limit is None:
+            limit = settings.MUSIC_OTHER_RECORDS_LIMIT
+        return list(Record.objects.other_records_of(self)[0:limit])
 
 
     class Meta:
@@ -209,7 +341,9 @@ class Track(models.Model):
     record_fk = models.ForeignKey(Record, on_delete=models.CASCADE)
     name =  models.CharField(max_length=200)
     number = models.IntegerField(default=0)
-    length = models.TimeField()
+    # Summed into Record.runtime_seconds by music.signals
+    length_seconds = models.PositiveIntegerField(
+        default=0, validators=[MaxValueValidator(MAX_TRACK_SECONDS)])
     feat = models.ManyToManyField(Band, blank=True)
     create_by = models.ForeignKey(User, default = 1,
                                   on_delete=models.CASCADE,
@@ -221,12 +355,24 @@ class Track(models.Model):
     modify_date = models.DateTimeField(auto_now=True)
     slug = models.SlugField(max_length=50, allow_unicode=True)
 
+    @property
+    def length(self):
+        """
+        Return track length as time of day, tracks are shorter than a day
+        """
+        return seconds_to_time(self.length_seconds)
+
+    @length.setter
+    def length(self, value):
+        self.length_seconds = to_seconds(value)
+
     def save(self, *args, **kwargs):
         if not self.id:
             self.slug = slugify(self.name)
         super(Track, self).save(*args, **kwargs)
     class Meta:
         ordering = ['number']
+        index_together = [('record_fk', 'number')]
 
 
 class OwnedRecord(models.Model):
@@ -245,18 +391,80 @@ class OwnedRecord(models.Model):
     disc_type = models.CharField(max_length=10, choices=disc_type_choice)
     user_fk = models.ForeignKey(User, default=1, on_delete=models.CASCADE)
 
-    def get_recent_records(self, user):
+    @classmethod
+    def get_recent_records(cls, user):
         """
         Return a list of 10 latest bought records by current user
         """
         if user.is_authenticated():
             return OwnedRecord.objects.filter(purchase_date__lte=\
-                            timezone.now()).filter(user_fk = user)[0:10]
+                            timezone.now()).filter(user_fk = user).\
+                    select_related('record_fk')[0:10]
         else:
             return []
 
+    @staticmethod
+    def collection_stats_key(user_id):
+        return 'collection_stats:%d' % user_id
+
+    @classmethod
+    def get_collection_stats(cls, user):
+        """
+        Return statistics of user's collection, None for anonymous users.
+        Cached until user's owned records change, see music.signals
+        """
+        if not user.is_authenticated():
+            return None
+        key = cls.collection_stats_key(user.pk)
+        stats = cache.get(key)
+        if stats is None:
+            stats = cls.compute_collection_stats(user)
+            cache.set(key, stats, settings.MUSIC_COLLECTION_STATS_TIMEOUT)
+        return stats
+
+    @classmethod
+    def compute_collection_stats(cls, user):
+        """
+        Compute collection statistics with four aggregate queries: owned
+        records by purchase year and disc type, by genre, by label, and
+        total runtime of owned records
+        """
+        owned = cls.objects.filter(user_fk=user).order_by()
+        disc_types = dict((key, 0) for key, label in cls.disc_type_choice)
+        years = {}
+        for row in owned.annotate(year=ExtractYear('purchase_date')).\
+                values('year', 'disc_type').annotate(count=models.Count('pk')):
+            disc_types[row['disc_type']] = \
+                    disc_types.get(row['disc_type'], 0) + row['count']
+            years[row['year']] = years.get(row['year'], 0) + row['count']
+        disc_labels = dict(cls.disc_type_choice)
+        playing_time = Record.objects.filter(
+            pk__in=owned.values('record_fk')).aggregate(
+                total=models.Sum('runtime_seconds'))['total'] or 0
+        return {
+            'records': sum(disc_types.values()),
+            'disc_types': [(disc_labels.get(key, key), count)
+                           for key, count in sorted(disc_types.items())],
+            'years': sorted(years.items()),
+            'genres': cls.breakdown(owned, 'record_fk__genres__name'),
+            'labels': cls.breakdown(owned, 'record_fk__label_fk__name'),
+            'playing_time': datetime.timedelta(seconds=playing_time),
+        }
+
+    @staticmethod
+    def breakdown(owned, field):
+        """
+        Return (name, number of owned records) pairs grouped by field, most
+        frequent first
+        """
+        return [(name, count) for name, count in owned.exclude(
+            **{field + '__isnull': True}).values(field).annotate(
+                count=models.Count('pk')).order_by('-count', field).
+                values_list(field, 'count')]
+
     class Meta:
         ordering = ['-purchase_date']
+        index_together = [('user_fk', 'purchase_date')]
 
 
 class Review(models.Model):
@@ -286,9 +494,229 @@ class Review(models.Model):
     def save(self, *args, **kwargs):
         if not self.id:
             self.slug = slugify(self.review_text[0:50])
+        if not self._state.adding and 'update_fields' not in kwargs:
+            # like_counter is changed by add_likes only, writing back the
+            # loaded value would lose concurrent likes
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'like_counter']
         super(Review, self).save(*args, **kwargs)
+
+    def like(self, user):
+        """
+        Add like of user, return False if the user already liked it. The
+        reaction and the counter are written in one transaction
+        """
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    ReviewReaction.objects.create(review_fk=self,
+                                                  user_fk=user)
+            except IntegrityError:
+                return False
+            self.add_likes(1)
+        return True
+
+    def unlike(self, user):
+        """
+        Remove like of user, return False if there was none
+        """
+        with transaction.atomic():
+            deleted, rows = ReviewReaction.objects.filter(
+                review_fk=self, user_fk=user).delete()
+            if not deleted:
+                return False
+            self.add_likes(-1)
+        return True
+
+    def add_likes(self, step):
+        """
+        Change like counter with a single atomic UPDATE, concurrent likes
+        are never lost. The instance is not reloaded
+        """
+        Review.objects.filter(pk=self.pk).update(
+            like_counter=models.F('like_counter') + step)
+
     class Meta:
         ordering = ['-modify_date']
+        index_together = [
+            ('record_fk', 'create_by'),
+            ('record_fk', 'modify_date'),
+            ('record_fk', 'like_counter', 'id'),
+        ]
+
+
+class ReviewReaction(models.Model):
+    """
+    Like of a review by a user, each user can like a review once
+    """
+    def __str__(self):
+        return self.user_fk.username + ' likes ' + str(self.review_fk_id)
+
+    review_fk = models.ForeignKey(Review, on_delete=models.CASCADE)
+    user_fk = models.ForeignKey(User, on_delete=models.CASCADE)
+    create_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('review_fk', 'user_fk')]
 
 
 
+
+
+class SimilarRecord(models.Model):
+    """
+    Record similar to another one, top neighbours of every record are
+    computed in batch by music.similarity. Default sort score
+    """
+    def __str__(self):
+        return '%s ~ %s (%.3f)' % (self.record_fk_id, self.similar_fk_id,
+                                   self.score)
+
+    record_fk = models.ForeignKey(Record, on_delete=models.CASCADE,
+                                  related_name='similar_set')
+    similar_fk = models.ForeignKey(Record, on_delete=models.CASCADE,
+                                   related_name='similar_to')
+    score = models.FloatField()
+    modify_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-score']
+        unique_together = [('record_fk', 'similar_fk')]
+        index_together = [('record_fk', 'score')]
+
+
+class RecommendedRecord(models.Model):
+    """
+    Record recommended to user from review scores, computed in batch by
+    music.recommendations. Default sort -score
+    """
+    def __str__(self):
+        return '%s -> %s (%.3f)' % (self.user_fk_id, self.record_fk_id,
+                                    self.score)
+
+    user_fk = models.ForeignKey(User, on_delete=models.CASCADE,
+                                related_name='recommended_set')
+    record_fk = models.ForeignKey(Record, on_delete=models.CASCADE)
+    # predicted review score
+    score = models.FloatField()
+    modify_date = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def for_user(cls, user, limit=None):
+        """
+        Return best recommended records of user, [] for anonymous users
+        """
+        if not user.is_authenticated():
+            return []
+        limit = limit or settings.MUSIC_RECOMMENDATIONS_LIMIT
+        return cls.objects.filter(user_fk=user).\
+                select_related('record_fk')[0:limit]
+
+    class Meta:
+        ordering = ['-score']
+        unique_together = [('user_fk', 'record_fk')]
+        index_together = [('user_fk', 'score')]
+
+
+class RecordSummary(models.Model):
+    """
+    Read model of record lists: one row per record with label, band and
+    genre names joined in, kept current by music.signals and rebuilt by
+    music.summaries. Default sort -release_date
+    """
+    def __str__(self):
+        return self.title
+
+    objects = RuntimeQuerySet.as_manager()
+
+    record = models.OneToOneField(Record, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='summary')
+    title = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=50, allow_unicode=True)
+    release_date = models.DateField(db_index=True)
+    label_name = models.CharField(max_length=200)
+    # comma-joined names in alphabetical order
+    band_names = models.TextField(blank=True)
+    genre_names = models.TextField(blank=True)
+    # copies of Record aggregates, updated together with them
+    review_count = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+    runtime_seconds = models.IntegerField(default=0)
+    track_count = models.IntegerField(default=0)
+
+    def get_avg_score(self):
+        """
+        Return average score of an album or '-' if there are no reviews
+        """
+        if self.review_count:
+            return round(float(self.score_sum) / self.review_count, 2)
+        return '-'
+
+    class Meta:
+        ordering = ['-release_date']
+        index_together = [('title', 'record'), ('runtime_seconds', 'record')]
+
+
+class RowCount(models.Model):
+    """
+    Model keeping number of rows of a table, maintained by music.signals on
+    every insert and delete of counted models
+    """
+    def __str__(self):
+        return self.table + ': ' + str(self.count)
+
+    table = models.CharField(max_length=100, unique=True)
+    count = models.BigIntegerField(default=0)
+
+    @classmethod
+    def get_count(cls, model):
+        """
+        Return number of rows of model's table, counting it on first use
+        """
+        table = model._meta.db_table
+        try:
+            return cls.objects.get(table=table).count
+        except cls.DoesNotExist:
+            row, created = cls.objects.get_or_create(
+                table=table, defaults={'count': model.objects.count()})
+            return row.count
+
+    @classmethod
+    def add(cls, model, step):
+        """
+        Atomically add step to row count of model's table
+        """
+        cls.objects.filter(table=model._meta.db_table).\
+                update(count=models.F('count') + step)
+
+
+class SearchDocument(models.Model):
+    """
+    Model implementing searchable text of a catalogue object, kept current
+    by music.signals. Full-text index lives outside of the ORM: a tsvector
+    column with GIN index on PostgreSQL, an FTS5 table on SQLite
+    """
+    def __str__(self):
+        return self.kind + ': ' + self.title
+
+    kind_choice = (
+        ('band', 'Band'),
+        ('record', 'Record'),
+        ('track', 'Track'),
+        ('label', 'Label'),
+        ('genre', 'Genre'),
+    )
+    kind = models.CharField(max_length=10, choices=kind_choice)
+    object_id = models.IntegerField()
+    title = models.CharField(max_length=200)
+    body = models.TextField(blank=True)
+    # slug of the page showing the object, record's slug for tracks
+    slug = models.SlugField(max_length=50, allow_unicode=True)
+
+    def get_absolute_url(self):
+        view_name = 'record' if self.kind == 'track' else self.kind
+        return reverse('music:' + view_name, args=(self.slug,))
+
+    class Meta:
+        unique_together = [('kind', 'object_id')]
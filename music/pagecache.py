@@ -0,0 +1,295 @@
+import collections
+import hashlib
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.urls import reverse
+
+
+def get_cache():
+    return caches[settings.MUSIC_PAGE_CACHE_ALIAS]
+
+
+# Versions of invalidated tags are kept in one table under one key, so
+# that a cached page is checked with a single read whatever its tags
+TAGS_KEY = 'pagecache:tags'
+# The table is started anew, which invalidates every page, once it holds
+# that many tags
+MAX_TAGS = 1000
+
+
+def new_table():
+    # random epoch, so that pages stored against an evicted table can't
+    # match the next one
+    return {'epoch': random.randint(0, 2 ** 30), 'generation': 0,
+            'versions': {}}
+
+
+def get_tags():
+    """
+    Return the tag table: epoch, generation bumped by every invalidation
+    and versions of invalidated tags. Tags not in the table are at version 0
+    """
+    cache = get_cache()
+    table = cache.get(TAGS_KEY)
+    if table is None:
+        cache.add(TAGS_KEY, new_table(), None)
+        table = cache.get(TAGS_KEY) or new_table()
+    return table
+
+
+def tag_versions(tags, table):
+    """
+    Return current version of every tag in table
+    """
+    return {tag: table['versions'].get(tag, 0) for tag in tags}
+
+
+def is_current(entry, table):
+    """
+    Tell whether no tag of a stored entry changed since it was stored
+    """
+    return entry['epoch'] == table['epoch'] and \
+            tag_versions(entry['versions'], table) == entry['versions']
+
+
+def generation(table=None):
+    """
+    Return number of the current generation of cached data, which changes
+    whenever any tag is invalidated
+    """
+    table = table or get_tags()
+    return table['epoch'], table['generation']
+
+
+def invalidate(*tags):
+    """
+    Bump versions of tags, invalidating every page tagged with any of them.
+    The table is written back as a whole, so it is read again to retry
+    when a concurrent invalidation overwrote it
+    """
+    cache = get_cache()
+    for attempt in range(3):
+        table = get_tags()
+        versions = dict(table['versions'])
+        for tag in tags:
+            versions[tag] = versions.get(tag, 0) + 1
+        if len(versions) > MAX_TAGS:
+            table = new_table()
+        else:
+            table = dict(table, versions=versions,
+                         generation=table['generation'] + 1)
+        cache.set(TAGS_KEY, table, None)
+        if cache.get(TAGS_KEY) == table:
+            return
+
+
+# Hits and misses counted by this process, written to the cache in one go
+# every MUSIC_PAGE_CACHE_STATS_EVERY requests
+local_counts = collections.Counter()
+counts_lock = threading.Lock()
+
+
+def count(name):
+    """
+    Increment hit or miss counter
+    """
+    with counts_lock:
+        local_counts[name] += 1
+        if sum(local_counts.values()) < settings.MUSIC_PAGE_CACHE_STATS_EVERY:
+            return
+        counts = dict(local_counts)
+        local_counts.clear()
+    flush_counts(counts)
+
+
+def flush_counts(counts):
+    cache = get_cache()
+    for name, value in counts.items():
+        key = 'pagecache:' + name
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.set(key, value, None)
+
+
+def stats():
+    """
+    Return numbers of page cache hits and misses, written ones and those
+    of this process yet to be written
+    """
+    cache = get_cache()
+    values = cache.get_many(['pagecache:hit', 'pagecache:miss'])
+    return {'hits': values.get('pagecache:hit', 0) + local_counts['hit'],
+            'misses': values.get('pagecache:miss', 0) +
+                      local_counts['miss']}
+
+
+def reset_stats():
+    with counts_lock:
+        local_counts.clear()
+    get_cache().delete_many(['pagecache:hit', 'pagecache:miss'])
+
+
+def page_key(request):
+    path = request.get_full_path().encode('utf-8')
+    return 'page:' + hashlib.md5(path).hexdigest()
+
+
+def is_cacheable(request, shared=False):
+    """
+    Only GET and HEAD requests are served from the page cache, those of
+    logged users only if the page is the same for everyone (shared)
+    """
+    return request.method in ('GET', 'HEAD') and \
+            (shared or not request.user.is_authenticated())
+
+
+# Placeholder of a per-user fragment in a shared page
+HOLE = '<!--hole:%s-->'
+
+
+def hole_markup(name, url):
+    """
+    Return markup standing for fragment name in a shared page: an edge side
+    include of url with MUSIC_PAGE_CACHE_ESI, otherwise a placeholder
+    filled in by the view
+    """
+    if settings.MUSIC_PAGE_CACHE_ESI:
+        return '<esi:include src="%s"/>' % url
+    return HOLE % name
+
+
+def fill_holes(content, fragments):
+    """
+    Replace placeholders in page content with rendered fragments
+    """
+    for name, fragment in fragments.items():
+        content = content.replace((HOLE % name).encode('utf-8'),
+                                  fragment.encode('utf-8'))
+    return content
+
+
+def get_entry(request):
+    """
+    Return stored entry for request if no tag of it changed since. The
+    entry is looked up once and kept on the request, read by conditional
+    GET validators first and by the page cache then
+    """
+    if not hasattr(request, 'page_cache_entry'):
+        entry = get_cache().get(page_key(request))
+        if entry is not None and not is_current(entry, get_tags()):
+            entry = None
+        request.page_cache_entry = entry
+    return request.page_cache_entry
+
+
+def get_validators(request):
+    """
+    Return validators stored with a valid cached page of request, if any
+    """
+    entry = get_entry(request)
+    return entry['validators'] if entry is not None else None
+
+
+def get_page(request):
+    """
+    Return cached response for request if no tag of it changed since
+    """
+    entry = get_entry(request)
+    if entry is None:
+        count('miss')
+        return None
+    count('hit')
+    response = HttpResponse(entry['content'],
+                            content_type=entry['content_type'])
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def store_page(request, response, tags, started):
+    """
+    Store rendered response tagged with model instances it depends on,
+    together with validators of conditional GET found on the request.
+    started is the generation read before the view queried its data; if
+    anything was invalidated since, the page may be stale and is not stored
+    """
+    table = get_tags()
+    if generation(table) != started:
+        return
+    entry = {'content': response.content,
+             'content_type': response['Content-Type'],
+             'epoch': table['epoch'],
+             'versions': tag_versions(tags, table),
+             'validators': getattr(request, 'resource_state', None)}
+    get_cache().set(page_key(request), entry,
+                    settings.MUSIC_PAGE_CACHE_TIMEOUT)
+
+
+class TaggedPageCacheMixin(object):
+    """
+    View mixin serving anonymous traffic from the page cache. Views return
+    the tags of their page, like 'record:42', from get_cache_tags.
+
+    Views listing per-user fragments in holes render them with the hole
+    template tag and return them from get_fragments; their shared page is
+    cached for logged users too and gets holes filled on every request
+    """
+    holes = ()
+    fragment_url_name = None
+
+    def get_cache_tags(self, context):
+        return []
+
+    def get_fragments(self, request):
+        """
+        Return dict of rendered per-user fragments by hole name
+        """
+        return {}
+
+    def get_fragment_url(self, name):
+        """
+        Return URL of a fragment, included by the edge in ESI mode. Views
+        with holes name the URL serving their fragments in
+        fragment_url_name, it gets the view's arguments and the hole name
+        """
+        if self.fragment_url_name is None:
+            raise ImproperlyConfigured(
+                '%s has holes but no fragment_url_name' %
+                type(self).__name__)
+        return reverse(self.fragment_url_name,
+                       kwargs=dict(self.kwargs, name=name))
+
+    def hole_markup(self, name):
+        return hole_markup(name, self.get_fragment_url(name))
+
+    def punch(self, request, response):
+        if self.holes and not settings.MUSIC_PAGE_CACHE_ESI:
+            response.content = fill_holes(response.content,
+                                          self.get_fragments(request))
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_cacheable(request, shared=bool(self.holes)):
+            return super(TaggedPageCacheMixin, self).dispatch(
+                request, *args, **kwargs)
+        response = get_page(request)
+        if response is not None:
+            # hit does not run the view, set what get_fragments may need
+            self.request, self.args, self.kwargs = request, args, kwargs
+            return self.punch(request, response)
+        started = generation()
+        response = super(TaggedPageCacheMixin, self).dispatch(
+            request, *args, **kwargs)
+        if response.status_code == 200 and hasattr(response, 'render'):
+            response.add_post_render_callback(
+                lambda response: store_page(
+                    request, response,
+                    self.get_cache_tags(response.context_data), started))
+            response.add_post_render_callback(
+                lambda response: self.punch(request, response))
+        return response
@@ -0,0 +1,280 @@
+import base64
+import hashlib
+import json
+import math
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator, Page, PageNotAnInteger, EmptyPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from music.models import RowCount
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage(object):
+    """
+    Page of objects read after (or before) an opaque cursor
+    """
+    # keyset pages are not numbered
+    number = None
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.cursor_for(self.object_list[-1])
+
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.cursor_for(self.object_list[0],
+                                             backwards=True)
+
+
+class KeysetPaginator(object):
+    """
+    Paginator seeking by the values of a unique sort key, e.g. (name, pk).
+    Every page costs the same index range scan, no matter how deep it is
+    """
+    def __init__(self, queryset, ordering, per_page):
+        directions = set(field.startswith('-') for field in ordering)
+        if len(directions) != 1:
+            raise ValueError('All ordering fields must use the same direction')
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in ordering)
+        self.descending = directions.pop()
+        self.per_page = per_page
+
+    def cursor_for(self, obj, backwards=False):
+        """
+        Return opaque cursor pointing right after (or before) given object.
+        The cursor carries its ordering, it is only valid for that ordering
+        """
+        values = [getattr(obj, field) for field in self.fields]
+        data = json.dumps({'k': values, 'b': backwards,
+                           'o': list(self.ordering)}, cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(
+                cursor.encode('ascii')).decode('utf-8'))
+            values, backwards = data['k'], bool(data['b'])
+            ordering = data['o']
+        except (ValueError, TypeError, KeyError, UnicodeError):
+            raise InvalidCursor(cursor)
+        if ordering != list(self.ordering):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        try:
+            values = [self.clean_value(field, value)
+                      for field, value in zip(self.fields, values)]
+        except (ValidationError, ValueError, TypeError):
+            raise InvalidCursor(cursor)
+        return values, backwards
+
+    def clean_value(self, name, value):
+        """
+        Return cursor value converted to the type of the sort field, tampered
+        values raise ValidationError, ValueError or TypeError
+        """
+        if isinstance(value, (list, dict)):
+            raise TypeError(value)
+        opts = self.queryset.model._meta
+        field = opts.pk if name == 'pk' else opts.get_field(name)
+        value = field.to_python(value)
+        field.get_prep_value(value)
+        return value
+
+    def seek(self, values, after):
+        """
+        Return condition selecting rows after (or before) the key values.
+        First field gets its own range so that the index can be used
+        """
+        forward = after != self.descending
+        strict = 'gt' if forward else 'lt'
+        condition = Q()
+        for position in reversed(range(len(self.fields))):
+            equal = dict(zip(self.fields[:position], values[:position]))
+            equal['%s__%s' % (self.fields[position], strict)] = \
+                    values[position]
+            condition |= Q(**equal)
+        bound = '%s__%s' % (self.fields[0], 'gte' if forward else 'lte')
+        return Q(**{bound: values[0]}) & condition
+
+    def page(self, cursor=None):
+        """
+        Return page following given cursor, first page for no cursor
+        """
+        if not cursor:
+            rows = list(self.queryset.order_by(*self.ordering)
+                        [0:self.per_page + 1])
+            return KeysetPage(rows[0:self.per_page], self,
+                              has_next=len(rows) > self.per_page,
+                              has_previous=False)
+        values, backwards = self.decode_cursor(cursor)
+        if backwards:
+            reverse = tuple(field[1:] if field.startswith('-') else
+                            '-' + field for field in self.ordering)
+            rows = list(self.queryset.filter(self.seek(values, after=False)).
+                        order_by(*reverse)[0:self.per_page + 1])
+            page_rows = rows[0:self.per_page]
+            page_rows.reverse()
+            return KeysetPage(page_rows, self, has_next=True,
+                              has_previous=len(rows) > self.per_page)
+        rows = list(self.queryset.filter(self.seek(values, after=True)).
+                    order_by(*self.ordering)[0:self.per_page + 1])
+        return KeysetPage(rows[0:self.per_page], self,
+                          has_next=len(rows) > self.per_page,
+                          has_previous=True)
+
+
+class ExactCount(object):
+    """
+    Count rows with COUNT(*) on every request
+    """
+    def count(self, queryset):
+        return queryset.count()
+
+
+class CachedCount(object):
+    """
+    Count rows with COUNT(*) and keep the result in cache for timeout seconds
+    """
+    def __init__(self, timeout=300):
+        self.timeout = timeout
+
+    def count(self, queryset):
+        sql = str(queryset.query).encode('utf-8')
+        key = 'count:%s:%s' % (queryset.model._meta.db_table,
+                               hashlib.md5(sql).hexdigest())
+        result = cache.get(key)
+        if result is None:
+            result = queryset.count()
+            cache.set(key, result, self.timeout)
+        return result
+
+
+def is_whole_table(queryset):
+    """
+    Check if queryset reads every row of its table
+    """
+    query = queryset.query
+    return not query.where and query.low_mark == 0 and \
+            query.high_mark is None and not query.distinct
+
+
+class CounterTableCount(object):
+    """
+    Read row count of the whole table from RowCount, which is updated on
+    every insert and delete. Filtered querysets are counted exactly
+    """
+    def count(self, queryset):
+        if not is_whole_table(queryset):
+            return queryset.count()
+        return RowCount.get_count(queryset.model)
+
+
+class EstimatedCount(object):
+    """
+    Use PostgreSQL planner estimate (pg_class.reltuples) of the table size.
+    Small tables, filtered querysets and other databases are counted exactly
+    """
+    def __init__(self, exact_below=10000):
+        self.exact_below = exact_below
+
+    def count(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or \
+                not is_whole_table(queryset):
+            return queryset.count()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] < self.exact_below:
+            return queryset.count()
+        return int(row[0])
+
+
+class CountStrategyPage(Page):
+    """
+    Page knowing from its own rows whether a next page exists, so that
+    approximate counts never hide existing objects
+    """
+    def __init__(self, object_list, number, paginator, has_more):
+        super(CountStrategyPage, self).__init__(object_list, number, paginator)
+        self.has_more = has_more
+
+    def has_next(self):
+        return self.has_more
+
+
+class CountStrategyPaginator(Paginator):
+    """
+    Paginator taking the total number of objects from a count strategy
+    """
+    def __init__(self, object_list, per_page, count_strategy=None, **kwargs):
+        super(CountStrategyPaginator, self).__init__(object_list, per_page,
+                                                     **kwargs)
+        self.count_strategy = count_strategy or ExactCount()
+
+    @cached_property
+    def count(self):
+        return self.count_strategy.count(self.object_list)
+
+    def validate_number(self, number):
+        """
+        Check that number is a page number. It is not compared with an
+        approximate count, page() checks that the page has rows instead
+        """
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        return CountStrategyPage(rows[0:self.per_page], number, self,
+                                 has_more=len(rows) > self.per_page)
+
+    def last_page(self):
+        """
+        Return last page with objects. Approximate counts may be too high,
+        so the number of pages is taken from an exact count
+        """
+        count = self.object_list.count()
+        return self.page(max(1, int(math.ceil(count / float(self.per_page)))))
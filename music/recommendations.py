@@ -0,0 +1,262 @@
+import time
+
+import numpy as np
+from scipy import sparse
+
+from music.models import Review, OwnedRecord, RecommendedRecord
+
+
+class Timer(object):
+    """
+    Collects durations of named steps for the timing report
+    """
+    def __init__(self):
+        self.steps = []
+        self.last = time.time()
+
+    def step(self, name):
+        now = time.time()
+        self.steps.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        return ['%-24s %8.3fs' % step for step in self.steps]
+
+
+class Ratings(object):
+    """
+    Sparse user x record matrix of review scores. users and records map
+    matrix rows and columns back to ids
+    """
+    def __init__(self, user_ids, record_ids, scores):
+        self.users, user_rows = np.unique(user_ids, return_inverse=True)
+        self.records, record_columns = np.unique(record_ids,
+                                                 return_inverse=True)
+        shape = (len(self.users), len(self.records))
+        total = sparse.csr_matrix((scores, (user_rows, record_columns)),
+                                  shape=shape)
+        count = sparse.csr_matrix((np.ones(len(scores)),
+                                   (user_rows, record_columns)), shape=shape)
+        # a user reviewing a record twice rates it with the mean score
+        total.data /= count.data
+        self.matrix = total
+
+    @classmethod
+    def from_reviews(cls):
+        rows = np.array(list(Review.objects.values_list(
+            'create_by', 'record_fk', 'score')), dtype=np.float64).\
+                reshape(-1, 3)
+        return cls(rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64),
+                   rows[:, 2])
+
+
+def gram_matrices(chunk, vectors):
+    """
+    Return the Gram matrix of the factor vectors of every row of a sparse
+    chunk, vectors holding those of its stored entries in order. Built one
+    factor at a time by summing entries into their rows, without the
+    per-rating outer products
+    """
+    factors = vectors.shape[1]
+    rows = sparse.csr_matrix(
+        (np.ones(chunk.nnz), np.arange(chunk.nnz), chunk.indptr),
+        shape=(chunk.shape[0], chunk.nnz))
+    gram = np.empty((chunk.shape[0], factors, factors))
+    for factor in range(factors):
+        gram[:, factor, :] = rows.dot(vectors * vectors[:, factor, None])
+    return gram
+
+
+def solve_side(ratings, other, regularization, chunk_size):
+    """
+    Return least squares factors of every row of sparse ratings given the
+    fixed factors of the other side (one ALS half step). Normal equations
+    are built and solved for chunk_size rows at a time, so memory is
+    bounded by the ratings of a chunk
+    """
+    factors = other.shape[1]
+    result = np.zeros((ratings.shape[0], factors))
+    identity = np.eye(factors)
+    for start in range(0, ratings.shape[0], chunk_size):
+        chunk = ratings[start:min(start + chunk_size, ratings.shape[0])]
+        counts = np.diff(chunk.indptr)
+        rated = counts > 0
+        if not rated.any():
+            continue
+        gram = gram_matrices(chunk, other[chunk.indices])[rated]
+        # regularization grows with the number of ratings (ALS-WR)
+        gram += regularization * counts[rated][:, None, None] * identity
+        targets = chunk.dot(other)[rated]
+        rows = np.flatnonzero(rated) + start
+        result[rows] = np.linalg.solve(gram, targets)
+    return result
+
+
+def factorize(ratings, factors=20, regularization=0.1, iterations=10,
+              chunk_size=1000, seed=0, timer=None):
+    """
+    Factorize a ratings matrix with alternating least squares on the
+    observed ratings. Return (user factors, record factors, mean)
+    """
+    mean = ratings.data.mean() if ratings.nnz else 0.0
+    centered = ratings.copy()
+    centered.data -= mean
+    by_record = centered.T.tocsr()
+    random = np.random.RandomState(seed)
+    records = random.normal(scale=0.1, size=(ratings.shape[1], factors))
+    users = np.zeros((ratings.shape[0], factors))
+    for iteration in range(iterations):
+        users = solve_side(centered, records, regularization, chunk_size)
+        records = solve_side(by_record, users, regularization, chunk_size)
+        if timer is not None:
+            timer.step('iteration %d' % (iteration + 1))
+    return users, records, mean
+
+
+def predict(users, records, mean, user_rows, record_columns):
+    """
+    Return predicted scores of (user row, record column) pairs
+    """
+    return mean + np.einsum('ij,ij->i', users[user_rows],
+                            records[record_columns])
+
+
+def top_unseen(users, records, mean, seen, count, chunk_size):
+    """
+    Yield (user row, record columns, scores) of count best scored records
+    each user has not seen, best first. Users and records are scored in
+    chunk_size blocks, keeping the best count records of every user of a
+    block, so memory does not grow with the catalogue
+    """
+    limit = min(count, records.shape[0])
+    if limit == 0:
+        return
+    for start in range(0, users.shape[0], chunk_size):
+        end = min(start + chunk_size, users.shape[0])
+        chunk_seen = seen[start:end].tocsc()
+        positions = np.arange(end - start)[:, None]
+        best_columns = np.zeros((end - start, 0), dtype=np.int64)
+        best_scores = np.zeros((end - start, 0))
+        for first in range(0, records.shape[0], chunk_size):
+            last = min(first + chunk_size, records.shape[0])
+            scores = mean + users[start:end].dot(records[first:last].T)
+            block_seen = chunk_seen[:, first:last].tocoo()
+            scores[block_seen.row, block_seen.col] = -np.inf
+            columns = np.concatenate(
+                [best_columns, np.repeat(np.arange(first, last)[None, :],
+                                         end - start, axis=0)], axis=1)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            if scores.shape[1] > limit:
+                keep = np.argpartition(-scores, limit - 1,
+                                       axis=1)[:, 0:limit]
+                columns = columns[positions, keep]
+                scores = scores[positions, keep]
+            best_columns, best_scores = columns, scores
+        for position in range(end - start):
+            columns = best_columns[position]
+            row_scores = best_scores[position]
+            order = np.argsort(-row_scores, kind='mergesort')
+            columns, row_scores = columns[order], row_scores[order]
+            keep = np.isfinite(row_scores)
+            yield start + position, columns[keep], row_scores[keep]
+
+
+def seen_matrix(ratings):
+    """
+    Return sparse matrix of records users reviewed or own, in the shape
+    of ratings
+    """
+    pairs = np.array(list(OwnedRecord.objects.values_list(
+        'user_fk', 'record_fk')), dtype=np.int64).reshape(-1, 2)
+    rows = np.searchsorted(ratings.users, pairs[:, 0])
+    columns = np.searchsorted(ratings.records, pairs[:, 1])
+    known = (rows < len(ratings.users)) & (columns < len(ratings.records))
+    known[known] &= (ratings.users[rows[known]] == pairs[known, 0]) & \
+            (ratings.records[columns[known]] == pairs[known, 1])
+    owned = sparse.csr_matrix(
+        (np.ones(known.sum()), (rows[known], columns[known])),
+        shape=ratings.matrix.shape)
+    # ones, as adding scores would drop reviews scored 0
+    reviewed = ratings.matrix.copy()
+    reviewed.data[:] = 1
+    return reviewed + owned
+
+
+def store(ratings, recommendations):
+    """
+    Replace stored recommendations of all users with new ones
+    """
+    objects = [RecommendedRecord(user_fk_id=int(ratings.users[row]),
+                                 record_fk_id=int(ratings.records[column]),
+                                 score=float(score))
+               for row, columns, scores in recommendations
+               for column, score in zip(columns, scores)]
+    RecommendedRecord.objects.all().delete()
+    RecommendedRecord.objects.bulk_create(objects, batch_size=1000)
+    return len(objects)
+
+
+def compute(factors, regularization, iterations, top_n, chunk_size,
+            timer=None):
+    """
+    Recompute recommended records of all users who reviewed something.
+    Return (ratings, number of recommendations stored)
+    """
+    timer = timer or Timer()
+    ratings = Ratings.from_reviews()
+    seen = seen_matrix(ratings)
+    timer.step('load')
+    users, records, mean = factorize(ratings.matrix, factors, regularization,
+                                     iterations, chunk_size, timer=timer)
+    recommendations = list(top_unseen(users, records, mean, seen, top_n,
+                                      chunk_size))
+    timer.step('rank')
+    stored = store(ratings, recommendations)
+    timer.step('store')
+    return ratings, stored
+
+
+def split(matrix, test_fraction, seed=0):
+    """
+    Split ratings matrix into train and test matrices of the same shape,
+    holding out test_fraction of the ratings at random
+    """
+    coo = matrix.tocoo()
+    test = np.random.RandomState(seed).rand(coo.nnz) < test_fraction
+
+    def part(mask):
+        return sparse.csr_matrix((coo.data[mask],
+                                  (coo.row[mask], coo.col[mask])),
+                                 shape=matrix.shape)
+    return part(~test), part(test)
+
+
+def rmse(users, records, mean, test):
+    """
+    Return root mean squared error of predicted scores of test ratings
+    """
+    if not test.nnz:
+        return float('nan')
+    coo = test.tocoo()
+    errors = predict(users, records, mean, coo.row, coo.col) - coo.data
+    return float(np.sqrt(np.mean(errors ** 2)))
+
+
+def precision_at_k(users, records, mean, train, test, k, relevant_score,
+                   chunk_size):
+    """
+    Return mean share of the top k records recommended from train ratings
+    which users scored at least relevant_score in test ratings, over users
+    with a relevant test rating
+    """
+    relevant = test.copy()
+    relevant.data = (relevant.data >= relevant_score).astype(np.float64)
+    relevant.eliminate_zeros()
+    precisions = []
+    for row, columns, scores in top_unseen(users, records, mean, train, k,
+                                           chunk_size):
+        start, end = relevant.indptr[row:row + 2]
+        if end > start:
+            hits = np.in1d(columns, relevant.indices[start:end]).sum()
+            precisions.append(hits / float(k))
+    return float(np.mean(precisions)) if precisions else float('nan')
@@ -0,0 +1,139 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from music.models import Band, Record, Track, Label, Genre, SearchDocument
+
+
+# Search document kind of every searchable model
+KINDS = {Band: 'band', Record: 'record', Track: 'track', Label: 'label',
+         Genre: 'genre'}
+
+
+def document_fields(obj):
+    """
+    Return searchable fields of a catalogue object
+    """
+    if isinstance(obj, Band):
+        return {'title': obj.name, 'body': obj.origin, 'slug': obj.slug}
+    if isinstance(obj, Record):
+        return {'title': obj.title, 'body': '', 'slug': obj.slug}
+    if isinstance(obj, Track):
+        return {'title': obj.name, 'body': obj.record_fk.title,
+                'slug': obj.record_fk.slug}
+    if isinstance(obj, Label):
+        return {'title': obj.name, 'body': ' '.join((obj.city, obj.country)),
+                'slug': obj.slug}
+    return {'title': obj.name, 'body': obj.description or '',
+            'slug': obj.slug}
+
+
+def index_object(obj):
+    """
+    Create or refresh search document of given object
+    """
+    SearchDocument.objects.update_or_create(
+        kind=KINDS[type(obj)], object_id=obj.pk,
+        defaults=document_fields(obj))
+
+
+def index_objects(model, objects):
+    """
+    Create or refresh search documents of many objects of one model with
+    one DELETE and one INSERT
+    """
+    kind = KINDS[model]
+    SearchDocument.objects.filter(
+        kind=kind, object_id__in=[obj.pk for obj in objects]).delete()
+    SearchDocument.objects.bulk_create(
+        SearchDocument(kind=kind, object_id=obj.pk, **document_fields(obj))
+        for obj in objects)
+
+
+def unindex_object(obj):
+    """
+    Remove search document of given object
+    """
+    SearchDocument.objects.filter(kind=KINDS[type(obj)],
+                                  object_id=obj.pk).delete()
+
+
+def search_terms(query):
+    """
+    Split user query into words, dropping any search syntax
+    """
+    return re.findall(r'\w+', query, re.UNICODE)
+
+
+class PostgresSearchBackend(object):
+    """
+    Ranked search over tsvector column with GIN index
+    """
+    def ranked_ids(self, terms, limit):
+        tsquery = ' & '.join(term + ':*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, ts_rank(search_vector, query) AS rank "
+                "FROM music_searchdocument, to_tsquery('simple', %s) query "
+                "WHERE search_vector @@ query "
+                "ORDER BY rank DESC, id LIMIT %s", [tsquery, limit])
+            return cursor.fetchall()
+
+
+class SqliteSearchBackend(object):
+    """
+    Ranked search over FTS5 table, for local development and tests
+    """
+    def ranked_ids(self, terms, limit):
+        match = ' AND '.join('"%s"*' % term for term in terms)
+        with connection.cursor() as cursor:
+            # bm25 is lower for better matches, titles weigh more than body
+            cursor.execute(
+                "SELECT rowid, -bm25(music_searchdocument_fts, 10.0, 1.0) "
+                "AS rank FROM music_searchdocument_fts "
+                "WHERE music_searchdocument_fts MATCH %s "
+                "ORDER BY rank DESC, rowid LIMIT %s", [match, limit])
+            return cursor.fetchall()
+
+
+class SimpleSearchBackend(object):
+    """
+    Unranked LIKE search for databases without full-text support
+    """
+    def ranked_ids(self, terms, limit):
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(body__icontains=term)
+        ids = SearchDocument.objects.filter(condition).order_by('id').\
+                values_list('id', flat=True)[0:limit]
+        return [(document_id, 0) for document_id in ids]
+
+
+def get_backend():
+    """
+    Return search backend of the default database
+    """
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite':
+        return SqliteSearchBackend()
+    return SimpleSearchBackend()
+
+
+def search(query, limit=20):
+    """
+    Return list of search documents matching query, best first. Every
+    document gets its rank as an attribute
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    ranked = get_backend().ranked_ids(terms, limit)
+    documents = SearchDocument.objects.in_bulk([row[0] for row in ranked])
+    results = []
+    for document_id, rank in ranked:
+        if document_id in documents:
+            document = documents[document_id]
+            document.rank = rank
+            results.append(document)
+    return results
@@ -0,0 +1,488 @@
+from django.db.models import F
+from django.db.models.signals import (pre_save, post_save, pre_delete,
+                                      post_delete, m2m_changed)
+from django.dispatch import receiver
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from music.models import (Band, Label, Genre, Record, Track, Review,
+                          OwnedRecord, RowCount, RecordSummary)
+from music import search, pagecache, summaries, thumbnails
+
+
+def score_deltas(score, step):
+    """
+    Return update kwargs adding one review with given score (step=1) or
+    removing it (step=-1) from record aggregates
+    """
+    deltas = {'review_count': step, 'score_sum': step * score}
+    if score in Record.SCORES:
+        deltas['score_%d' % score] = step
+    return deltas
+
+
+# Record aggregates copied into RecordSummary
+SUMMARY_AGGREGATES = ('review_count', 'score_sum', 'runtime_seconds',
+                      'track_count')
+
+
+def update_record_aggregates(record_id, deltas, record=None):
+    """
+    Apply deltas to record aggregates (and their copies in the record
+    summary) with atomic UPDATEs. Loaded record instance, if given, gets
+    the same deltas applied in memory
+    """
+    deltas = dict((name, value) for name, value in deltas.items() if value)
+    if deltas:
+        Record.objects.filter(pk=record_id).update(
+            **dict((name, F(name) + value) for name, value in deltas.items()))
+        summary_deltas = dict((name, F(name) + value)
+                              for name, value in deltas.items()
+                              if name in SUMMARY_AGGREGATES)
+        if summary_deltas:
+            RecordSummary.objects.filter(record_id=record_id).\
+                    update(**summary_deltas)
+        if record is not None and record.pk == record_id:
+            for name, value in deltas.items():
+                setattr(record, name, getattr(record, name) + value)
+
+
+def cached_record(instance):
+    """
+    Return record instance already loaded on the review or track, if any
+    """
+    cache_name = instance._meta.get_field('record_fk').get_cache_name()
+    return getattr(instance, cache_name, None)
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_origin(sender, instance, raw, **kwargs):
+    """
+    Store record and score of the review as they are in the database
+    """
+    instance._aggregate_origin = None
+    if instance.pk and not raw:
+        instance._aggregate_origin = Review.objects.filter(pk=instance.pk).\
+                values_list('record_fk_id', 'score').first()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw, **kwargs):
+    """
+    Keep record aggregates in sync with created and edited reviews
+    """
+    if raw:
+        return
+    origin = getattr(instance, '_aggregate_origin', None)
+    record = cached_record(instance)
+    if origin is None:
+        update_record_aggregates(instance.record_fk_id,
+                                 score_deltas(instance.score, 1), record)
+        return
+    old_record_id, old_score = origin
+    if old_record_id == instance.record_fk_id:
+        deltas = score_deltas(old_score, -1)
+        for name, value in score_deltas(instance.score, 1).items():
+            deltas[name] = deltas.get(name, 0) + value
+        update_record_aggregates(instance.record_fk_id, deltas, record)
+    else:
+        update_record_aggregates(old_record_id, score_deltas(old_score, -1))
+        update_record_aggregates(instance.record_fk_id,
+                                 score_deltas(instance.score, 1), record)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    """
+    Remove deleted review from record aggregates
+    """
+    update_record_aggregates(instance.record_fk_id,
+                             score_deltas(instance.score, -1),
+                             cached_record(instance))
+
+
+def track_deltas(length_seconds, step):
+    """
+    Return update kwargs adding one track of given length (step=1) or
+    removing it (step=-1) from record aggregates
+    """
+    return {'track_count': step, 'runtime_seconds': step * length_seconds}
+
+
+@receiver(pre_save, sender=Track)
+def remember_track_origin(sender, instance, raw, **kwargs):
+    """
+    Store record and length of the track as they are in the database
+    """
+    instance._aggregate_origin = None
+    if instance.pk and not raw:
+        instance._aggregate_origin = Track.objects.filter(pk=instance.pk).\
+                values_list('record_fk_id', 'length_seconds').first()
+
+
+@receiver(post_save, sender=Track)
+def track_saved(sender, instance, created, raw, **kwargs):
+    """
+    Keep record runtime and track count in sync with created and edited
+    tracks
+    """
+    if raw:
+        return
+    origin = getattr(instance, '_aggregate_origin', None)
+    record = cached_record(instance)
+    if origin is None:
+        update_record_aggregates(instance.record_fk_id,
+                                 track_deltas(instance.length_seconds, 1),
+                                 record)
+    elif origin[0] == instance.record_fk_id:
+        update_record_aggregates(
+            instance.record_fk_id,
+            {'runtime_seconds': instance.length_seconds - origin[1]}, record)
+    else:
+        update_record_aggregates(origin[0], track_deltas(origin[1], -1))
+        update_record_aggregates(instance.record_fk_id,
+                                 track_deltas(instance.length_seconds, 1),
+                                 record)
+
+
+@receiver(post_delete, sender=Track)
+def track_deleted(sender, instance, **kwargs):
+    """
+    Remove deleted track from record aggregates
+    """
+    update_record_aggregates(instance.record_fk_id,
+                             track_deltas(instance.length_seconds, -1),
+                             cached_record(instance))
+
+
+# Models whose row counts are kept in RowCount
+COUNTED_MODELS = (Band, Label, Genre, Record)
+
+
+@receiver(post_save)
+def count_inserted_row(sender, instance, created, **kwargs):
+    """
+    Increment row count of counted models on insert
+    """
+    if created and sender in COUNTED_MODELS:
+        RowCount.add(sender, 1)
+
+
+@receiver(post_delete)
+def count_deleted_row(sender, instance, **kwargs):
+    """
+    Decrement row count of counted models on delete
+    """
+    if sender in COUNTED_MODELS:
+        RowCount.add(sender, -1)
+
+
+@receiver(post_save)
+def update_search_document(sender, instance, raw, **kwargs):
+    """
+    Refresh search document of saved catalogue object
+    """
+    if sender in search.KINDS and not raw:
+        search.index_object(instance)
+
+
+@receiver(post_save, sender=Record)
+def update_track_search_documents(sender, instance, created, raw, **kwargs):
+    """
+    Refresh search documents of tracks of saved record, which show its
+    title and slug
+    """
+    if not created and not raw:
+        search.index_objects(Track, list(instance.track_set.all()))
+
+
+@receiver(post_delete)
+def delete_search_document(sender, instance, **kwargs):
+    """
+    Remove search document of deleted catalogue object
+    """
+    if sender in search.KINDS:
+        search.unindex_object(instance)
+
+
+def page_cache_tags(instance):
+    """
+    Return page cache tags affected by a change of given catalogue object
+    """
+    if isinstance(instance, Record):
+        return ['record:%d' % instance.pk, 'label:%d' % instance.label_fk_id,
+                'list:record']
+    if isinstance(instance, (Track, Review)):
+        return ['record:%d' % instance.record_fk_id]
+    name = instance._meta.model_name
+    return ['%s:%d' % (name, instance.pk), 'list:' + name]
+
+
+# Models whose pages are kept in the page cache
+CACHED_PAGE_MODELS = (Band, Label, Genre, Record, Track, Review)
+
+
+@receiver(post_save)
+def invalidate_saved_pages(sender, instance, raw, **kwargs):
+    """
+    Evict cached pages showing saved catalogue object
+    """
+    if sender in CACHED_PAGE_MODELS and not raw:
+        pagecache.invalidate(*page_cache_tags(instance))
+
+
+@receiver(post_delete)
+def invalidate_deleted_pages(sender, instance, **kwargs):
+    """
+    Evict cached pages showing deleted catalogue object
+    """
+    if sender in CACHED_PAGE_MODELS:
+        pagecache.invalidate(*page_cache_tags(instance))
+
+
+# Many-to-many relations shown on cached pages: through model, its field
+# pointing at the owning model and its field pointing at the related model
+CACHED_PAGE_RELATIONS = {
+    Record.bands.through: ('record', 'band'),
+    Record.genres.through: ('record', 'genre'),
+    Track.feat.through: ('track', 'band'),
+}
+
+
+def relation_tags(sender, owner_pks, related_pks):
+    """
+    Return page cache tags of both sides of many-to-many relation rows
+    """
+    owner_field, related_field = CACHED_PAGE_RELATIONS[sender]
+    if owner_field == 'track':
+        owner_pks = Track.objects.filter(pk__in=owner_pks).\
+                values_list('record_fk', flat=True)
+    return ['record:%d' % pk for pk in owner_pks] + \
+            ['%s:%d' % (related_field, pk) for pk in related_pks]
+
+
+@receiver(m2m_changed)
+def invalidate_related_pages(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """
+    Evict cached pages of both sides of a changed many-to-many relation
+    """
+    if sender not in CACHED_PAGE_RELATIONS:
+        return
+    owner_field, related_field = CACHED_PAGE_RELATIONS[sender]
+    if action == 'pre_clear':
+        # cleared rows are not passed to post_clear, read them now
+        if reverse:
+            pk_set = sender.objects.filter(**{related_field: instance.pk}).\
+                    values_list(owner_field, flat=True)
+        else:
+            pk_set = sender.objects.filter(**{owner_field: instance.pk}).\
+                    values_list(related_field, flat=True)
+        instance._cleared_pks = set(pk_set)
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if reverse:
+        tags = relation_tags(sender, pk_set, [instance.pk])
+    else:
+        tags = relation_tags(sender, [instance.pk], pk_set)
+    pagecache.invalidate(*tags)
+
+
+def related_record_ids(instance):
+    """
+    Return ids of records whose summary shows given label, band or genre
+    """
+    if isinstance(instance, Label):
+        return Record.objects.filter(label_fk=instance).\
+                values_list('pk', flat=True)
+    through = Record.bands.through if isinstance(instance, Band) else \
+            Record.genres.through
+    return through.objects.filter(
+        **{instance._meta.model_name: instance}).\
+            values_list('record_id', flat=True)
+
+
+@receiver(post_save, sender=Record)
+def refresh_record_summary(sender, instance, created, raw, **kwargs):
+    """
+    Write summary of saved record
+    """
+    if not raw:
+        summaries.save_record(instance, created)
+
+
+@receiver(post_save, sender=Band)
+@receiver(post_save, sender=Label)
+@receiver(post_save, sender=Genre)
+def refresh_related_summaries(sender, instance, created, raw, **kwargs):
+    """
+    Rewrite summaries showing the name of saved label, band or genre
+    """
+    if not created and not raw:
+        summaries.refresh(related_record_ids(instance))
+
+
+@receiver(pre_delete, sender=Band)
+@receiver(pre_delete, sender=Genre)
+def remember_summary_records(sender, instance, **kwargs):
+    """
+    Store records of deleted band or genre, whose relation rows are
+    removed without m2m_changed
+    """
+    instance._summary_record_ids = list(related_record_ids(instance))
+
+
+@receiver(post_delete, sender=Band)
+@receiver(post_delete, sender=Genre)
+def refresh_summaries_after_delete(sender, instance, **kwargs):
+    record_ids = getattr(instance, '_summary_record_ids', [])
+    summaries.refresh(record_ids)
+    touch_records(record_ids)
+
+
+@receiver(m2m_changed, sender=Record.bands.through)
+@receiver(m2m_changed, sender=Record.genres.through)
+def refresh_relation_summaries(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    """
+    Rewrite summaries of records whose bands or genres changed
+    """
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if reverse:
+        summaries.refresh(pk_set)
+    else:
+        relation = 'bands' if sender is Record.bands.through else 'genres'
+        summaries.refresh_names(instance.pk, relation)
+
+
+def touch_records(record_ids):
+    """
+    Bump modify_date of records whose features changed without saving
+    them, so that music.similarity recomputes them
+    """
+    record_ids = [pk for pk in record_ids if pk is not None]
+    if record_ids:
+        Record.objects.filter(pk__in=record_ids).update(
+            modify_date=timezone.now())
+
+
+@receiver(m2m_changed, sender=Record.bands.through)
+@receiver(m2m_changed, sender=Record.genres.through)
+@receiver(m2m_changed, sender=Track.feat.through)
+def touch_relation_records(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """
+    Mark records whose bands, genres or featured artists changed
+    """
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if sender is Track.feat.through:
+        track_ids = pk_set if reverse else [instance.pk]
+        touch_records(Track.objects.filter(pk__in=track_ids).
+                      values_list('record_fk', flat=True))
+    else:
+        touch_records(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Track)
+@receiver(post_delete, sender=OwnedRecord)
+def touch_record_after_delete(sender, instance, **kwargs):
+    """
+    Mark record of a deleted review, track or owned record
+    """
+    touch_records([instance.record_fk_id])
+
+
+@receiver(pre_save, sender=OwnedRecord)
+def remember_owner(sender, instance, raw, **kwargs):
+    """
+    Store owner of the record as it is in the database
+    """
+    instance._stats_origin = None
+    if instance.pk and not raw:
+        instance._stats_origin = OwnedRecord.objects.filter(
+            pk=instance.pk).values_list('user_fk_id', flat=True).first()
+
+
+@receiver(post_save, sender=OwnedRecord)
+@receiver(post_delete, sender=OwnedRecord)
+def invalidate_collection_stats(sender, instance, **kwargs):
+    """
+    Drop cached collection statistics of owners of a changed record
+    """
+    owners = set([instance.user_fk_id,
+                  getattr(instance, '_stats_origin', None)])
+    keys = [OwnedRecord.collection_stats_key(pk)
+            for pk in owners if pk is not None]
+    cache.delete_many(keys)
+    # stats computed by other workers before the commit are dropped again
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(pre_save)
+def remember_image(sender, instance, raw, **kwargs):
+    """
+    Forget thumbnails of an image being replaced
+    """
+    fields = [field_name for model, field_name in thumbnails.THUMBNAIL_FIELDS
+              if model is sender]
+    if not fields or raw:
+        return
+    instance._new_images = []
+    instance._replaced_images = []
+    for field_name in fields:
+        name = getattr(instance, field_name).name or ''
+        old_name, old_suffixes = None, ''
+        if instance.pk:
+            old_name, old_suffixes = sender.objects.filter(
+                pk=instance.pk).values_list(
+                    field_name, field_name + '_thumbnails').first() or \
+                    (None, '')
+        if name != (old_name or ''):
+            setattr(instance, field_name + '_thumbnails', '')
+            if name:
+                instance._new_images.append(field_name)
+            if old_name:
+                instance._replaced_images.append(
+                    (field_name, old_name, old_suffixes))
+
+
+@receiver(post_save)
+def render_thumbnails(sender, instance, raw, **kwargs):
+    """
+    Render thumbnails of new images once they are committed, deleting
+    those of replaced images
+    """
+    for field_name in getattr(instance, '_new_images', []):
+        name = getattr(instance, field_name).name
+        transaction.on_commit(
+            lambda field_name=field_name, name=name:
+            thumbnails.schedule(sender, field_name, name))
+    for field_name, name, suffixes in getattr(instance, '_replaced_images',
+                                              []):
+        transaction.on_commit(
+            lambda field_name=field_name, name=name, suffixes=suffixes:
+            thumbnails.delete_unused(sender, field_name, name, suffixes))
+
+
+@receiver(post_delete)
+def delete_thumbnails(sender, instance, **kwargs):
+    """
+    Delete thumbnails of images of deleted objects once committed
+    """
+    for model, field_name in thumbnails.THUMBNAIL_FIELDS:
+        if model is sender:
+            name = getattr(instance, field_name).name
+            suffixes = getattr(instance, field_name + '_thumbnails')
+            transaction.on_commit(
+                lambda field_name=field_name, name=name, suffixes=suffixes:
+                thumbnails.delete_unused(sender, field_name, name, suffixes))
@@ -0,0 +1,175 @@
+import numpy as np
+from scipy import sparse
+
+from django.db.models import Count, Min
+from django.utils import timezone
+from music.models import Record, Track, Review, OwnedRecord, SimilarRecord
+from music import pagecache
+
+
+# Feature kinds: feature space they fall into and their weight. Bands of a
+# record and bands featured on its tracks share one space, so that a
+# featuring record is similar to records of the featured band
+WEIGHTS = (
+    ('genre', 'genre', 1.0),
+    ('band', 'band', 2.0),
+    ('feat', 'band', 1.0),
+    ('user', 'user', 1.0),
+)
+
+
+def feature_pairs():
+    """
+    Return (record id, feature id) pairs of every feature kind
+    """
+    return {
+        'genre': Record.genres.through.objects.values_list('record_id',
+                                                           'genre_id'),
+        'band': Record.bands.through.objects.values_list('record_id',
+                                                         'band_id'),
+        'feat': Track.feat.through.objects.values_list('track__record_fk',
+                                                       'band_id'),
+        # reviewers and owners both count as users of a record
+        'user': list(Review.objects.values_list('record_fk', 'create_by')) +
+                list(OwnedRecord.objects.values_list('record_fk', 'user_fk')),
+    }
+
+
+def feature_matrix(record_ids, pairs):
+    """
+    Return sparse records x features matrix with L2-normalized rows, so
+    that products of its rows are cosine similarities. Every feature of a
+    record gets the weight of the strongest kind it comes from
+    """
+    spaces = {}
+    for kind, space, weight in WEIGHTS:
+        rows = np.array(list(pairs[kind]), dtype=np.int64).reshape(-1, 2)
+        spaces.setdefault(space, []).append(
+            (rows[np.in1d(rows[:, 0], record_ids)], weight))
+    blocks = []
+    for space in sorted(spaces):
+        features = np.unique(np.concatenate(
+            [rows[:, 1] for rows, weight in spaces[space]]))
+        block = sparse.csr_matrix((len(record_ids), len(features)))
+        for rows, weight in spaces[space]:
+            kind_block = sparse.csr_matrix(
+                (np.ones(len(rows)),
+                 (np.searchsorted(record_ids, rows[:, 0]),
+                  np.searchsorted(features, rows[:, 1]))),
+                shape=block.shape)
+            # duplicates (e.g. user reviewing and owning a record) count once
+            kind_block.data[:] = weight
+            block = block.maximum(kind_block)
+        if block.shape[1]:
+            blocks.append(block)
+    if not blocks:
+        return sparse.csr_matrix((len(record_ids), 0))
+    matrix = sparse.hstack(blocks, format='csr')
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(matrix).tocsr()
+
+
+def top_neighbours(matrix, rows, top_k):
+    """
+    Yield (row, neighbour rows, scores) of top_k most similar records of
+    given rows, best first, computed with one sparse product
+    """
+    similarity = matrix[rows].dot(matrix.T).tocsr()
+    for position, row in enumerate(rows):
+        start, end = similarity.indptr[position:position + 2]
+        columns = similarity.indices[start:end]
+        scores = similarity.data[start:end]
+        keep = (columns != row) & (scores > 0)
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[0:top_k]
+            columns, scores = columns[best], scores[best]
+        order = np.lexsort((columns, -scores))
+        yield row, columns[order], scores[order]
+
+
+def affected_rows(matrix, rows, record_ids, top_k, chunk_size):
+    """
+    Return given rows with rows of records which may take one of them as a
+    new similar record: records sharing features with one of them, scored
+    with it at least as high as their lowest stored similar record, or with
+    fewer than top_k stored
+    """
+    best = np.zeros(matrix.shape[0])
+    for start in range(0, len(rows), chunk_size):
+        product = matrix[rows[start:start + chunk_size]].dot(matrix.T)
+        best = np.maximum(best, product.max(axis=0).toarray().ravel())
+    lowest = np.zeros(matrix.shape[0])
+    stored = SimilarRecord.objects.values('record_fk').order_by().\
+            annotate(lowest=Min('score'), count=Count('pk')).\
+            filter(count__gte=top_k).values_list('record_fk', 'lowest')
+    for record_id, score in stored:
+        lowest[np.searchsorted(record_ids, record_id)] = score
+    return np.union1d(rows, np.flatnonzero((best > 0) & (best >= lowest)))
+
+
+def changed_record_ids(since):
+    """
+    Return ids of records whose features may have changed since given date:
+    edited records (band, genre and featured artist changes and deleted
+    reviews, tracks and owned records touch their modify_date, see
+    music.signals), records with new or edited tracks and reviews, and
+    records listing one of those as similar. Records which may take one of
+    them as a new neighbour are added by compute, see affected_rows
+    """
+    changed = set(Record.objects.filter(modify_date__gt=since).
+                  values_list('pk', flat=True))
+    changed.update(Track.objects.filter(modify_date__gt=since).
+                   values_list('record_fk', flat=True))
+    changed.update(Review.objects.filter(modify_date__gt=since).
+                   values_list('record_fk', flat=True))
+    changed.update(OwnedRecord.objects.filter(purchase_date__gt=since).
+                   values_list('record_fk', flat=True))
+    changed.update(SimilarRecord.objects.filter(similar_fk__in=changed).
+                   values_list('record_fk', flat=True))
+    # records never computed, e.g. created before the first run
+    changed.update(Record.objects.filter(similar_date__isnull=True).
+                   values_list('pk', flat=True))
+    return changed
+
+
+def compute(top_k, chunk_size, only=None):
+    """
+    Recompute similar records of all records, or of records with ids in
+    only and of records they may become similar to. Yields number of
+    records stored after every chunk
+    """
+    record_ids = np.array(sorted(Record.objects.values_list('pk', flat=True)),
+                          dtype=np.int64)
+    matrix = feature_matrix(record_ids, feature_pairs())
+    if only is None:
+        rows = np.arange(len(record_ids))
+    else:
+        rows = affected_rows(
+            matrix, np.flatnonzero(np.in1d(record_ids, list(only))),
+            record_ids, top_k, chunk_size)
+    done = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        store(record_ids, top_neighbours(matrix, chunk, top_k),
+              record_ids[chunk])
+        done += len(chunk)
+        yield done
+
+
+def store(record_ids, neighbours, computed_ids):
+    """
+    Replace stored similar records of computed records
+    """
+    objects = [SimilarRecord(record_fk_id=int(record_ids[row]),
+                             similar_fk_id=int(record_ids[column]),
+                             score=float(score))
+               for row, columns, scores in neighbours
+               for column, score in zip(columns, scores)]
+    computed_ids = [int(pk) for pk in computed_ids]
+    SimilarRecord.objects.filter(record_fk__in=computed_ids).delete()
+    SimilarRecord.objects.bulk_create(objects)
+    Record.objects.filter(pk__in=computed_ids).update(
+        similar_date=timezone.now())
+    pagecache.invalidate(*['record:%d' % pk for pk in computed_ids])
@@ -0,0 +1,114 @@
+import gzip
+import hashlib
+import io
+import os
+import re
+import uuid
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class ContentHashStorage(FileSystemStorage):
+    """
+    File system storage naming files by the SHA-256 of their content, in
+    the directory they were uploaded to. Identical uploads share one file
+    and a name never points to other content, so URLs can be cached
+    forever. Files are never overwritten
+    """
+    def get_available_name(self, name, max_length=None):
+        # the name is replaced by the content hash in _save
+        return name
+
+    def content_name(self, name, content):
+        """
+        Return hashed name of content uploaded as name
+        """
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, base = os.path.split(name)
+        extension = os.path.splitext(base)[1].lower()
+        return os.path.join(directory, digest.hexdigest() + extension)
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        # written under a unique name and moved in place: identical uploads
+        # racing past exists() replace the file with the same content,
+        # where FileSystemStorage would retry its name forever
+        temporary = super(ContentHashStorage, self)._save(
+            '%s.%s.tmp' % (name, uuid.uuid4().hex), content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+# Name of a stored content-hashed file or of a thumbnail rendered from one
+CONTENT_HASHED_RE = re.compile(r'^[0-9a-f]{64}(\.|$)')
+
+
+def is_content_hashed(name):
+    return CONTENT_HASHED_RE.match(os.path.basename(name)) is not None
+
+
+def gzip_compress(data):
+    buffer = io.BytesIO()
+    # fixed mtime, so that unchanged files compress to the same bytes
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9,
+                       mtime=0) as stream:
+        stream.write(data)
+    return buffer.getvalue()
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Static files storage writing content-hashed copies and the manifest
+    like ManifestStaticFilesStorage, plus precompressed gzip and (with the
+    brotli package) brotli variants of text files, all at collectstatic
+    time. Names missing from the manifest, e.g. before the first
+    collectstatic, are used unhashed
+    """
+    compressible_extensions = ('.css', '.js', '.svg', '.json', '.txt',
+                               '.html', '.xml', '.map', '.ico', '.eot',
+                               '.ttf', '.otf')
+    # variants by encoding: file name suffix and compress function
+    encodings = [('gzip', '.gz', gzip_compress)]
+    if brotli is not None:
+        encodings.insert(0, ('br', '.br', brotli.compress))
+
+    def stored_name(self, name):
+        return self.hashed_files.get(self.hash_key(name), name)
+
+    def post_process(self, *args, **kwargs):
+        processed = super(CompressedManifestStaticFilesStorage,
+                          self).post_process(*args, **kwargs)
+        for name, hashed_name, was_processed in processed:
+            yield name, hashed_name, was_processed
+        if kwargs.get('dry_run'):
+            return
+        names = set(self.hashed_files.keys()) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in \
+                    self.compressible_extensions:
+                self.compress(name)
+
+    def compress(self, name):
+        """
+        Write compressed variants of a file, those not smaller are skipped
+        """
+        with self.open(name) as original:
+            data = original.read()
+        for encoding, suffix, compress in self.encodings:
+            compressed = compress(data)
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            if len(compressed) < len(data):
+                self._save(name + suffix, ContentFile(compressed))
@@ -0,0 +1,88 @@
+from django.db import transaction
+from music.models import Record, RecordSummary
+
+
+# Largest number of records refreshed per set of queries
+CHUNK_SIZE = 500
+
+
+def summary_of(record):
+    """
+    Return summary row of a record loaded with label, bands and genres
+    """
+    return RecordSummary(
+        record_id=record.pk, title=record.title, slug=record.slug,
+        release_date=record.release_date, label_name=record.label_fk.name,
+        band_names=', '.join(sorted(band.name for band in record.bands.all())),
+        genre_names=', '.join(sorted(genre.name
+                                     for genre in record.genres.all())),
+        review_count=record.review_count, score_sum=record.score_sum,
+        runtime_seconds=record.runtime_seconds,
+        track_count=record.track_count)
+
+
+def save_record(record, created):
+    """
+    Write summary fields read from the saved record itself: one INSERT for
+    new records, which have no bands or genres yet, one UPDATE otherwise.
+    Aggregates are kept current by music.signals, the saved instance may
+    hold stale ones, so they are only copied into new summaries
+    """
+    fields = dict(
+        title=record.title, slug=record.slug,
+        release_date=record.release_date, label_name=record.label_fk.name)
+    if created:
+        RecordSummary.objects.create(
+            record_id=record.pk, review_count=record.review_count,
+            score_sum=record.score_sum,
+            runtime_seconds=record.runtime_seconds,
+            track_count=record.track_count, **fields)
+    elif not RecordSummary.objects.filter(record_id=record.pk).\
+            update(**fields):
+        refresh([record.pk])
+
+
+def refresh_names(record_id, relation):
+    """
+    Rewrite band or genre names of a record, relation being 'bands' or
+    'genres'
+    """
+    related = Record._meta.get_field(relation).related_model
+    names = sorted(related.objects.filter(record=record_id).
+                   values_list('name', flat=True))
+    RecordSummary.objects.filter(record_id=record_id).update(
+        **{relation[0:-1] + '_names': ', '.join(names)})
+
+
+def refresh(record_ids):
+    """
+    Rewrite summaries of given records, dropping those of deleted records
+    """
+    record_ids = sorted(set(record_ids))
+    for start in range(0, len(record_ids), CHUNK_SIZE):
+        chunk = record_ids[start:start + CHUNK_SIZE]
+        records = Record.objects.filter(pk__in=chunk).\
+                select_related('label_fk').prefetch_related('bands', 'genres')
+        summaries = [summary_of(record) for record in records]
+        with transaction.atomic():
+            RecordSummary.objects.filter(record_id__in=chunk).delete()
+            RecordSummary.objects.bulk_create(summaries)
+
+
+def rebuild():
+    """
+    Rewrite summaries of all records. Yields number of records done
+    """
+    RecordSummary.objects.exclude(
+        record_id__in=Record.objects.values('pk')).delete()
+    last_id = 0
+    done = 0
+    while True:
+        chunk = list(Record.objects.filter(pk__gt=last_id).order_by('pk').
+                     values_list('pk', flat=True)[0:CHUNK_SIZE])
+        if not chunk:
+            break
+        refresh(chunk)
+        last_id = chunk[-1]
+        done += len(chunk)
+        yield done
@@ -1,4 +1,7 @@
 from django import template
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from music import thumbnails
 
 register = template.Library()
 
@@ -6,3 +9,45 @@ register = template.Library()
 def sort_by(queryset, order):
     return queryset.order_by(order)
 
+
+@register.filter
+def duration(seconds):
+    """
+    Format a number of seconds as H:MM:SS, or M:SS below an hour
+    """
+    minutes, seconds = divmod(int(seconds or 0), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '%d:%02d:%02d' % (hours, minutes, seconds)
+    return '%d:%02d' % (minutes, seconds)
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name):
+    """
+    Render placeholder of a per-user fragment, see music.pagecache
+    """
+    return mark_safe(context['view'].hole_markup(name))
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes='(min-width: 768px) 25vw, 100vw',
+                     css_class='img-responsive'):
+    """
+    Render picture element of an image offering its rendered thumbnails
+    through srcset, WebP ones first. Images without thumbnails are served
+    as they are
+    """
+    suffixes = getattr(image.instance, image.field.name + '_thumbnails', '')
+    srcsets = thumbnails.srcsets(image.name, suffixes)
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((extension, srcset, sizes) for extension, srcset in
+         sorted(srcsets.items()) if extension == 'webp'))
+    fallback = [srcset for extension, srcset in srcsets.items()
+                if extension != 'webp']
+    srcset = format_html(' srcset="{}" sizes="{}"', fallback[0], sizes) \
+            if fallback else ''
+    return format_html('<picture>{}<img src="{}"{} class="{}" alt="{}">'
+                       '</picture>', sources, image.url, srcset, css_class,
+                       alt)
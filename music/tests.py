@@ -1,10 +1,80 @@
-from django.test import TestCase, Client
+from django.test import TestCase as DjangoTestCase, Client, RequestFactory
+from django.http import HttpResponse
+from django.core.files.base import ContentFile
+from django.core.paginator import EmptyPage
+from music.storage import ContentHashStorage
+from unittest import mock
 from music.models import Band, Record, Genre, Label, Track, OwnedRecord, Review
+from music.models import ReviewReaction, SimilarRecord, RecommendedRecord
+from music.models import RecordSummary
+from music import similarity, recommendations, thumbnails, summaries
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.contrib.auth.models import AnonymousUser
 from django.utils import timezone
 import datetime
 from django.utils.text import slugify
+from django.core.management import call_command
+from django.utils.six import StringIO
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import re
+import json
+import base64
+from django.utils.six.moves.urllib.parse import unquote
+import gzip
+import os
+import tempfile
+import shutil
+import hashlib
+import time
+import io
+import numpy as np
+from PIL import Image
+from django.test import override_settings
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from music.importer import track_length, CatalogueImporter
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Template, Context
+from music.pagination import KeysetPaginator, InvalidCursor
+from music.pagination import (ExactCount, CachedCount, CounterTableCount,
+                              EstimatedCount, CountStrategyPaginator)
+from music.models import RowCount
+from music.views import BandListView
+from django.core.cache import cache
+from music.models import SearchDocument
+from music import search
+from music.typeahead import PrefixIndex, Typeahead, typeahead
+from django.core.cache import caches
+from music import pagecache
+from wilkmusic.settings import production as production_settings
+
+
+# Tests run in one process, so caches are kept in memory: query budgets
+# then count queries of the views only, not those of the database cache
+LOCAL_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pages',
+    },
+}
+
+
+@override_settings(CACHES = LOCAL_CACHES)
+class TestCase(DjangoTestCase):
+    """
+    Test case starting with empty caches, cached pages and counts would
+    otherwise leak between tests
+    """
+    def _pre_setup(self):
+        super(TestCase, self)._pre_setup()
+        for alias in ('default', 'pages'):
+            caches[alias].clear()
+        pagecache.reset_stats()
 
 ##----------------------Default Generators
 def create_user(_username = 'tester', _password = 'aaaaaaaa'):
@@ -329,6 +399,29 @@ class RecordModelTests(TestCase):
                                     _genres = [self.genre])
         self.assertEqual(len(self.r3.get_bands_other_records()), 2)
 
+    def test_get_bands_other_records_without_duplicates(self):
+        """
+        Collab record of both bands should be listed once
+        """
+        self.b2 = create_band(_user = self.user, _name = 'Other_band')
+        self.record.bands.add(self.b2)
+        self.r2 = create_record(_user = self.user, _label = self.label,
+                                _bands = [self.band, self.b2])
+        self.assertEqual(self.record.get_bands_other_records(), [self.r2])
+
+    def test_get_bands_other_records_limit_and_order(self):
+        """
+        Should return latest records first, no more than limit
+        """
+        records = [create_record(_user = self.user, _label = self.label,
+                                 _bands = [self.band], _title = 'r%d' % i,
+                                 _release_date = datetime.date(2000 + i, 1, 1))
+                   for i in range(12)]
+        self.assertEqual(self.record.get_bands_other_records(limit = 3),
+                         records[:-4:-1])
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.record.get_bands_other_records()), 10)
+
 
 class TrackModelTests(TestCase):
     """
@@ -355,6 +448,165 @@ class TrackModelTests(TestCase):
         self.assertEqual(self.track.feat.all().count(), 1)
 
 
+class TrackAggregateTests(TestCase):
+    """
+    Track lengths in seconds and record runtime aggregates
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.record = create_record(_user = self.user, _label = self.label)
+        self.other = create_record(_user = self.user, _label = self.label,
+                                   _title = 'other')
+
+    def assertAggregates(self, record, runtime, count):
+        record.refresh_from_db()
+        self.assertEqual((record.runtime_seconds, record.track_count),
+                         (runtime, count))
+
+    def test_length_in_seconds(self):
+        track = create_track(_user = self.user, _record = self.record,
+                             _feat = [], _length = '00:03:15')
+        track.refresh_from_db()
+        self.assertEqual(track.length_seconds, 195)
+        self.assertEqual(track.length, datetime.time(0, 3, 15))
+        track.length = datetime.time(1, 0, 1)
+        self.assertEqual(track.length_seconds, 3601)
+
+    def test_length_of_a_day(self):
+        """
+        Lengths of a day or more should be rejected by validation, cut by
+        the importer and still render on the record page
+        """
+        track = create_track(_user = self.user, _record = self.record,
+                             _feat = [])
+        track.length_seconds = 25 * 3600
+        with self.assertRaises(ValidationError):
+            track.full_clean()
+        self.assertEqual(track_length({'length': 25 * 3600}), 86399)
+        Track.objects.filter(pk = track.pk).update(length_seconds = 25 * 3600)
+        response = Client().get(reverse('music:record',
+                                        args = (self.record.slug,)))
+        self.assertContains(response, '[25:00:00]')
+
+    def test_runtime_follows_tracks(self):
+        t1 = create_track(_user = self.user, _record = self.record,
+                          _feat = [], _length = '00:03:00')
+        create_track(_user = self.user, _record = self.record, _feat = [],
+                     _length = '00:02:00', _number = 2)
+        self.assertAggregates(self.record, 300, 2)
+        t1.length_seconds = 100
+        t1.save()
+        self.assertAggregates(self.record, 220, 2)
+        t1.record_fk = self.other
+        t1.save()
+        self.assertAggregates(self.record, 120, 1)
+        self.assertAggregates(self.other, 100, 1)
+        t1.delete()
+        self.assertAggregates(self.other, 0, 0)
+
+    def test_rebuild(self):
+        create_track(_user = self.user, _record = self.record, _feat = [],
+                     _length = '00:03:00')
+        Record.objects.update(runtime_seconds = 7, track_count = 7)
+        RecordSummary.objects.update(runtime_seconds = 7, track_count = 7)
+        call_command('rebuild_track_aggregates', stdout = StringIO())
+        self.assertAggregates(self.record, 180, 1)
+        self.assertAggregates(self.other, 0, 0)
+        self.assertEqual(
+            sorted(RecordSummary.objects.values_list('runtime_seconds',
+                                                     'track_count')),
+            [(0, 0), (180, 1)])
+
+
+class RecordSummaryTests(TestCase):
+    """
+    Record summary read model kept current by signals
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user, _name = 'L')
+        self.b1 = create_band(_user = self.user, _name = 'zeta')
+        self.b2 = create_band(_user = self.user, _name = 'alpha')
+        self.genre = create_genre(_user = self.user, _name = 'rock')
+        self.record = create_record(_user = self.user, _label = self.label,
+                                    _title = 'R', _bands = [self.b1, self.b2],
+                                    _genres = [self.genre])
+
+    def summary(self):
+        return RecordSummary.objects.get(record = self.record)
+
+    def test_created_with_record(self):
+        summary = self.summary()
+        self.assertEqual((summary.title, summary.slug, summary.label_name),
+                         ('R', 'r', 'L'))
+        self.assertEqual(summary.band_names, 'alpha, zeta')
+        self.assertEqual(summary.genre_names, 'rock')
+
+    def test_follows_relations(self):
+        self.b1.name = 'beta'
+        self.b1.save()
+        self.assertEqual(self.summary().band_names, 'alpha, beta')
+        self.label.name = 'M'
+        self.label.save()
+        self.assertEqual(self.summary().label_name, 'M')
+        self.record.genres.clear()
+        self.assertEqual(self.summary().genre_names, '')
+        self.genre.record_set.add(self.record)
+        self.assertEqual(self.summary().genre_names, 'rock')
+        self.b2.delete()
+        self.assertEqual(self.summary().band_names, 'beta')
+        self.record.title = 'S'
+        self.record.save()
+        self.assertEqual(self.summary().title, 'S')
+
+    def test_follows_aggregates(self):
+        create_review(_user = self.user, _record = self.record, _score = 4)
+        create_review(_user = self.user, _record = self.record, _score = 1)
+        create_track(_user = self.user, _record = self.record, _feat = [],
+                     _length = '00:02:00')
+        summary = self.summary()
+        self.assertEqual(summary.get_avg_score(), 2.5)
+        self.assertEqual((summary.runtime_seconds, summary.track_count),
+                         (120, 1))
+
+    def test_stale_record_save(self):
+        """
+        Saving a record loaded before a review and a track were added
+        should keep their aggregates in the summary
+        """
+        stale = Record.objects.get(pk = self.record.pk)
+        create_review(_user = self.user, _record = self.record, _score = 4)
+        create_track(_user = self.user, _record = self.record, _feat = [])
+        stale.title = 'Renamed'
+        stale.save()
+        summaries.save_record(stale, False)
+        summary = self.summary()
+        self.assertEqual(summary.title, 'Renamed')
+        self.assertEqual((summary.review_count, summary.score_sum), (1, 4))
+        self.assertEqual((summary.runtime_seconds, summary.track_count),
+                         (195, 1))
+
+    def test_deleted_with_record(self):
+        self.record.delete()
+        self.assertEqual(RecordSummary.objects.count(), 0)
+
+    def test_rebuild(self):
+        RecordSummary.objects.update(band_names = 'stale')
+        call_command('rebuild_record_summaries', stdout = StringIO())
+        self.assertEqual(self.summary().band_names, 'alpha, zeta')
+
+    def test_lists_read_one_table(self):
+        c = Client()
+        with self.assertNumQueries(1):
+            response = c.get(reverse('api-music:record'))
+        self.assertEqual(response.data['results'][0]['bands'], 'alpha, zeta')
+        self.assertEqual(response.data['results'][0]['label'], 'L')
+        response = c.get(reverse('music:index'))
+        self.assertEqual([r.title for r in response.context['records']],
+                         ['R'])
+
+
 class OwnedRecordModelTests(TestCase):
     """
     Test for OwnedRecord model
@@ -411,6 +663,92 @@ class OwnedRecordModelTests(TestCase):
 
 
 
+class CollectionStatsTests(TestCase):
+    """
+    Cached per-user collection statistics
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.other = create_user(_username = 'other')
+        rock = create_genre(_user = self.user, _name = 'rock')
+        jazz = create_genre(_user = self.user, _name = 'jazz')
+        self.label = create_label(_user = self.user, _name = 'L1')
+        label2 = create_label(_user = self.user, _name = 'L2')
+        self.a = create_record(_user = self.user, _label = self.label,
+                               _title = 'A', _genres = [rock, jazz])
+        self.b = create_record(_user = self.user, _label = label2,
+                               _title = 'B', _genres = [rock])
+        create_track(_user = self.user, _record = self.a, _feat = [],
+                     _length = '00:03:00')
+        create_track(_user = self.user, _record = self.a, _feat = [],
+                     _length = '00:03:00', _number = 2)
+        create_track(_user = self.user, _record = self.b, _feat = [],
+                     _length = '01:00:30')
+        create_ownedrecord(_user = self.user, _record = self.a,
+                           _purchase_date = '2016-05-01')
+        create_ownedrecord(_user = self.user, _record = self.a,
+                           _purchase_date = '2017-05-01', _disc_type = 'vinyl')
+        create_ownedrecord(_user = self.user, _record = self.b,
+                           _purchase_date = '2017-06-01')
+        create_ownedrecord(_user = self.other, _record = self.b)
+
+    def test_stats(self):
+        stats = OwnedRecord.get_collection_stats(self.user)
+        self.assertEqual(stats['records'], 3)
+        self.assertEqual(stats['disc_types'], [('CD', 2), ('Vinyl Disc', 1)])
+        self.assertEqual(stats['years'], [(2016, 1), (2017, 2)])
+        self.assertEqual(stats['genres'], [('rock', 3), ('jazz', 2)])
+        self.assertEqual(stats['labels'], [('L1', 2), ('L2', 1)])
+        # tracks of a record owned twice are played once
+        self.assertEqual(stats['playing_time'],
+                         datetime.timedelta(minutes = 66, seconds = 30))
+        self.assertIsNone(OwnedRecord.get_collection_stats(AnonymousUser()))
+
+    def test_cached(self):
+        with self.assertNumQueries(4):
+            OwnedRecord.get_collection_stats(self.user)
+        with self.assertNumQueries(0):
+            OwnedRecord.get_collection_stats(self.user)
+
+    def test_invalidated_on_owned_record_change(self):
+        OwnedRecord.get_collection_stats(self.user)
+        OwnedRecord.get_collection_stats(self.other)
+        owned = create_ownedrecord(_user = self.user, _record = self.b)
+        self.assertEqual(
+            OwnedRecord.get_collection_stats(self.user)['records'], 4)
+        owned.user_fk = self.other
+        owned.save()
+        self.assertEqual(
+            OwnedRecord.get_collection_stats(self.user)['records'], 3)
+        self.assertEqual(
+            OwnedRecord.get_collection_stats(self.other)['records'], 2)
+        owned.delete()
+        self.assertEqual(
+            OwnedRecord.get_collection_stats(self.other)['records'], 1)
+
+    @override_settings(CACHES = production_settings.CACHES)
+    def test_invalidated_in_shared_cache(self):
+        """
+        Stats should live in the cache shared by all workers and be dropped
+        from it on purchase
+        """
+        OwnedRecord.get_collection_stats(self.user)
+        key = OwnedRecord.collection_stats_key(self.user.pk)
+        self.assertEqual(caches['default'].get(key)['records'], 3)
+        create_ownedrecord(_user = self.user, _record = self.b)
+        self.assertIsNone(caches['default'].get(key))
+        self.assertEqual(
+            OwnedRecord.get_collection_stats(self.user)['records'], 4)
+
+    def test_user_panel(self):
+        c = Client()
+        c.force_login(self.user)
+        response = c.get(reverse('music:userPanel'))
+        self.assertEqual(response.context['collection_stats']['records'], 3)
+        self.assertContains(response, 'Vinyl Disc: 1')
+        self.assertEqual(len(response.context['recent_records']), 3)
+
+
 class ReviewModelTests(TestCase):
     """
     Test for Review model
@@ -432,6 +770,1484 @@ class ReviewModelTests(TestCase):
         self.assertEqual(self.review.record_fk, self.record)
 
 
+class ReviewAggregateTests(TestCase):
+    """
+    Tests for review aggregates stored on record
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.record = create_record(_user = self.user, _label = self.label)
+
+    def reload(self):
+        return Record.objects.get(pk = self.record.pk)
+
+    def test_review_create(self):
+        """
+        Creating reviews should update count, sum and histogram
+        """
+        create_review(_user = self.user, _record = self.record, _score = 3)
+        create_review(_user = self.user, _record = self.record, _score = 5)
+        record = self.reload()
+        self.assertEqual(record.review_count, 2)
+        self.assertEqual(record.score_sum, 8)
+        self.assertEqual(record.get_avg_score(), 4.0)
+        self.assertEqual(record.get_score_distribution(),
+                         [(0, 0), (1, 0), (2, 0), (3, 1), (4, 0), (5, 1)])
+
+    def test_review_edit(self):
+        """
+        Changing score should move review between histogram buckets
+        """
+        review = create_review(_user = self.user, _record = self.record,
+                               _score = 1)
+        review = Review.objects.get(pk = review.pk)
+        review.score = 4
+        review.save()
+        record = self.reload()
+        self.assertEqual(record.review_count, 1)
+        self.assertEqual(record.score_sum, 4)
+        self.assertEqual(record.score_1, 0)
+        self.assertEqual(record.score_4, 1)
+
+    def test_review_moved_to_other_record(self):
+        """
+        Both records should be updated when review changes its record
+        """
+        other = create_record(_user = self.user, _label = self.label,
+                              _title = 'Other')
+        review = create_review(_user = self.user, _record = self.record,
+                               _score = 2)
+        review.record_fk = other
+        review.save()
+        self.assertEqual(self.reload().review_count, 0)
+        self.assertEqual(Record.objects.get(pk = other.pk).score_2, 1)
+
+    def test_review_delete(self):
+        """
+        Deleted review should be removed from aggregates
+        """
+        review = create_review(_user = self.user, _record = self.record,
+                               _score = 2)
+        create_review(_user = self.user, _record = self.record, _score = 4)
+        review.delete()
+        record = self.reload()
+        self.assertEqual(record.review_count, 1)
+        self.assertEqual(record.score_sum, 4)
+        self.assertEqual(record.score_2, 0)
+
+    def test_stale_record_save(self):
+        """
+        Saving a record loaded before reviews and tracks were added should
+        keep their aggregates
+        """
+        stale = self.reload()
+        create_review(_user = self.user, _record = self.record, _score = 4)
+        create_track(_user = self.user, _record = self.record, _feat = [])
+        stale.title = 'Renamed'
+        stale.save()
+        record = self.reload()
+        self.assertEqual(record.title, 'Renamed')
+        self.assertEqual(record.review_count, 1)
+        self.assertEqual(record.score_4, 1)
+        self.assertEqual(record.track_count, 1)
+        self.assertEqual(record.runtime_seconds, 195)
+
+    def test_avg_score_without_queries(self):
+        """
+        Average score and distribution should not hit the database
+        """
+        create_review(_user = self.user, _record = self.record, _score = 3)
+        record = self.reload()
+        with self.assertNumQueries(0):
+            record.get_avg_score()
+            record.get_score_distribution()
+
+    def test_rebuild_command(self):
+        """
+        Command should repair broken aggregates of all records
+        """
+        create_review(_user = self.user, _record = self.record, _score = 5)
+        create_review(_user = self.user, _record = self.record, _score = 0)
+        other = create_record(_user = self.user, _label = self.label,
+                              _title = 'Other')
+        Record.objects.update(review_count = 7, score_sum = 1, score_5 = 3)
+        RecordSummary.objects.update(review_count = 7, score_sum = 1)
+        call_command('rebuild_review_aggregates', batch_size = 1,
+                     stdout = StringIO())
+        summary = RecordSummary.objects.get(record = self.record)
+        self.assertEqual((summary.review_count, summary.score_sum), (2, 5))
+        self.assertEqual(RecordSummary.objects.get(record = other).
+                         review_count, 0)
+        record = self.reload()
+        self.assertEqual(record.review_count, 2)
+        self.assertEqual(record.score_sum, 5)
+        self.assertEqual(record.score_0, 1)
+        self.assertEqual(record.score_5, 1)
+        other = Record.objects.get(pk = other.pk)
+        self.assertEqual(other.review_count, 0)
+        self.assertEqual(other.score_5, 0)
+
+
+class ReviewLikeTests(TestCase):
+    """
+    Likes of reviews
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.fan = create_user(_username = 'fan')
+        self.label = create_label(_user = self.user)
+        self.record = create_record(_user = self.user, _label = self.label)
+        self.review = create_review(_user = self.user, _record = self.record)
+
+    def likes(self):
+        return Review.objects.get(pk = self.review.pk).like_counter
+
+    def test_failed_counter_update_keeps_no_reaction(self):
+        """
+        Reaction should be rolled back with a failed counter update
+        """
+        self.assertTrue(self.review.like(self.user))
+        with mock.patch.object(Review, 'add_likes',
+                               side_effect = RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.review.like(self.fan)
+            with self.assertRaises(RuntimeError):
+                self.review.unlike(self.user)
+        self.assertEqual(ReviewReaction.objects.count(), 1)
+        self.assertEqual(self.likes(), 1)
+
+    def test_like_once(self):
+        self.assertTrue(self.review.like(self.fan))
+        self.assertFalse(self.review.like(self.fan))
+        self.assertTrue(self.review.like(self.user))
+        self.assertEqual(self.likes(), 2)
+        self.assertEqual(ReviewReaction.objects.count(), 2)
+
+    def test_unlike(self):
+        self.review.like(self.fan)
+        self.assertTrue(self.review.unlike(self.fan))
+        self.assertFalse(self.review.unlike(self.fan))
+        self.assertEqual(self.likes(), 0)
+
+    def test_single_update(self):
+        """
+        Counter should change with one UPDATE and no reload
+        """
+        self.review.like(self.fan)
+        with CaptureQueriesContext(connection) as queries:
+            self.review.like(self.user)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"like_counter" + 1', updates[0])
+        self.assertFalse([q for q in queries
+                          if q['sql'].startswith('SELECT')])
+
+    def test_stale_save_keeps_likes(self):
+        """
+        Saving a review loaded before a like should not lose it
+        """
+        stale = Review.objects.get(pk = self.review.pk)
+        self.review.like(self.fan)
+        stale.review_text = 'edited'
+        stale.save()
+        self.assertEqual(self.likes(), 1)
+        self.assertEqual(Review.objects.get(pk = self.review.pk).review_text,
+                         'edited')
+
+    def test_related_reviews_by_likes(self):
+        other = create_review(_user = self.fan, _record = self.record)
+        other.like(self.user)
+        reviews = self.record.get_related_reviews(AnonymousUser(),
+                                                  by_likes = True)
+        self.assertEqual([r.pk for r in reviews], [other.pk, self.review.pk])
+
+
+class SimilarRecordTests(TestCase):
+    """
+    Precomputed similar records
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.fan = create_user(_username = 'fan')
+        self.label = create_label(_user = self.user)
+        self.band = create_band(_user = self.user)
+        self.genre = create_genre(_user = self.user)
+        self.a = create_record(_user = self.user, _label = self.label,
+                               _title = 'A', _bands = [self.band],
+                               _genres = [self.genre])
+        self.b = create_record(_user = self.user, _label = self.label,
+                               _title = 'B', _bands = [self.band],
+                               _genres = [self.genre])
+        self.c = create_record(_user = self.user, _label = self.label,
+                               _title = 'C', _genres = [self.genre])
+        self.d = create_record(_user = self.user, _label = self.label,
+                               _title = 'D')
+        create_review(_user = self.fan, _record = self.a)
+        create_review(_user = self.fan, _record = self.c)
+
+    def compute(self, *args):
+        out = StringIO()
+        call_command('compute_similar_records', *args, stdout = out)
+        return out.getvalue()
+
+    def titles(self, record, **kwargs):
+        return [r.title for r in record.get_similar_records(**kwargs)]
+
+    def test_shared_band_weighs_most(self):
+        self.compute()
+        self.assertEqual(self.titles(self.a), ['B', 'C'])
+        self.assertEqual(self.titles(self.c), ['A', 'B'])
+        self.assertEqual(self.titles(self.d), [])
+        score = SimilarRecord.objects.get(record_fk = self.a,
+                                          similar_fk = self.b).score
+        self.assertAlmostEqual(score, 5 / (6 ** 0.5 * 5 ** 0.5))
+
+    def test_top_k(self):
+        self.compute('--top-k', '1')
+        self.assertEqual(self.titles(self.a), ['B'])
+        self.assertEqual(self.titles(self.a, limit = 5), ['B'])
+
+    def test_featured_artists(self):
+        create_track(_user = self.user, _record = self.d, _feat = [self.band])
+        self.compute()
+        # B has fewer other features than A, so it's closer
+        self.assertEqual(self.titles(self.d), ['B', 'A'])
+
+    def test_normalized_rows(self):
+        record_ids = np.array(sorted(Record.objects.values_list('pk',
+                                                                flat = True)))
+        matrix = similarity.feature_matrix(record_ids,
+                                           similarity.feature_pairs())
+        norms = np.asarray(matrix.multiply(matrix).sum(axis = 1)).ravel()
+        self.assertEqual([round(n, 6) for n in norms], [1, 1, 1, 0])
+
+    def test_incremental_refresh(self):
+        """
+        Rerun should only recompute changed records and their neighbours
+        """
+        self.compute()
+        SimilarRecord.objects.update(modify_date = timezone.now())
+        create_review(_user = self.fan, _record = self.d)
+        out = self.compute()
+        # d changed, a and c share its new reviewer and may list it now
+        self.assertIn('1 records changed', out)
+        self.assertIn('Done: 3 records', out)
+        self.assertEqual(self.titles(self.d), ['C', 'A'])
+        self.assertEqual(self.titles(self.c), ['D', 'A', 'B'])
+
+    def test_incremental_new_neighbour_of_full_record(self):
+        """
+        Record listing top_k neighbours should take a changed record
+        scoring above its lowest one, and keep them otherwise
+        """
+        self.compute('--top-k', '1')
+        self.assertEqual(self.titles(self.c), ['A'])
+        twin = create_record(_user = self.user, _label = self.label,
+                             _title = 'Twin', _genres = [self.genre])
+        create_review(_user = self.fan, _record = twin)
+        out = self.compute('--top-k', '1')
+        self.assertEqual(self.titles(self.c), ['Twin'])
+        self.assertEqual(self.titles(self.b), ['A'])
+        # a and b score lower with twin than with their neighbour
+        self.assertIn('Done: 2 records', out)
+
+    def test_incremental_relations_and_deletes(self):
+        """
+        Rerun should see genre changes and deleted reviews, and leave
+        records without neighbours alone once computed
+        """
+        self.compute()
+        self.assertIn('0 records changed', self.compute())
+        self.c.genres.remove(self.genre)
+        self.compute()
+        self.assertEqual(self.titles(self.b), ['A'])
+        Review.objects.filter(record_fk = self.c).delete()
+        self.compute()
+        self.assertEqual(self.titles(self.a), ['B'])
+        self.assertEqual(self.titles(self.c), [])
+
+    def test_one_query(self):
+        self.compute()
+        with self.assertNumQueries(1):
+            self.titles(self.a)
+
+
+class RecommendedRecordTests(TestCase):
+    """
+    Recommendations from factorized review scores
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.fans = [create_user(_username = 'fan%d' % i) for i in range(3)]
+        label = create_label(_user = self.user)
+        self.records = dict((title, create_record(_user = self.user,
+                                                  _label = label,
+                                                  _title = title))
+                            for title in 'ABCD')
+        scores = [{'A': 5, 'B': 5},
+                  {'A': 5, 'B': 5, 'C': 5},
+                  {'A': 1, 'B': 1, 'D': 5}]
+        for fan, fan_scores in zip(self.fans, scores):
+            for title, score in fan_scores.items():
+                create_review(_user = fan, _record = self.records[title],
+                              _score = score)
+
+    def compute(self, *args):
+        out = StringIO()
+        call_command('compute_recommendations', *args, stdout = out)
+        return out.getvalue()
+
+    def titles(self, user):
+        return [r.record_fk.title for r in RecommendedRecord.for_user(user)]
+
+    def test_similar_users_records_first(self):
+        output = self.compute('--factors', '2')
+        self.assertEqual(self.titles(self.fans[0]), ['C', 'D'])
+        self.assertEqual(self.titles(self.fans[1]), ['D'])
+        self.assertIn('Done: 4 recommendations', output)
+        self.assertIn('iteration 10', output)
+
+    def test_owned_records_not_recommended(self):
+        create_ownedrecord(_user = self.fans[0], _record = self.records['C'])
+        self.compute('--factors', '2', '--top-n', '1')
+        self.assertEqual(self.titles(self.fans[0]), ['D'])
+
+    def test_factorize_recovers_low_rank_scores(self):
+        users = np.array([1, 2, 3, 4], dtype = np.float64)
+        records = np.array([1, 0.5, 0.25], dtype = np.float64)
+        scores = np.outer(users, records)
+        ratings = recommendations.Ratings(np.repeat(np.arange(4), 3),
+                                          np.tile(np.arange(3), 4),
+                                          scores.ravel())
+        u, r, mean = recommendations.factorize(ratings.matrix, factors = 2,
+                                               regularization = 1e-6,
+                                               iterations = 20,
+                                               chunk_size = 3)
+        self.assertLess(recommendations.rmse(u, r, mean, ratings.matrix),
+                        1e-3)
+
+    def test_top_unseen_in_blocks(self):
+        """
+        Scoring records in small blocks should rank them as scoring all
+        records at once
+        """
+        random = np.random.RandomState(0)
+        users = random.normal(size = (7, 3))
+        records = random.normal(size = (11, 3))
+        seen = recommendations.sparse.random(7, 11, density = 0.3,
+                                             random_state = random,
+                                             format = 'csr')
+        def ranked(chunk_size):
+            return [(row, list(columns)) for row, columns, scores in
+                    recommendations.top_unseen(users, records, 0.0, seen, 4,
+                                               chunk_size)]
+        self.assertEqual(ranked(2), ranked(100))
+        self.assertTrue(all(len(columns) == 4 for row, columns in ranked(2)))
+
+    def test_for_user_one_query(self):
+        self.compute()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(RecommendedRecord.for_user(
+                self.fans[0]))), 2)
+        self.assertEqual(RecommendedRecord.for_user(AnonymousUser()), [])
+
+    def test_user_panel(self):
+        self.compute()
+        c = Client()
+        c.force_login(self.fans[0])
+        response = c.get(reverse('music:userPanel'))
+        self.assertEqual(len(response.context['recommended_records']), 2)
+        self.assertContains(response, reverse('music:record',
+                                              args = (self.records['C'].slug,)))
+
+    def test_evaluate(self):
+        out = StringIO()
+        call_command('evaluate_recommendations', '--test-fraction', '0.3',
+                     '--k', '2', stdout = out)
+        output = out.getvalue()
+        self.assertIn('RMSE: ', output)
+        self.assertIn('Precision@2: ', output)
+        self.assertIn('evaluate', output)
+        self.assertEqual(RecommendedRecord.objects.count(), 0)
+
+
+class ImportCatalogueTests(TestCase):
+    """
+    Bulk import of catalogue dumps
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.band = create_band(_user = self.user, _name = 'Known')
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.dir):
+            os.remove(os.path.join(self.dir, name))
+        os.rmdir(self.dir)
+
+    def dump(self, name, lines):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as stream:
+            stream.write('\n'.join(lines) + '\n')
+        return path
+
+    def entry(self, title, **fields):
+        entry = {'title': title, 'release_date': '2001-02-03',
+                 'label': 'Lab', 'bands': ['Known'], 'genres': ['Rock']}
+        entry.update(fields)
+        return json.dumps(entry)
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_catalogue', path, '--user', 'tester', *args,
+                     stdout = out)
+        return out.getvalue()
+
+    def test_ndjson_import(self):
+        path = self.dump('dump.ndjson', [
+            self.entry('First', tracks = [
+                {'number': 1, 'name': 'Intro', 'length': '00:01:10',
+                 'feat': ['Guest']}]),
+            self.entry('Second', bands = ['Known', 'New']),
+        ])
+        out = self.run_import(path, '--batch-size', '1')
+        self.assertIn('rows/s', out)
+        first = Record.objects.get(title = 'First')
+        self.assertEqual(first.slug, 'first')
+        self.assertEqual(first.label_fk.name, 'Lab')
+        self.assertEqual([b.pk for b in first.bands.all()], [self.band.pk])
+        self.assertEqual([g.name for g in first.genres.all()], ['Rock'])
+        track = first.track_set.get()
+        self.assertEqual(track.length, datetime.time(0, 1, 10))
+        self.assertEqual([b.name for b in track.feat.all()], ['Guest'])
+        self.assertEqual(Band.objects.filter(name = 'Known').count(), 1)
+        self.assertEqual(Genre.objects.filter(name = 'Rock').count(), 1)
+        self.assertEqual(RowCount.get_count(Record), 2)
+        self.assertEqual(RowCount.get_count(Band), 3)
+        self.assertEqual([d.title for d in search.search('intro')], ['Intro'])
+
+    def test_tracks_without_features(self):
+        path = self.dump('dump.ndjson', [self.entry('First', tracks = [
+            {'number': 2, 'name': 'B', 'length': '00:02:00'},
+            {'number': 1, 'name': 'A', 'length': '00:01:00'}])])
+        self.run_import(path)
+        record = Record.objects.get()
+        self.assertEqual([t.name for t in record.track_set.all()], ['A', 'B'])
+        self.assertEqual(record.track_set.get(name = 'A').slug, 'a')
+
+    def test_csv_import(self):
+        path = self.dump('dump.csv', [
+            'title,release_date,label,bands,genres',
+            'Csv Record,1999-01-01,Lab,Known|Other,Jazz'])
+        self.run_import(path)
+        record = Record.objects.get()
+        self.assertEqual(sorted(b.name for b in record.bands.all()),
+                         ['Known', 'Other'])
+
+    def test_resume_from_checkpoint(self):
+        """
+        Rerun should skip records imported before
+        """
+        path = self.dump('dump.ndjson', [self.entry('r%d' % i)
+                                         for i in range(3)])
+        checkpoint = os.path.join(self.dir, 'checkpoint')
+        with open(checkpoint, 'w') as stream:
+            json.dump({'path': os.path.abspath(path), 'done': 2}, stream)
+        out = self.run_import(path, '--checkpoint', checkpoint)
+        self.assertIn('Resuming after 2 records', out)
+        self.assertEqual([r.title for r in Record.objects.all()], ['r2'])
+        with open(checkpoint) as stream:
+            self.assertEqual(json.load(stream)['done'], 3)
+        self.run_import(path, '--checkpoint', checkpoint)
+        self.assertEqual(Record.objects.count(), 1)
+
+
+    def test_batches_counted_without_finish(self):
+        """
+        Records of a batch should be counted with the batch, an import
+        interrupted before its end keeps the row count right
+        """
+        RowCount.get_count(Record)
+        importer = CatalogueImporter(self.user)
+        importer.import_batch([json.loads(self.entry('r%d' % i))
+                               for i in range(3)])
+        self.assertEqual(RowCount.get_count(Record), 3)
+        self.assertEqual(RowCount.get_count(Record), Record.objects.count())
+
+class ThumbnailTests(TestCase):
+    """
+    Thumbnails of label images
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT = self.dir, MUSIC_THUMBNAIL_SIZES = (150, 300, 1000),
+            MUSIC_THUMBNAIL_WORKERS = 0)
+        self.settings_override.enable()
+        self.label = create_label(_user = self.user)
+        self.label.image = self.upload('cover.png', 800, 400)
+        self.label.save()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.dir)
+
+    def upload(self, name, width, height, image_format = 'PNG'):
+        content = io.BytesIO()
+        Image.new('RGB', (width, height), 'red').save(content, image_format)
+        return SimpleUploadedFile(name, content.getvalue())
+
+    def expected(self, extension):
+        suffixes = ['150w.' + extension, '300w.' + extension]
+        if thumbnails.webp_supported():
+            suffixes.extend(['150w.webp', '300w.webp'])
+        return suffixes
+
+    def test_render(self):
+        thumbnails.schedule(Label, 'image', self.label.image.name)
+        self.label.refresh_from_db()
+        self.assertEqual(sorted(self.label.image_thumbnails.split(',')),
+                         sorted(self.expected('png')))
+        path = os.path.join(self.dir, thumbnails.thumbnail_name(
+            self.label.image.name, '150w.png'))
+        with Image.open(path) as thumbnail:
+            self.assertEqual(thumbnail.size, (150, 75))
+
+    def test_replaced_image_forgets_thumbnails(self):
+        thumbnails.schedule(Label, 'image', self.label.image.name)
+        self.label.refresh_from_db()
+        self.label.image = self.upload('other.jpg', 100, 100, 'JPEG')
+        self.label.save()
+        self.label.refresh_from_db()
+        self.assertEqual(self.label.image_thumbnails, '')
+
+    def test_replaced_thumbnails_deleted(self):
+        thumbnails.schedule(Label, 'image', self.label.image.name)
+        self.label.refresh_from_db()
+        name, suffixes = self.label.image.name, self.label.image_thumbnails
+        path = os.path.join(self.dir, thumbnails.thumbnail_name(name,
+                                                                '150w.png'))
+        sharing = create_label(_user = self.user, _name = 'Sharing')
+        sharing.image = name
+        sharing.save()
+        self.label.image = self.upload('other.jpg', 100, 100, 'JPEG')
+        self.label.save()
+        self.assertEqual(self.label._replaced_images,
+                         [('image', name, suffixes)])
+        thumbnails.delete_unused(Label, 'image', name, suffixes)
+        self.assertTrue(os.path.exists(path))
+        sharing.delete()
+        thumbnails.delete_unused(Label, 'image', name, suffixes)
+        self.assertFalse(os.path.exists(path))
+
+    def test_left_to_command_with_workers(self):
+        label = create_label(_user = self.user, _name = 'Other')
+        label.image = self.upload('photo.jpg', 400, 400, 'JPEG')
+        label.save()
+        with self.settings(MUSIC_THUMBNAIL_WORKERS = 2):
+            thumbnails.schedule(Label, 'image', label.image.name)
+        label.refresh_from_db()
+        self.assertEqual(label.image_thumbnails, '')
+        call_command('render_thumbnails', stdout = StringIO())
+        label.refresh_from_db()
+        self.assertEqual(sorted(label.image_thumbnails.split(',')),
+                         sorted(self.expected('jpg')))
+
+    def test_backfill_in_worker_processes(self):
+        label = create_label(_user = self.user, _name = 'Other')
+        label.image = self.upload('photo.jpg', 400, 400, 'JPEG')
+        label.save()
+        out = StringIO()
+        call_command('render_thumbnails', '--workers', '2', stdout = out)
+        self.assertIn('Rendered thumbnails of 2 images', out.getvalue())
+        label.refresh_from_db()
+        self.assertEqual(sorted(label.image_thumbnails.split(',')),
+                         sorted(self.expected('jpg')))
+        out = StringIO()
+        call_command('render_thumbnails', '--workers', '0', stdout = out)
+        self.assertIn('Rendered thumbnails of 0 images', out.getvalue())
+
+    def test_interval_keeps_rendering(self):
+        """
+        Worker process run with --interval should pick new images up
+        """
+        out = StringIO()
+        with mock.patch('music.management.commands.render_thumbnails.'
+                        'time.sleep', side_effect = [None, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('render_thumbnails', '--interval', '60',
+                             '--workers', '0', stdout = out)
+        self.assertEqual(out.getvalue().count('Rendered thumbnails'), 2)
+
+    def test_template_tag(self):
+        template = Template('{% load music_extras %}'
+                            '{% responsive_image label.image alt="A" %}')
+        html = template.render(Context({'label': self.label}))
+        url = '/media/' + os.path.splitext(self.label.image.name)[0]
+        self.assertNotIn('srcset', html)
+        self.assertIn('src="%s.png"' % url, html)
+        thumbnails.schedule(Label, 'image', self.label.image.name)
+        self.label.refresh_from_db()
+        html = template.render(Context({'label': self.label}))
+        self.assertIn('srcset="%s.150w.png 150w, %s.300w.png 300w"' %
+                      (url, url), html)
+
+
+class MediaTests(TestCase):
+    """
+    Content-addressed media storage and serving
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT = self.dir, MUSIC_THUMBNAIL_WORKERS = 0)
+        self.settings_override.enable()
+        self.c = Client()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.dir)
+
+    def store(self, name, content):
+        label = create_label(_user = self.user, _name = name)
+        label.image = SimpleUploadedFile(name, content)
+        label.save()
+        return label.image.name
+
+    def test_names_by_content(self):
+        first = self.store('a.PNG', b'same')
+        self.assertEqual(first, 'labels/%s.png' %
+                         hashlib.sha256(b'same').hexdigest())
+        self.assertEqual(self.store('b.png', b'same'), first)
+        self.assertNotEqual(self.store('c.png', b'other'), first)
+        self.assertEqual(len(os.listdir(os.path.join(self.dir, 'labels'))),
+                         2)
+
+    def test_serve(self):
+        name = self.store('a.txt', b'0123456789')
+        url = reverse('media', args = (name,))
+        response = self.c.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.c.get(url, HTTP_IF_NONE_MATCH = response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.c.get(url + 'x').status_code, 404)
+        self.assertEqual(self.c.get(reverse(
+            'media', args = ('../secret',))).status_code, 404)
+
+    def test_concurrent_identical_uploads(self):
+        """
+        Upload finding its file written meanwhile should keep that name
+        """
+        storage = ContentHashStorage(location = self.dir)
+        name = storage.save('labels/a.txt', ContentFile(b'same'))
+        with mock.patch.object(storage, 'exists', return_value = False):
+            self.assertEqual(
+                storage.save('labels/b.txt', ContentFile(b'same')), name)
+        self.assertEqual(os.listdir(os.path.join(self.dir, 'labels')),
+                         [os.path.basename(name)])
+
+    def test_missing_file_with_etag(self):
+        name = self.store('a.txt', b'0123456789')
+        url = reverse('media', args = (name,))
+        etag = self.c.get(url)['ETag']
+        os.remove(os.path.join(self.dir, name))
+        self.assertEqual(self.c.get(url, HTTP_IF_NONE_MATCH = etag).
+                         status_code, 404)
+
+    def test_unhashed_name(self):
+        os.makedirs(os.path.join(self.dir, 'labels'))
+        with open(os.path.join(self.dir, 'labels', 'old.txt'), 'wb') as old:
+            old.write(b'legacy')
+        response = self.c.get(reverse('media', args = ('labels/old.txt',)))
+        self.assertEqual(b''.join(response.streaming_content), b'legacy')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_range(self):
+        url = reverse('media', args = (self.store('a.txt', b'0123456789'),))
+        response = self.c.get(url, HTTP_RANGE = 'bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        response = self.c.get(url, HTTP_RANGE = 'bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.c.get(url, HTTP_RANGE = 'bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_accel(self):
+        name = self.store('a.txt', b'0123456789')
+        with self.settings(MUSIC_MEDIA_ACCEL = 'nginx'):
+            response = self.c.get(reverse('media', args = (name,)))
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/' + name)
+        self.assertEqual(response.content, b'')
+
+
+class SearchTests(TestCase):
+    """
+    Tests for full-text catalogue search
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user, _name = 'Top Dawg',
+                                  _city = 'Carson')
+        self.band = create_band(_user = self.user, _name = 'Kendrick Lamar',
+                                _origin = 'Compton')
+        self.genre = create_genre(_user = self.user, _name = 'Hip hop',
+                                  _description = 'Music from Compton')
+        self.record = create_record(_user = self.user, _label = self.label,
+                                    _title = 'DAMN', _bands = [self.band])
+        self.track = create_track(_user = self.user, _record = self.record,
+                                  _feat = [], _name = 'HUMBLE')
+
+    def kinds(self, query):
+        return [(doc.kind, doc.title) for doc in search.search(query)]
+
+    def test_every_model_is_searchable(self):
+        self.assertEqual(self.kinds('kendr'), [('band', 'Kendrick Lamar')])
+        self.assertEqual(self.kinds('damn'),
+                         [('record', 'DAMN'), ('track', 'HUMBLE')])
+        self.assertEqual(self.kinds('humble'), [('track', 'HUMBLE')])
+        self.assertEqual(self.kinds('dawg'), [('label', 'Top Dawg')])
+        self.assertEqual(self.kinds('hip'), [('genre', 'Hip hop')])
+
+    def test_title_ranks_above_body(self):
+        """
+        Band named after the query should rank above other descriptions
+        """
+        create_band(_user = self.user, _name = 'Compton')
+        self.assertEqual(self.kinds('compton')[0], ('band', 'Compton'))
+        self.assertEqual(len(self.kinds('compton')), 3)
+
+    def test_document_follows_saves_and_deletes(self):
+        self.band.name = 'Kung Fu Kenny'
+        self.band.save()
+        self.assertEqual(self.kinds('kendrick'), [])
+        self.assertEqual(self.kinds('kung kenny'),
+                         [('band', 'Kung Fu Kenny')])
+        self.record.title = 'Kung Fu'
+        self.record.slug = 'kung-fu'
+        self.record.save()
+        document = SearchDocument.objects.get(kind = 'track',
+                                              object_id = self.track.pk)
+        self.assertEqual((document.body, document.slug), ('Kung Fu',
+                                                          'kung-fu'))
+        self.track.delete()
+        self.assertEqual(self.kinds('humble'), [])
+
+    def test_search_syntax_is_ignored(self):
+        self.assertEqual(self.kinds('"dawg* OR'), [])
+        self.assertEqual(self.kinds('top" dawg'), [('label', 'Top Dawg')])
+        self.assertEqual(self.kinds('***'), [])
+
+    def test_rebuild_command(self):
+        SearchDocument.objects.all().delete()
+        SearchDocument.objects.create(kind = 'band', object_id = 999,
+                                      title = 'ghost', slug = 'ghost')
+        call_command('rebuild_search_index', stdout = StringIO())
+        self.assertEqual(SearchDocument.objects.count(), 5)
+        self.assertEqual(self.kinds('humble'), [('track', 'HUMBLE')])
+
+    def test_search_view(self):
+        response = Client().get(reverse('music:search'), {'q': 'humble'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('music:record',
+                                              args = (self.record.slug,)))
+
+    def test_search_api(self):
+        response = Client().get(reverse('api-music:search'), {'q': 'kendrick'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['kind'], 'band')
+        self.assertEqual(response.data[0]['url'],
+                         reverse('music:band', args = (self.band.slug,)))
+
+
+class PrefixIndexTests(TestCase):
+    """
+    Tests for in-memory typeahead prefix index
+    """
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.build([
+            ('band', 1, 'Kendrick Lamar', 'kendrick-lamar', 5),
+            ('band', 2, 'Kenny Beats', 'kenny-beats', 9),
+            ('record', 1, 'Good Kid', 'good-kid', 2),
+            ('label', 1, u'Kéno Records', 'keno-records', 1),
+        ])
+
+    def test_prefix_ranked_by_popularity(self):
+        self.assertEqual(self.index.lookup('ken'), [
+            ('band', 'Kenny Beats', 'kenny-beats'),
+            ('band', 'Kendrick Lamar', 'kendrick-lamar'),
+            ('label', u'Kéno Records', 'keno-records'),
+        ])
+
+    def test_word_prefix_and_accents(self):
+        self.assertEqual(self.index.lookup('LAM'),
+                         [('band', 'Kendrick Lamar', 'kendrick-lamar')])
+        self.assertEqual(self.index.lookup('keno'),
+                         [('label', u'Kéno Records', 'keno-records')])
+        self.assertEqual(self.index.lookup('k', limit = 1),
+                         [('band', 'Kenny Beats', 'kenny-beats')])
+
+    def test_add_and_remove(self):
+        self.index.add('band', 1, 'Kung Fu Kenny', 'kung-fu-kenny', 5)
+        self.assertEqual(self.index.lookup('kendrick'), [])
+        self.assertEqual(self.index.lookup('kenny'), [
+            ('band', 'Kenny Beats', 'kenny-beats'),
+            ('band', 'Kung Fu Kenny', 'kung-fu-kenny'),
+        ])
+        self.index.remove('band', 2)
+        self.assertEqual(self.index.lookup('kenny'),
+                         [('band', 'Kung Fu Kenny', 'kung-fu-kenny')])
+        self.assertEqual(sorted(self.index.keys), self.index.keys)
+
+    def test_batch_update(self):
+        keys = list(self.index.keys)
+        self.index.update([
+            ('record', 1, 'Good Kid', 'good-kid', 10),
+            ('band', 2, 'Beats', 'beats', 9),
+            ('band', 3, 'Kenzo', 'kenzo', 0),
+        ])
+        self.assertEqual(self.index.lookup('k'), [
+            ('record', 'Good Kid', 'good-kid'),
+            ('band', 'Kendrick Lamar', 'kendrick-lamar'),
+            ('label', u'Kéno Records', 'keno-records'),
+            ('band', 'Kenzo', 'kenzo'),
+        ])
+        self.assertEqual(sorted(self.index.keys), self.index.keys)
+        # Kenzo adds a key, Beats loses one of Kenny Beats
+        self.assertEqual(len(self.index.keys), len(keys))
+
+    def test_memory_is_reported(self):
+        self.assertTrue(self.index.memory_bytes() > 0)
+
+
+class TypeaheadTests(TestCase):
+    """
+    Tests for typeahead built from the catalogue
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user, _name = 'Top Dawg')
+        self.band = create_band(_user = self.user, _name = 'Kendrick Lamar')
+        self.record = create_record(_user = self.user, _label = self.label,
+                                    _title = 'Kendrick Live',
+                                    _bands = [self.band])
+        typeahead.build()
+
+    def test_popularity_from_catalogue(self):
+        """
+        Band with a record should rank above the unreviewed record
+        """
+        self.assertEqual(typeahead.lookup('kendrick'), [
+            ('band', 'Kendrick Lamar', self.band.slug),
+            ('record', 'Kendrick Live', self.record.slug),
+        ])
+
+    def test_incremental_refresh(self):
+        """
+        Refresh should pick objects modified since the last build
+        """
+        index = Typeahead()
+        index.build()
+        create_band(_user = self.user, _name = 'Kendrick Tribute')
+        self.band.name = 'K-Dot'
+        self.band.save()
+        index.refresh()
+        self.assertEqual([name for kind, name, slug in index.lookup('k')],
+                         ['K-Dot', 'Kendrick Live', 'Kendrick Tribute'])
+
+    def test_refresh_follows_reviews(self):
+        """
+        Review counted into record popularity should be seen by refresh
+        """
+        other = create_record(_user = self.user, _label = self.label,
+                              _title = 'Kendrick Covers')
+        index = Typeahead()
+        index.build()
+        create_review(_user = self.user, _record = other)
+        index.refresh()
+        self.assertEqual([name for kind, name, slug in
+                          index.lookup('kendrick')],
+                         ['Kendrick Covers', 'Kendrick Lamar',
+                          'Kendrick Live'])
+
+    def test_rebuild_in_background(self):
+        """
+        Due rebuild should run in a thread, lookups being served from the
+        previous index until the new one is swapped in
+        """
+        index = Typeahead()
+        index.build()
+        create_band(_user = self.user, _name = 'Kendrick Tribute')
+        index.built_at -= settings.MUSIC_TYPEAHEAD_REBUILD + 1
+        index.refreshed_at = time.time()
+        with mock.patch('music.typeahead.threading.Thread') as thread:
+            self.assertEqual(len(index.lookup('kendrick')), 2)
+            index.lookup('kendrick')
+        self.assertEqual(thread.call_count, 1)
+        self.assertTrue(index.rebuilding)
+        with mock.patch('music.typeahead.connections.close_all'):
+            thread.call_args[1]['target']()
+        self.assertFalse(index.rebuilding)
+        self.assertEqual(len(index.lookup('kendrick')), 3)
+
+    def test_typeahead_api(self):
+        response = Client().get(reverse('api-music:typeahead'),
+                                {'q': 'top'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'kind': 'label', 'name': 'Top Dawg', 'slug': self.label.slug}])
+        response = Client().get(reverse('api-music:typeahead_stats'))
+        self.assertEqual(response.data['entries'], 3)
+        self.assertTrue(response.data['memory_bytes'] > 0)
+
+
+##-----------------------Query Plan Tests
+
+def explain(queryset):
+    """
+    Return query plan of a queryset as a list of lines
+    """
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == 'postgresql':
+        sql = 'EXPLAIN ' + sql
+    else:
+        sql = 'EXPLAIN QUERY PLAN ' + sql
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [' '.join(str(column) for column in row)
+                for row in cursor.fetchall()]
+
+def full_scans(plan):
+    """
+    Return names of tables read with a sequential scan in given plan
+    """
+    if connection.vendor == 'postgresql':
+        pattern = r'Seq Scan on (\w+)'
+    else:
+        pattern = r'SCAN (?:TABLE )?(\w+)(?!.*USING)'
+    return [table for line in plan for table in re.findall(pattern, line)]
+
+def sorts(plan):
+    """
+    Return lines of given plan sorting rows instead of reading them in
+    index order
+    """
+    if connection.vendor == 'postgresql':
+        pattern = r'\bSort\b'
+    else:
+        pattern = r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY'
+    return [line for line in plan if re.search(pattern, line)]
+
+
+class QueryPlanTests(TestCase):
+    """
+    Hot queries should be served by indexes on a seeded database
+    """
+    # tables smaller than this may be scanned, planner is right to do it
+    SCAN_THRESHOLD = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.label = create_label(_user = cls.user)
+        cls.band = create_band(_user = cls.user)
+        users = [create_user(_username = 'u%d' % i) for i in range(10)]
+        Record.objects.bulk_create(
+            Record(title = 'record%d' % i, label_fk = cls.label,
+                   release_date = datetime.date(1950 + i % 60, 1, 1),
+                   create_by = cls.user, modify_by = cls.user)
+            for i in range(1000))
+        records = list(Record.objects.all())
+        Track.objects.bulk_create(
+            Track(record_fk = record, name = 't%d' % i, number = i,
+                  length = '00:03:00', create_by = cls.user,
+                  modify_by = cls.user)
+            for record in records[:200] for i in range(5))
+        Review.objects.bulk_create(
+            Review(record_fk = record, review_text = 'text', score = 3,
+                   create_by = user, modify_by = user)
+            for record in records[:100] for user in users)
+        OwnedRecord.objects.bulk_create(
+            OwnedRecord(record_fk = record, user_fk = user, disc_type = 'cd')
+            for record in records[:100] for user in users)
+        cls.record = records[0]
+        cls.record.bands.add(cls.band)
+        list(summaries.rebuild())
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def assertNoLargeScans(self, queryset):
+        plan = explain(queryset)
+        sizes = dict((model._meta.db_table, model.objects.count())
+                     for model in (Record, Track, Review, OwnedRecord,
+                                   RecordSummary))
+        large = [table for table in full_scans(plan)
+                 if sizes.get(table, 0) > self.SCAN_THRESHOLD]
+        self.assertEqual(large, [], '\n'.join(plan))
+
+    def test_user_review(self):
+        self.assertNoLargeScans(Review.objects.filter(
+            record_fk = self.record, create_by = self.user))
+
+    def test_related_reviews(self):
+        self.assertNoLargeScans(self.record.review_set.all()[0:10])
+
+    def test_recent_owned_records(self):
+        self.assertNoLargeScans(OwnedRecord.objects.filter(
+            purchase_date__lte = timezone.now(), user_fk = self.user)[0:10])
+
+    def test_latest_records(self):
+        self.assertNoLargeScans(Record.objects.all()[0:10])
+
+    def test_records_by_title(self):
+        self.assertNoLargeScans(
+            RecordSummary.objects.order_by('title', 'pk')[0:12])
+
+    def test_record_tracks(self):
+        self.assertNoLargeScans(self.record.track_set.all())
+
+    def test_bands_other_records(self):
+        self.assertNoLargeScans(
+            Record.objects.other_records_of(self.record)[0:10])
+
+    def test_records_keyset_seek(self):
+        paginator = KeysetPaginator(RecordSummary.objects.all(),
+                                    ('title', 'pk'), 12)
+        self.assertNoLargeScans(RecordSummary.objects.filter(
+            paginator.seek([self.record.title, self.record.pk], True)).\
+            order_by('title', 'pk')[0:13])
+
+    def test_reviews_by_likes(self):
+        reviews = self.record.get_related_reviews(AnonymousUser(),
+                                                  by_likes = True)
+        self.assertNoLargeScans(reviews)
+        plan = explain(reviews)
+        self.assertEqual(sorts(plan), [], '\n'.join(plan))
+
+
+##-----------------------API Tests
+
+
+
+class RecordOtherRecordsAPITests(TestCase):
+    """
+    Tests for other records of record's bands API
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.band = create_band(_user = self.user)
+        self.record = create_record(_user = self.user, _label = self.label,
+                                    _bands = [self.band])
+        for i in range(4):
+            create_record(_user = self.user, _label = self.label,
+                          _bands = [self.band], _title = 'r%d' % i,
+                          _release_date = datetime.date(2000 + i, 1, 1))
+        self.c = Client()
+
+    def test_other_records_with_limit(self):
+        """
+        Should return latest other records up to the limit
+        """
+        response = self.c.get(reverse('api-music:record_other',
+                                      args=(self.record.slug,)),
+                              {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['title'] for r in response.data], ['r3', 'r2'])
+
+
+class ListAPIPaginationTests(TestCase):
+    """
+    Cursor pagination of API lists
+    """
+    def setUp(self):
+        self.user = create_user()
+        for name in ['e', 'c', 'a', 'd', 'b']:
+            create_band(_user = self.user, _name = name)
+        self.url = reverse('api-music:band')
+        self.c = Client()
+
+    def walk(self, url):
+        names = []
+        while url:
+            response = self.c.get(url)
+            self.assertEqual(response.status_code, 200)
+            names.append([band['name'] for band in response.data['results']])
+            url = response.data['next']
+        return names, response
+
+    def test_walk_forward_and_back(self):
+        """
+        Next links should visit every band once, previous should go back
+        """
+        names, last = self.walk(self.url + '?page_size=2')
+        self.assertEqual(names, [['a', 'b'], ['c', 'd'], ['e']])
+        response = self.c.get(last.data['previous'])
+        self.assertEqual([band['name'] for band in response.data['results']],
+                         ['c', 'd'])
+        self.assertIsNone(self.c.get(self.url).data['previous'])
+
+    def test_page_size_is_capped(self):
+        with self.settings(MUSIC_API_MAX_PAGE_SIZE = 3):
+            response = self.c.get(self.url, {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_constant_cost(self):
+        """
+        Deep page should cost as much as the first one
+        """
+        first = self.c.get(self.url, {'page_size': 1})
+        cursor = re.search('cursor=([^&]+)', first.data['next']).group(1)
+        with self.assertNumQueries(1):
+            self.c.get(self.url + '?page_size=1&cursor=' + cursor)
+
+    def test_invalid_cursor(self):
+        response = self.c.get(self.url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+        tampered = base64.urlsafe_b64encode(
+            b'{"k": ["x", "abc"], "b": false, "o": ["name", "pk"]}').\
+                decode('ascii')
+        response = self.c.get(self.url, {'cursor': tampered})
+        self.assertEqual(response.status_code, 404)
+
+    def test_records_ordered_by_title(self):
+        label = create_label(_user = self.user)
+        for title in ['y', 'x', 'z']:
+            create_record(_user = self.user, _label = label, _title = title)
+        response = self.c.get(reverse('api-music:record'))
+        self.assertEqual([r['title'] for r in response.data['results']],
+                         ['x', 'y', 'z'])
+
+
+class APIQueryBudgetTests(TestCase):
+    """
+    Number of queries of API views should not grow with the data
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.band = create_band(_user = self.user)
+        self.genre = create_genre(_user = self.user)
+        self.c = Client()
+        self.count = 0
+
+    def grow(self, count):
+        for i in range(self.count, self.count + count):
+            band = create_band(_user = self.user, _name = 'band%d' % i)
+            genre = create_genre(_user = self.user, _name = 'genre%d' % i)
+            create_record(_user = self.user, _label = self.label,
+                          _title = 'record%d' % i,
+                          _bands = [self.band, band],
+                          _genres = [self.genre, genre])
+        self.count += count
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertFlat(self, url):
+        self.grow(2)
+        small = self.count_queries(url)
+        self.grow(8)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_record_list(self):
+        self.assertFlat(reverse('api-music:record'))
+
+    def test_record_detail(self):
+        self.grow(1)
+        url = reverse('api-music:record_detail', args=('record0',))
+        self.assertFlat(url)
+
+    def test_record_other(self):
+        self.grow(1)
+        url = reverse('api-music:record_other', args=('record0',))
+        self.assertFlat(url)
+
+    def test_band_detail(self):
+        self.assertFlat(reverse('api-music:band_detail',
+                                args=(self.band.slug,)))
+
+    def test_label_and_genre_detail(self):
+        self.assertFlat(reverse('api-music:label_detail',
+                                args=(self.label.slug,)))
+        self.assertFlat(reverse('api-music:genre_detail',
+                                args=(self.genre.slug,)))
+
+
+class ExportAPITests(TestCase):
+    """
+    Streaming NDJSON export of the catalogue
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.band = create_band(_user = self.user)
+        self.genre = create_genre(_user = self.user)
+        for i in range(5):
+            record = create_record(_user = self.user, _label = self.label,
+                                   _title = 'record%d' % i,
+                                   _bands = [self.band],
+                                   _genres = [self.genre])
+            for number in (2, 1):
+                create_track(_user = self.user, _record = record, _feat = [],
+                             _number = number, _name = 'track%d' % number)
+        self.url = reverse('api-music:export')
+        self.c = Client()
+
+    def read(self, **headers):
+        response = self.c.get(self.url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_export(self):
+        response, content = self.read()
+        lines = content.decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 5)
+        record = json.loads(lines[0])
+        self.assertEqual(record['title'], 'record0')
+        self.assertEqual(record['label'], 'TestLabel')
+        self.assertEqual(record['bands'], ['sample_band'])
+        self.assertEqual(record['genres'], ['TestGenre'])
+        self.assertEqual([t['name'] for t in record['tracks']],
+                         ['track1', 'track2'])
+        self.assertEqual(record['tracks'][0]['length'], '00:03:15')
+
+    def test_queries_per_chunk(self):
+        """
+        Every chunk should cost the same fixed number of queries
+        """
+        with self.settings(MUSIC_EXPORT_CHUNK_SIZE = 2):
+            response = self.c.get(self.url)
+            with CaptureQueriesContext(connection) as queries:
+                b''.join(response.streaming_content)
+        # 3 chunks of records, bands, genres and tracks, then an empty one
+        self.assertEqual(len(queries), 3 * 4 + 1)
+
+    def test_gzip(self):
+        plain = self.read()[1]
+        response, content = self.read(HTTP_ACCEPT_ENCODING = 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(content), plain)
+        response, content = self.read(HTTP_ACCEPT_ENCODING = 'gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(content, plain)
+
+
+class BulkCreateAPITests(TestCase):
+    """
+    Create endpoints accepting single objects and arrays
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.c = Client()
+        self.c.force_login(self.user)
+        self.url = reverse('api-music:band_create')
+
+    def post(self, data, url = None):
+        return self.c.post(url or self.url, json.dumps(data),
+                           content_type = 'application/json')
+
+    def inserts(self, queries, table):
+        return [q for q in queries
+                if q['sql'].startswith('INSERT INTO "%s"' % table)]
+
+    def test_single_create_inserts_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post({'name': 'Solo', 'origin': 'Here'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.inserts(queries, 'music_band')), 1)
+        self.assertFalse([q for q in queries
+                          if q['sql'].startswith('UPDATE "music_band"')])
+        band = Band.objects.get()
+        self.assertEqual((band.slug, band.create_by, band.modify_by),
+                         ('solo', self.user, self.user))
+
+    def test_bulk_create(self):
+        """
+        Valid items should be written with one INSERT, invalid reported
+        """
+        RowCount.get_count(Band)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post([{'name': 'One', 'origin': 'A'},
+                                  {'origin': 'no name'},
+                                  {'name': 'Two', 'origin': 'B'}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.inserts(queries, 'music_band')), 1)
+        self.assertEqual([b['name'] for b in response.data['created']],
+                         ['One', 'Two'])
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertIn('name', response.data['errors'][0]['errors'])
+        self.assertEqual(sorted(Band.objects.values_list('slug', flat = True)),
+                         ['one', 'two'])
+        self.assertEqual(RowCount.get_count(Band), 2)
+        self.assertEqual([d.title for d in search.search('two')], ['Two'])
+
+    def test_bulk_create_labels_and_genres(self):
+        response = self.post([{'name': 'L1', 'country': 'PL', 'city': 'W',
+                               'website': 'http://l1.pl'}],
+                             reverse('api-music:label_create'))
+        self.assertEqual(response.status_code, 201)
+        response = self.post([{'name': 'G1'}, {'name': 'G2'}],
+                             reverse('api-music:genre_create'))
+        self.assertEqual(len(response.data['created']), 2)
+        self.assertEqual(Label.objects.get().slug, 'l1')
+
+    def test_all_invalid(self):
+        response = self.post([{'origin': 'x'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Band.objects.exists())
+
+    def test_too_many(self):
+        with self.settings(MUSIC_API_MAX_BULK_CREATE = 1):
+            response = self.post([{'name': 'a', 'origin': 'a'}] * 2)
+        self.assertEqual(response.status_code, 400)
+
+
+class ReviewLikeAPITests(TestCase):
+    """
+    Like and unlike endpoint
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.record = create_record(_user = self.user, _label = self.label)
+        self.review = create_review(_user = self.user, _record = self.record)
+        self.url = reverse('api-music:review_like', args=(self.review.pk,))
+        self.c = Client()
+
+    def test_anonymous(self):
+        self.assertEqual(self.c.post(self.url).status_code, 403)
+
+    def test_like_and_unlike(self):
+        self.c.force_login(self.user)
+        self.assertEqual(self.c.post(self.url).data,
+                         {'liked': True, 'changed': True})
+        self.assertEqual(self.c.post(self.url).data,
+                         {'liked': True, 'changed': False})
+        self.assertEqual(Review.objects.get().like_counter, 1)
+        self.assertEqual(self.c.delete(self.url).data,
+                         {'liked': False, 'changed': True})
+        self.assertEqual(Review.objects.get().like_counter, 0)
+
+    def test_like_evicts_record_page(self):
+        record_url = reverse('music:record', args=(self.record.slug,))
+        etag = Client().get(record_url)['ETag']
+        self.c.force_login(self.user)
+        self.c.post(self.url)
+        response = Client().get(record_url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, '(1 likes)')
+
+    def test_missing_review(self):
+        self.c.force_login(self.user)
+        url = reverse('api-music:review_like', args=(self.review.pk + 1,))
+        self.assertEqual(self.c.post(url).status_code, 404)
+
+
+class RecordSimilarAPITests(TestCase):
+    def test_similar_records(self):
+        user = create_user()
+        label = create_label(_user = user)
+        genre = create_genre(_user = user)
+        record = create_record(_user = user, _label = label,
+                               _genres = [genre])
+        create_record(_user = user, _label = label, _title = 'Twin',
+                      _genres = [genre])
+        call_command('compute_similar_records', stdout = StringIO())
+        response = Client().get(reverse('api-music:record_similar',
+                                        args=(record.slug,)))
+        self.assertEqual([r['title'] for r in response.data], ['Twin'])
+
+
+class ConditionalAPITests(TestCase):
+    """
+    Conditional GET of API detail resources
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.genre = create_genre(_user = self.user)
+        self.band = create_band(_user = self.user)
+        self.record = create_record(_user = self.user, _label = self.label,
+                                    _bands = [self.band],
+                                    _genres = [self.genre])
+        self.url = reverse('api-music:record_detail', args=(self.record.slug,))
+        self.c = Client()
+
+    def test_not_modified(self):
+        """
+        Matching ETag should get 304 from validator queries only
+        """
+        response = self.c.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(8):
+            response = self.c.get(self.url,
+                                  HTTP_IF_NONE_MATCH = response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        """
+        Last-Modified should be usable on its own
+        """
+        response = self.c.get(self.url)
+        response = self.c.get(
+            self.url, HTTP_IF_MODIFIED_SINCE = response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_dependent_change(self):
+        """
+        New track or removed band should change the ETag
+        """
+        etag = self.c.get(self.url)['ETag']
+        create_track(_user = self.user, _record = self.record, _feat = [])
+        response = self.c.get(self.url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.record.bands.remove(self.band)
+        response = self.c.get(self.url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_label_and_genre_change(self):
+        """
+        Renamed label or genre, both serialized with the record, should
+        change the ETag
+        """
+        etag = self.c.get(self.url)['ETag']
+        self.label.name = 'NewLabel'
+        self.label.save()
+        response = self.c.get(self.url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'NewLabel')
+        etag = response['ETag']
+        self.genre.name = 'NewGenre'
+        self.genre.save()
+        response = self.c.get(self.url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'NewGenre')
+
+    def test_missing_object(self):
+        response = self.c.get(reverse('api-music:band_detail',
+                                      args=('missing',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
 ##-----------------------View Tests
 
 
@@ -479,6 +2295,65 @@ class RecordListViewTests(TestCase):
 
 
 
+class RecordRuntimeListTests(TestCase):
+    """
+    Sorting and filtering record lists by runtime
+    """
+    def setUp(self):
+        self.user = create_user()
+        label = create_label(_user = self.user)
+        for title, length in [('a', '00:05:00'), ('b', '00:01:00'),
+                              ('c', '00:03:00')]:
+            record = create_record(_user = self.user, _label = label,
+                                   _title = title)
+            create_track(_user = self.user, _record = record, _feat = [],
+                         _length = length)
+        self.c = Client()
+
+    def api_titles(self, query):
+        response = self.c.get(reverse('api-music:record') + query)
+        return [record['title'] for record in response.data['results']]
+
+    def test_api(self):
+        self.assertEqual(self.api_titles('?ordering=runtime'), ['b', 'c', 'a'])
+        self.assertEqual(self.api_titles('?ordering=-runtime'),
+                         ['a', 'c', 'b'])
+        self.assertEqual(self.api_titles('?min_runtime=120&max_runtime=300'),
+                         ['a', 'c'])
+        self.assertEqual(self.api_titles('?ordering=runtime&page_size=1'),
+                         ['b'])
+        response = self.c.get(reverse('api-music:record') +
+                              '?ordering=runtime&page_size=2')
+        self.assertEqual(response.data['results'][0]['runtime_seconds'], 60)
+        self.assertEqual(response.data['results'][0]['track_count'], 1)
+        response = self.c.get(response.data['next'])
+        self.assertEqual([r['title'] for r in response.data['results']], ['a'])
+
+    def test_view(self):
+        for url in [reverse('music:record_list_cursor'),
+                    reverse('music:record_list', kwargs = {'page_nb': 1})]:
+            response = self.c.get(url + '?ordering=-runtime&min_runtime=120')
+            self.assertEqual([r.title for r in response.context['objects']],
+                             ['a', 'c'])
+            self.assertContains(response, '(5:00)')
+
+    def test_cursor_of_other_ordering(self):
+        """
+        Cursor of the title ordering should not be used to seek by runtime
+        """
+        response = self.c.get(reverse('api-music:record') + '?page_size=1')
+        cursor = re.search('cursor=([^&]+)', response.data['next']).group(1)
+        response = self.c.get(reverse('api-music:record') +
+                              '?ordering=runtime&cursor=' + cursor)
+        self.assertEqual(response.status_code, 404)
+        response = self.c.get(reverse('music:record_list_cursor'),
+                              {'ordering': 'runtime',
+                               'cursor': unquote(cursor)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r.title for r in response.context['objects']],
+                         ['b', 'c', 'a'])
+
+
 class LabelListViewTests(TestCase):
     """
     Tests for LabelList view
@@ -571,6 +2446,181 @@ class BandListViewTests(TestCase):
         self.assertEqual(response.context['objects'].paginator.count, 1)
 
 
+class KeysetPaginationTests(TestCase):
+    """
+    Tests for keyset pagination of list views
+    """
+    def setUp(self):
+        self.user = create_user()
+        # duplicated names check that pk breaks the ties
+        for i in range(30):
+            create_band(_user = self.user, _name = 'band%02d' % (i // 2))
+        self.c = Client()
+        self.names = list(Band.objects.order_by('name', 'pk').\
+                          values_list('pk', flat = True))
+
+    def test_paginator_walks_forward_and_back(self):
+        """
+        Following next and previous cursors should visit every band once
+        """
+        paginator = KeysetPaginator(Band.objects.all(), ('name', 'pk'), 7)
+        page = paginator.page()
+        seen = [band.pk for band in page]
+        pages = [list(seen)]
+        while page.has_next():
+            page = paginator.page(page.next_cursor())
+            pages.append([band.pk for band in page])
+            seen.extend(pages[-1])
+        self.assertEqual(seen, self.names)
+        self.assertFalse(page.has_next())
+        for expected in reversed(pages[:-1]):
+            page = paginator.page(page.previous_cursor())
+            self.assertEqual([band.pk for band in page], expected)
+        self.assertFalse(page.has_previous())
+
+    def test_descending_ordering(self):
+        """
+        Keyset should work for descending keys as well
+        """
+        paginator = KeysetPaginator(Band.objects.all(), ('-name', '-pk'), 20)
+        page = paginator.page(paginator.page().next_cursor())
+        self.assertEqual([band.pk for band in page],
+                         list(reversed(self.names))[20:])
+
+    def test_invalid_cursor(self):
+        """
+        Malformed cursor should be rejected by paginator
+        """
+        paginator = KeysetPaginator(Band.objects.all(), ('name', 'pk'), 7)
+        with self.assertRaises(InvalidCursor):
+            paginator.page('garbage')
+        tampered = base64.urlsafe_b64encode(
+            b'{"k": ["x", "abc"], "b": false, "o": ["name", "pk"]}').\
+                decode('ascii')
+        with self.assertRaises(InvalidCursor):
+            paginator.page(tampered)
+
+    def test_view_numbered_page_links_to_cursor(self):
+        """
+        Numbered page should still work and link to keyset pages
+        """
+        response = self.c.get(reverse('music:band_list', kwargs={'page_nb':2}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([band.pk for band in response.context['objects']],
+                         self.names[12:24])
+        response = self.c.get(response.context['next_url'])
+        self.assertEqual([band.pk for band in response.context['objects']],
+                         self.names[24:])
+        self.assertIsNone(response.context['next_url'])
+        response = self.c.get(response.context['previous_url'])
+        self.assertEqual([band.pk for band in response.context['objects']],
+                         self.names[12:24])
+
+    def test_view_with_invalid_cursor(self):
+        """
+        Invalid cursor should fall back to the first page
+        """
+        response = self.c.get(reverse('music:band_list_cursor'),
+                              {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([band.pk for band in response.context['objects']],
+                         self.names[:12])
+
+
+class CountStrategyTests(TestCase):
+    """
+    Tests for total count strategies of paginated lists
+    """
+    def setUp(self):
+        self.user = create_user()
+        for i in range(5):
+            create_band(_user = self.user, _name = 'band%d' % i)
+        cache.clear()
+
+    def test_exact_count(self):
+        self.assertEqual(ExactCount().count(Band.objects.all()), 5)
+
+    def test_counter_table_follows_inserts_and_deletes(self):
+        """
+        Counter should be read from RowCount and follow inserts and deletes
+        """
+        strategy = CounterTableCount()
+        self.assertEqual(strategy.count(Band.objects.all()), 5)
+        create_band(_user = self.user)
+        Band.objects.get(name = 'band0').delete()
+        create_band(_user = self.user, _name = 'other')
+        with self.assertNumQueries(1):
+            self.assertEqual(strategy.count(Band.objects.all()), 6)
+        self.assertEqual(RowCount.objects.get(table = 'music_band').count, 6)
+
+    def test_counter_table_counts_filtered_queryset(self):
+        strategy = CounterTableCount()
+        self.assertEqual(strategy.count(Band.objects.filter(name = 'band1')),
+                         1)
+
+    def test_refresh_row_counts_command(self):
+        RowCount.get_count(Band)
+        RowCount.objects.filter(table = 'music_band').update(count = 100)
+        call_command('refresh_row_counts', stdout = StringIO())
+        self.assertEqual(RowCount.get_count(Band), 5)
+
+    def test_cached_count(self):
+        """
+        Cached count should not be recomputed within its timeout
+        """
+        strategy = CachedCount(timeout = 60)
+        self.assertEqual(strategy.count(Band.objects.all()), 5)
+        create_band(_user = self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(strategy.count(Band.objects.all()), 5)
+
+    def test_estimated_count_falls_back_to_exact(self):
+        """
+        Small tables and other databases than PostgreSQL are counted exactly
+        """
+        self.assertEqual(EstimatedCount().count(Band.objects.all()), 5)
+
+    def test_paginator_uses_strategy_and_exact_has_next(self):
+        """
+        Underestimated count should not hide the next page
+        """
+        class TooLow(object):
+            def count(self, queryset):
+                return 2
+        paginator = CountStrategyPaginator(Band.objects.order_by('name'), 2,
+                                           count_strategy = TooLow())
+        self.assertEqual(paginator.num_pages, 1)
+        page = paginator.page(1)
+        self.assertTrue(page.has_next())
+        self.assertEqual(len(page), 2)
+        page = paginator.page(3)
+        self.assertFalse(page.has_next())
+        self.assertEqual([band.name for band in page], ['band4'])
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+    def test_page_past_overestimated_count(self):
+        """
+        Page past the objects should show the last page with objects, even
+        when the count is too high
+        """
+        class TooHigh(object):
+            def count(self, queryset):
+                return queryset.count() + 100
+        with mock.patch.object(BandListView, 'count_strategy', TooHigh()):
+            response = Client().get(reverse('music:band_list',
+                                            kwargs={'page_nb':50}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['objects'].number, 1)
+        self.assertEqual(len(response.context['objects']), 5)
+
+    def test_band_list_view_uses_counter_table(self):
+        response = Client().get(reverse('music:band_list',
+                                        kwargs={'page_nb':1}))
+        self.assertEqual(response.context['objects'].paginator.count, 5)
+        self.assertEqual(RowCount.objects.get(table = 'music_band').count, 5)
+
+
 class RecordViewTests(TestCase):
     """
     Test for Record view
@@ -611,7 +2661,7 @@ class RecordViewTests(TestCase):
         """
         Test if page for test record from setup stage exists
         """
-        response = self.c.get(reverse('music:record', args=(self.record.id,)))
+        response = self.c.get(reverse('music:record', args=(self.record.slug,)))
         self.assertEqual(response.status_code, 200)
 
     def test_if_other_records_are_skipped(self):
@@ -619,7 +2669,7 @@ class RecordViewTests(TestCase):
         If band has only one record, section with other records should be
         replaced with sufficient info
         """
-        response = self.c.get(reverse('music:record', args=(self.record.id,)))
+        response = self.c.get(reverse('music:record', args=(self.record.slug,)))
         self.assertEqual(response.status_code, 200)
         self.assertQuerysetEqual(response.context['band_records'], [])
 
@@ -627,7 +2677,7 @@ class RecordViewTests(TestCase):
         """
         Test if there are no tracks on album
         """
-        response = self.c.get(reverse('music:record', args=(self.record.id,)))
+        response = self.c.get(reverse('music:record', args=(self.record.slug,)))
         self.assertEqual(response.status_code, 200)
         self.assertQuerysetEqual(response.context['tracks'], [])
 
@@ -641,7 +2691,7 @@ class RecordViewTests(TestCase):
         self.t2=Track.objects.create(name='t2', number=2, length='00:03:13',
                       record_fk =self.record, create_by=self.user,
                                          modify_by=self.user)
-        response = self.c.get(reverse('music:record', args=(self.record.id,)))
+        response = self.c.get(reverse('music:record', args=(self.record.slug,)))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['tracks'].count(), 2)
         self.assertEqual(response.context['tracks'][0].name, 't1')
@@ -663,6 +2713,388 @@ class RecordViewTests(TestCase):
 
 
 
+class RecordViewQueryTests(TestCase):
+    """
+    Query budget of Record view
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.band = create_band(_user = self.user)
+        self.feat = create_band(_user = self.user, _name = 'feat_band')
+        self.record = create_record(_user = self.user, _label = self.label,
+                                    _bands = [self.band])
+        create_record(_user = self.user, _label = self.label,
+                      _bands = [self.band], _title = 'Other')
+        self.c = Client()
+        self.url = reverse('music:record', args=(self.record.slug,))
+
+    def grow(self, count):
+        """
+        Add count tracks with featured artist and count reviews
+        """
+        start = self.record.track_set.count()
+        for i in range(start, start + count):
+            create_track(_user = self.user, _record = self.record,
+                         _feat = [self.feat], _number = i,
+                         _name = 'track%d' % i)
+            author = create_user(_username = 'reviewer%d' % i)
+            create_review(_user = author, _record = self.record)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_anonymous_query_budget(self):
+        """
+        Anonymous page should be built from a fixed set of queries
+        """
+        self.grow(3)
+        # 8 queries of conditional GET validators, 7 of the page itself
+        with self.assertNumQueries(15):
+            self.c.get(self.url)
+
+    def test_query_count_does_not_grow(self):
+        """
+        More tracks and reviews should not add queries
+        """
+        self.grow(1)
+        small = self.count_queries()
+        self.grow(9)
+        self.assertEqual(self.count_queries(), small)
+
+    def test_query_count_does_not_grow_for_logged_user(self):
+        """
+        Same for logged user with own review
+        """
+        self.c.force_login(self.user)
+        create_review(_user = self.user, _record = self.record)
+        self.grow(1)
+        small = self.count_queries()
+        self.grow(9)
+        self.assertEqual(self.count_queries(), small)
+
+
+class PageCacheTests(TestCase):
+    """
+    Full-page cache of anonymous traffic
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.band = create_band(_user = self.user)
+        self.other_band = create_band(_user = self.user, _name = 'other_band')
+        self.record = create_record(_user = self.user, _label = self.label,
+                                    _bands = [self.band])
+        self.other = create_record(_user = self.user, _label = self.label,
+                                   _bands = [self.other_band],
+                                   _title = 'Other')
+        self.c = Client()
+        self.record_url = reverse('music:record', args=(self.record.slug,))
+        self.other_url = reverse('music:record', args=(self.other.slug,))
+
+    def is_hit(self, url):
+        response = self.c.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.get('X-Page-Cache') == 'hit'
+
+    def test_second_request_is_hit(self):
+        """
+        Page rendered once should be served from cache
+        """
+        self.assertFalse(self.is_hit(self.record_url))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.is_hit(self.record_url))
+
+    def test_logged_user_is_not_cached(self):
+        """
+        Pages without holes are always rendered for logged users
+        """
+        band_url = reverse('music:band', args=(self.band.slug,))
+        self.c.force_login(self.user)
+        self.c.get(band_url)
+        self.assertFalse(self.is_hit(band_url))
+
+    def test_review_evicts_only_its_record(self):
+        """
+        New review should evict page of its record, not of other records
+        """
+        self.c.get(self.record_url)
+        self.c.get(self.other_url)
+        create_review(_user = self.user, _record = self.record)
+        self.assertFalse(self.is_hit(self.record_url))
+        self.assertTrue(self.is_hit(self.other_url))
+
+    def test_band_change_evicts_its_pages(self):
+        """
+        Band rename should evict pages of its records and the band list
+        """
+        band_list = reverse('music:band_list', args=(1,))
+        self.c.get(self.record_url)
+        self.c.get(self.other_url)
+        self.c.get(band_list)
+        self.band.name = 'renamed'
+        self.band.save()
+        self.assertFalse(self.is_hit(self.record_url))
+        self.assertFalse(self.is_hit(band_list))
+        self.assertTrue(self.is_hit(self.other_url))
+
+    def test_m2m_change_evicts_both_sides(self):
+        """
+        Adding a band to a record should evict record and band pages
+        """
+        band_url = reverse('music:band', args=(self.other_band.slug,))
+        self.c.get(self.record_url)
+        self.c.get(band_url)
+        self.record.bands.add(self.other_band)
+        self.assertFalse(self.is_hit(self.record_url))
+        self.assertFalse(self.is_hit(band_url))
+        self.record.bands.clear()
+        self.assertFalse(self.is_hit(band_url))
+
+    def test_counters(self):
+        """
+        Hits and misses should be counted
+        """
+        self.c.get(self.record_url)
+        self.c.get(self.record_url)
+        self.c.get(self.record_url)
+        self.assertEqual(pagecache.stats(), {'hits': 2, 'misses': 1})
+        out = StringIO()
+        call_command('page_cache_stats', '--reset', stdout = out)
+        self.assertIn('hit ratio: 66.7%', out.getvalue())
+        self.assertEqual(pagecache.stats(), {'hits': 0, 'misses': 0})
+
+    def test_write_during_rendering(self):
+        """
+        Page rendered while its data changed should not be stored
+        """
+        factory = RequestFactory()
+        tags = ['record:%d' % self.record.pk]
+        started = pagecache.generation()
+        create_review(_user = self.user, _record = self.record)
+        pagecache.store_page(factory.get(self.record_url),
+                             HttpResponse('stale'), tags, started)
+        self.assertIsNone(pagecache.get_entry(factory.get(self.record_url)))
+        pagecache.store_page(factory.get(self.record_url),
+                             HttpResponse('fresh'), tags,
+                             pagecache.generation())
+        entry = pagecache.get_entry(factory.get(self.record_url))
+        self.assertEqual(entry['content'], b'fresh')
+
+    @override_settings(CACHES = production_settings.CACHES)
+    def test_shared_database_cache(self):
+        """
+        Configured cache, shared by all processes, should serve pages and
+        see invalidations
+        """
+        self.assertFalse(self.is_hit(self.record_url))
+        self.assertTrue(self.is_hit(self.record_url))
+        create_review(_user = self.user, _record = self.record)
+        self.assertFalse(self.is_hit(self.record_url))
+        self.assertEqual(pagecache.stats(), {'hits': 1, 'misses': 2})
+
+    @override_settings(CACHES = production_settings.CACHES)
+    def test_database_cache_hit_queries(self):
+        """
+        Hit should read the page and the tag table only, however many tags
+        the page has
+        """
+        for i in range(10):
+            create_record(_user = self.user, _label = self.label,
+                          _bands = [self.band], _title = 'Record %d' % i)
+        band_url = reverse('music:band', args=(self.band.slug,))
+        self.assertFalse(self.is_hit(band_url))
+        with self.assertNumQueries(2):
+            self.assertTrue(self.is_hit(band_url))
+
+    @override_settings(MUSIC_PAGE_CACHE_STATS_EVERY = 3)
+    def test_counters_written_in_batches(self):
+        """
+        Counters should be written to the cache once per batch of requests
+        """
+        self.c.get(self.record_url)
+        self.c.get(self.record_url)
+        self.assertEqual(caches['pages'].get('pagecache:hit'), None)
+        self.c.get(self.record_url)
+        self.assertEqual(caches['pages'].get('pagecache:hit'), 2)
+        self.assertEqual(pagecache.stats(), {'hits': 2, 'misses': 1})
+
+
+class HolePunchedPageTests(TestCase):
+    """
+    Record page shared by all users with per-user fragments filled in
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.author = create_user(_username = 'author')
+        self.label = create_label(_user = self.user)
+        self.record = create_record(_user = self.user, _label = self.label)
+        self.review = create_review(_user = self.author, _record = self.record,
+                                    _review_text = 'Own words')
+        self.url = reverse('music:record', args=(self.record.slug,))
+
+    def get(self, user, url = None):
+        c = Client()
+        c.force_login(user)
+        return c.get(url or self.url)
+
+    def test_logged_users_share_cached_page(self):
+        """
+        Page rendered for one user should be a hit for another one, with
+        their own nav bar and review form link
+        """
+        self.get(self.author)
+        c = Client()
+        c.force_login(self.user)
+        # session and user, then a single query for the fragments
+        with self.assertNumQueries(3):
+            response = c.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'tester')
+        self.assertNotContains(response, '<!--hole:')
+        self.assertContains(response, 'Leave your opinion on TestTitle')
+        self.assertContains(response, 'Own words')
+
+    def test_own_review_is_filled_in(self):
+        """
+        Author should see their review in own section only
+        """
+        self.get(self.user)
+        response = self.get(self.author)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, "Here's your review", count = 1)
+        self.assertContains(response, 'Own words', count = 1)
+        self.assertContains(response, reverse('music:edit_review',
+                                              args=(self.review.id,)))
+
+    def test_anonymous_fragments(self):
+        """
+        Anonymous user should get login links without any query
+        """
+        Client().get(self.url)
+        with self.assertNumQueries(0):
+            response = Client().get(self.url)
+        self.assertContains(response, 'to write reviews')
+
+    def test_fragment_endpoint(self):
+        """
+        Fragments should be available on their own, private to the user
+        """
+        url = reverse('music:record_fragment',
+                      args=(self.record.slug, 'user_review'))
+        response = self.get(self.author, url)
+        self.assertContains(response, 'Own words')
+        self.assertIn('private', response['Cache-Control'])
+        url = reverse('music:record_fragment', args=('missing', 'user_review'))
+        self.assertEqual(self.get(self.author, url).status_code, 404)
+
+    def add_reviews(self, count):
+        for i in range(count):
+            create_review(_user = create_user(_username = 'r%d' % i),
+                          _record = self.record, _review_text = 'r%d' % i)
+        # the author's review is the latest one
+        self.review.review_text = 'Own words'
+        self.review.save()
+
+    def test_ten_reviews_of_others(self):
+        """
+        Author should see as many reviews of others as anyone else
+        """
+        self.add_reviews(11)
+        response = Client().get(self.url)
+        self.assertContains(response, '<!--author:', count = 10)
+        response = self.get(self.author)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, '<!--author:', count = 10)
+        self.assertNotContains(response, '<!--author:%d-->' % self.author.pk)
+
+    def test_esi_mode(self):
+        """
+        With ESI, holes should be left to the edge server
+        """
+        with self.settings(MUSIC_PAGE_CACHE_ESI = True):
+            response = self.get(self.author)
+        self.assertContains(response, '<esi:include src="%s"/>' % reverse(
+            'music:record_fragment', args=(self.record.slug, 'user_review')))
+        self.assertContains(response, '<esi:include src="%s"/>' % reverse(
+            'music:record_fragment',
+            args=(self.record.slug, 'related_reviews')))
+        self.assertNotContains(response, 'Own words')
+
+    def test_esi_related_reviews(self):
+        """
+        Related reviews fragment should leave out the reader's own review
+        """
+        self.add_reviews(11)
+        url = reverse('music:record_fragment',
+                      args=(self.record.slug, 'related_reviews'))
+        response = self.get(self.author, url)
+        self.assertContains(response, '<!--author:', count = 10)
+        self.assertNotContains(response, 'Own words')
+        response = Client().get(url + '?reviews=likes')
+        self.assertContains(response, '<!--author:', count = 10)
+
+
+class ConditionalViewTests(TestCase):
+    """
+    Conditional GET of detail pages
+    """
+    def setUp(self):
+        self.user = create_user()
+        self.label = create_label(_user = self.user)
+        self.band = create_band(_user = self.user)
+        self.record = create_record(_user = self.user, _label = self.label,
+                                    _bands = [self.band])
+        self.url = reverse('music:record', args=(self.record.slug,))
+        self.c = Client()
+
+    def test_cached_page_not_modified(self):
+        """
+        Page in page cache should be validated without any query
+        """
+        etag = self.c.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.c.get(self.url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_review_changes_etag(self):
+        etag = self.c.get(self.url)['ETag']
+        create_review(_user = self.user, _record = self.record)
+        response = self.c.get(self.url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_logged_user_etag(self):
+        """
+        Logged user should get own ETag and no Last-Modified
+        """
+        anonymous = self.c.get(self.url)
+        self.assertIn('Last-Modified', anonymous)
+        self.c.force_login(self.user)
+        response = self.c.get(self.url, HTTP_IF_NONE_MATCH = anonymous['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('Cookie', response['Vary'])
+        response = self.c.get(self.url, HTTP_IF_NONE_MATCH = response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_band_page(self):
+        """
+        Band page should change with records of the band
+        """
+        url = reverse('music:band', args=(self.band.slug,))
+        etag = self.c.get(url)['ETag']
+        self.assertEqual(
+            self.c.get(url, HTTP_IF_NONE_MATCH = etag).status_code, 304)
+        self.record.title = 'Renamed'
+        self.record.save()
+        self.assertEqual(
+            self.c.get(url, HTTP_IF_NONE_MATCH = etag).status_code, 200)
+
+
 class UserPanelViewTests(TestCase):
     """
     Testing of user panel view
@@ -726,3 +3158,57 @@ class UserPanelViewTests(TestCase):
 
 
 
+
+
+class StaticFilesTests(TestCase):
+    """
+    Content-hashed, precompressed static files
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            STATIC_ROOT = self.dir, STATICFILES_DIRS = [],
+            STATICFILES_STORAGE =
+            'music.storage.CompressedManifestStaticFilesStorage')
+        self.settings_override.enable()
+        call_command('collectstatic', interactive = False, verbosity = 0)
+        self.c = Client()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.dir)
+
+    def hashed_url(self):
+        return Template('{% load static %}{% static "music/base.css" %}').\
+                render(Context())
+
+    def test_collect(self):
+        url = self.hashed_url()
+        self.assertRegex(url, r'^/static/music/base\.[0-9a-f]{12}\.css$')
+        path = os.path.join(self.dir, url[len('/static/'):])
+        with open(path, 'rb') as original:
+            content = original.read()
+        with open(path + '.gz', 'rb') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), content)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.dir, 'staticfiles.json')))
+
+    def test_serve_hashed(self):
+        url = self.hashed_url()
+        response = self.c.get(url, HTTP_ACCEPT_ENCODING = 'gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('immutable', response['Cache-Control'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'.navbar', body)
+        response = self.c.get(url, HTTP_ACCEPT_ENCODING = 'gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), body)
+
+    def test_serve_unhashed(self):
+        response = self.c.get('/static/music/base.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.c.get('/static/music/missing.css').status_code,
+                         404)
@@ -0,0 +1,128 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, features
+
+from music.models import Label
+from music import pagecache
+
+
+# Models with thumbnailed images: (model, image field). Suffixes of
+# rendered thumbnails are kept in <field>_thumbnails of the model
+THUMBNAIL_FIELDS = ((Label, 'image'),)
+
+
+def webp_supported():
+    return features.check_module('webp')
+
+
+def thumbnail_name(name, suffix):
+    """
+    Return name of a thumbnail stored next to the original image
+    """
+    return '%s.%s' % (os.path.splitext(name)[0], suffix)
+
+
+def render(path, widths, webp):
+    """
+    Write thumbnails of the image at path, in its format (JPEG, otherwise
+    PNG) and optionally WebP, for every width below the original one.
+    Return suffixes of written thumbnails, like '150w.jpg'. Runs in worker
+    processes, so it works on files only
+    """
+    suffixes = []
+    root = os.path.splitext(path)[0]
+    with Image.open(path) as image:
+        image.load()
+        if image.format == 'JPEG':
+            formats = [('JPEG', 'jpg')]
+        else:
+            formats = [('PNG', 'png')]
+        if webp:
+            formats.append(('WEBP', 'webp'))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        for width in sorted(widths):
+            if width >= image.width:
+                continue
+            height = max(1, int(round(image.height * width /
+                                      float(image.width))))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for image_format, extension in formats:
+                thumbnail = resized
+                if image_format == 'JPEG' and thumbnail.mode not in ('RGB',
+                                                                     'L'):
+                    thumbnail = thumbnail.convert('RGB')
+                suffix = '%dw.%s' % (width, extension)
+                target = '%s.%s' % (root, suffix)
+                # readers never see half-written files
+                thumbnail.save(target + '.tmp', image_format, quality=85)
+                os.rename(target + '.tmp', target)
+                suffixes.append(suffix)
+    return suffixes
+
+
+def render_job(name):
+    """
+    Return arguments of render for a stored image, None if the storage
+    has no local files
+    """
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        return None
+    return (path, settings.MUSIC_THUMBNAIL_SIZES, webp_supported())
+
+
+def finish(model, field_name, name, suffixes):
+    """
+    Record rendered thumbnails on objects still using the image
+    """
+    objects = model.objects.filter(**{field_name: name})
+    pks = list(objects.values_list('pk', flat=True))
+    objects.update(**{field_name + '_thumbnails': ','.join(suffixes)})
+    model_name = model._meta.model_name
+    pagecache.invalidate('list:' + model_name,
+                         *['%s:%d' % (model_name, pk) for pk in pks])
+
+
+def schedule(model, field_name, name):
+    """
+    Render thumbnails of a stored image right away with
+    MUSIC_THUMBNAIL_WORKERS = 0. Otherwise they are left to the
+    render_thumbnails command, run periodically, which renders every image
+    still without thumbnails in MUSIC_THUMBNAIL_WORKERS processes
+    """
+    if settings.MUSIC_THUMBNAIL_WORKERS:
+        return
+    job = render_job(name)
+    if job is not None:
+        finish(model, field_name, name, render(*job))
+
+
+def delete_unused(model, field_name, name, suffixes):
+    """
+    Delete thumbnails of a replaced or deleted image unless another object
+    still uses it, identical uploads sharing one file
+    """
+    if not name or not suffixes or \
+            model.objects.filter(**{field_name: name}).exists():
+        return
+    for suffix in suffixes.split(','):
+        default_storage.delete(thumbnail_name(name, suffix))
+
+
+def srcsets(name, suffixes):
+    """
+    Return dict of srcset attribute values by file extension
+    """
+    candidates = {}
+    for suffix in suffixes.split(','):
+        if suffix:
+            width, extension = suffix.split('.')
+            candidates.setdefault(extension, []).append(
+                '%s %s' % (default_storage.url(thumbnail_name(name, suffix)),
+                           width))
+    return dict((extension, ', '.join(urls))
+                for extension, urls in candidates.items())
@@ -0,0 +1,270 @@
+import bisect
+import heapq
+import sys
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, F, Max
+from music.models import Band, Record, Label
+
+
+def normalize(text):
+    """
+    Return lowercase text without accents, used for keys and queries
+    """
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def index_keys(name):
+    """
+    Return keys of a name: the name itself and its tail from every word, so
+    that "lam" finds "Kendrick Lamar"
+    """
+    name = normalize(name)
+    keys = set()
+    for position, char in enumerate(name):
+        word_start = position == 0 or not name[position - 1].isalnum()
+        if char.isalnum() and word_start:
+            keys.add(name[position:])
+    return sorted(keys)
+
+
+class PrefixIndex(object):
+    """
+    Sorted array of keys searched with binary search. keys and refs are
+    parallel lists, refs point to entries by (kind, pk)
+    """
+    # results of prefixes this short are cached, their ranges are long
+    short_prefix = 2
+
+    def __init__(self):
+        self.keys = []
+        self.refs = []
+        self.entries = {}
+        self.short_results = {}
+
+    def build(self, rows):
+        """
+        Replace index content with rows of (kind, pk, name, slug, popularity)
+        """
+        pairs = []
+        self.entries = {}
+        for kind, pk, name, slug, popularity in rows:
+            self.entries[(kind, pk)] = (name, slug, popularity)
+            pairs.extend((key, (kind, pk)) for key in index_keys(name))
+        pairs.sort()
+        self.keys = [key for key, ref in pairs]
+        self.refs = [ref for key, ref in pairs]
+        self.short_results = {}
+
+    def add(self, kind, pk, name, slug, popularity):
+        """
+        Insert or replace a single entry
+        """
+        self.update([(kind, pk, name, slug, popularity)])
+
+    def update(self, rows):
+        """
+        Insert or replace entries of rows (kind, pk, name, slug, popularity).
+        Entries keeping their name only get new values; keys of the others
+        are merged into the sorted lists in a single pass
+        """
+        renamed = {}
+        for kind, pk, name, slug, popularity in rows:
+            old = self.entries.get((kind, pk))
+            self.entries[(kind, pk)] = (name, slug, popularity)
+            if old is None or old[0] != name:
+                renamed[(kind, pk)] = name
+        if renamed:
+            pairs = sorted((key, ref) for ref, name in renamed.items()
+                           for key in index_keys(name))
+            kept = ((key, ref) for key, ref in zip(self.keys, self.refs)
+                    if ref not in renamed)
+            merged = list(heapq.merge(kept, pairs))
+            self.keys = [key for key, ref in merged]
+            self.refs = [ref for key, ref in merged]
+        self.short_results = {}
+
+    def remove(self, kind, pk):
+        """
+        Remove entry and all its keys, if present
+        """
+        entry = self.entries.pop((kind, pk), None)
+        if entry is None:
+            return
+        for key in index_keys(entry[0]):
+            position = bisect.bisect_left(self.keys, key)
+            while position < len(self.keys) and self.keys[position] == key:
+                if self.refs[position] == (kind, pk):
+                    del self.keys[position]
+                    del self.refs[position]
+                    break
+                position += 1
+        self.short_results = {}
+
+    def lookup(self, prefix, limit=10):
+        """
+        Return up to limit most popular entries with a key starting with
+        prefix, as (kind, name, slug) tuples
+        """
+        prefix = normalize(prefix).strip()
+        if not prefix:
+            return []
+        if len(prefix) <= self.short_prefix:
+            cached = self.short_results.get(prefix)
+            if cached is None or len(cached) < limit:
+                cached = self.short_results[prefix] = \
+                        self._lookup(prefix, max(limit, 10))
+            return cached[0:limit]
+        return self._lookup(prefix, limit)
+
+    def _lookup(self, prefix, limit):
+        low = bisect.bisect_left(self.keys, prefix)
+        high = bisect.bisect_left(self.keys, prefix + u'\U0010ffff', low)
+        refs = set(self.refs[low:high])
+        # most popular first, ties in alphabetical order
+        best = heapq.nsmallest(limit, refs,
+                               key=lambda ref: (-self.entries[ref][2],
+                                                self.entries[ref][0]))
+        return [(ref[0],) + self.entries[ref][0:2] for ref in best]
+
+    def memory_bytes(self):
+        """
+        Return approximate memory used by the index
+        """
+        size = sys.getsizeof(self.keys) + sys.getsizeof(self.refs) + \
+                sys.getsizeof(self.entries)
+        size += sum(sys.getsizeof(key) for key in self.keys)
+        for ref, entry in self.entries.items():
+            size += sys.getsizeof(ref) + sys.getsizeof(entry) + \
+                    sum(sys.getsizeof(value) for value in entry)
+        return size
+
+
+def catalogue_rows(modified_after=None):
+    """
+    Return (kind, pk, name, slug, popularity, modify_date) of bands, records
+    and labels, only those modified after given date if any. Records whose
+    reviews changed count as modified when their latest review did, their
+    popularity being the review count (deleted reviews touch the record)
+    """
+    sources = (
+        ('band', Band.objects.annotate(popularity=Count('record')), 'name'),
+        ('record', Record.objects.annotate(popularity=F('review_count')),
+         'title'),
+        ('label', Label.objects.annotate(popularity=Count('record')), 'name'),
+    )
+    for kind, queryset, name_field in sources:
+        if modified_after is not None:
+            queryset = queryset.filter(modify_date__gt=modified_after)
+        for row in queryset.order_by().values_list(
+                'pk', name_field, 'slug', 'popularity', 'modify_date'):
+            yield (kind,) + row
+    if modified_after is not None:
+        reviewed = Record.objects.filter(
+            review__modify_date__gt=modified_after).annotate(
+                popularity=F('review_count'),
+                reviewed=Max('review__modify_date'))
+        for row in reviewed.order_by().values_list(
+                'pk', 'title', 'slug', 'popularity', 'reviewed'):
+            yield ('record',) + row
+
+
+class Typeahead(object):
+    """
+    Per-process prefix index of bands, records and labels. Fully built on
+    first use, then refreshed from modify_date at most every
+    MUSIC_TYPEAHEAD_REFRESH seconds and rebuilt every MUSIC_TYPEAHEAD_REBUILD
+    seconds, which also drops deleted objects. Rebuilds run in a background
+    thread, lookups are served from the previous index until it is swapped
+    """
+    def __init__(self):
+        self.index = PrefixIndex()
+        self.lock = threading.Lock()
+        self.built_at = None
+        self.refreshed_at = None
+        self.last_modified = None
+        self.rebuilding = False
+
+    def build(self):
+        """
+        Build a new index of the whole catalogue and swap it in
+        """
+        rows = list(catalogue_rows())
+        index = PrefixIndex()
+        index.build(row[0:5] for row in rows)
+        with self.lock:
+            self.index = index
+            self.last_modified = max([row[5] for row in rows] or [None])
+            self.built_at = self.refreshed_at = time.time()
+
+    def refresh(self):
+        """
+        Add objects modified since the last build or refresh
+        """
+        if self.last_modified is None:
+            return self.build()
+        index, last_modified = self.index, self.last_modified
+        rows = list(catalogue_rows(last_modified))
+        with self.lock:
+            # a rebuild swapped in meanwhile is newer than these rows
+            if self.index is not index:
+                return
+            self.index.update(row[0:5] for row in rows)
+            self.last_modified = max([last_modified] +
+                                     [row[5] for row in rows])
+            self.refreshed_at = time.time()
+
+    def rebuild(self):
+        """
+        Build the index in the background thread, which closes its own
+        database connection when done
+        """
+        try:
+            self.build()
+        finally:
+            self.rebuilding = False
+            connections.close_all()
+
+    def start_rebuild(self):
+        """
+        Start a background rebuild unless one is running
+        """
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        thread = threading.Thread(target=self.rebuild,
+                                  name='typeahead-rebuild')
+        thread.daemon = True
+        thread.start()
+
+    def ensure_fresh(self):
+        now = time.time()
+        if self.built_at is None:
+            self.build()
+            return
+        if now - self.built_at > settings.MUSIC_TYPEAHEAD_REBUILD:
+            self.start_rebuild()
+        if now - self.refreshed_at > settings.MUSIC_TYPEAHEAD_REFRESH:
+            self.refresh()
+
+    def lookup(self, prefix, limit=10):
+        self.ensure_fresh()
+        with self.lock:
+            return self.index.lookup(prefix, limit)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.index.entries),
+                    'keys': len(self.index.keys),
+                    'memory_bytes': self.index.memory_bytes(),
+                    'built_at': self.built_at,
+                    'refreshed_at': self.refreshed_at}
+
+
+typeahead = Typeahead()
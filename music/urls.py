@@ -8,21 +8,32 @@ urlpatterns = [
         url(r'^band/(?P<slug>[-\w]+)/$', views.BandView.as_view(), name='band'),
         url(r'^record/(?P<slug>[-\w]+)/$', views.RecordView.as_view(),
             name='record'),
+        url(r'^record/(?P<slug>[-\w]+)/fragment/(?P<name>\w+)/$',
+            views.record_fragment, name='record_fragment'),
         url(r'^genre/(?P<slug>[-\w]+)/$', views.GenreView.as_view(), name='genre'),
 
         url(r'^label/(?P<slug>[-\w]+)/$', views.LabelView.as_view(), name='label'),
         url(r'^userPanel/$', views.UserPanelView.as_view(), name='userPanel'),
 
+        url(r'^band_list/$', views.BandListView.as_view(),
+            name='band_list_cursor'),
         url(r'^band_list/(?P<page_nb>[0-9]+)/$', views.BandListView.as_view(),
             name='band_list'),
 
+        url(r'^label_list/$', views.LabelListView.as_view(),
+            name='label_list_cursor'),
         url(r'^label_list/(?P<page_nb>[0-9]+)/$', views.LabelListView.as_view(),
             name='label_list'),
+        url(r'^genre_list/$', views.GenreListView.as_view(),
+            name='genre_list_cursor'),
         url(r'^genre_list/(?P<page_nb>[0-9]+)/$', views.GenreListView.as_view(),
             name='genre_list'),
+        url(r'^record_list/$', views.RecordListView.as_view(),
+            name='record_list_cursor'),
         url(r'^record_list/(?P<page_nb>[0-9]+)/$', views.RecordListView.as_view(),
             name='record_list'),
         url(r'^contact/$', views.contact, name='contact'),
+        url(r'^search/$', views.search_view, name='search'),
         url(r'^record/(?P<slug>[-\w]+)/add_review/$', views.add_review, name='add_review'),
         url(r'^edit_review/(?P<review_id>[0-9]+)/$', views.edit_review,
             name='edit_review'),
@@ -33,4 +44,3 @@ urlpatterns = [
 if settings.DEBUG:
     # static files (images, css, javascript, etc.)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root = settings.MEDIA_ROOT)
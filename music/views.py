@@ -1,12 +1,27 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, HttpResponseRedirect, HttpResponseForbidden
+from django.http import (HttpResponse, HttpResponseRedirect,
+                         HttpResponseForbidden, Http404)
 from music.models import Band, Record, Track, OwnedRecord, Genre, Label, Review
+from music.models import RecommendedRecord, RecordSummary
 from django.views import generic
-from django.utils import timezone
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.conf import settings
+import re
+from django.core.paginator import EmptyPage, PageNotAnInteger
 from music.forms import ContactForm, ReviewForm
+from music import search
+from music.pagecache import TaggedPageCacheMixin
+from music.conditional import conditional
+from django.utils.decorators import method_decorator
 from django.core.mail import send_mail
-from django.db.models import Avg
+from django.db.models import Prefetch
+from django.urls import reverse
+from django.contrib.auth.models import AnonymousUser
+from django.utils.http import urlencode
+from music.pagination import (KeysetPaginator, InvalidCursor, ExactCount,
+                              CounterTableCount, EstimatedCount,
+                              CountStrategyPaginator)
 
 
 def delete_review(request, review_id):
@@ -101,122 +116,174 @@ def contact(request):
     return render(request, 'music/contact_form.html', {'form':form})
 
 
-class LabelView(generic.DetailView):
+def search_view(request):
+    """
+    View for searching bands, records, tracks, labels and genres
+    """
+    query = request.GET.get('q', '')
+    results = search.search(query, limit=50)
+    context = {'query':query, 'results':results}
+
+    return render(request, 'music/search.html', context)
+
+
+@method_decorator(conditional(Label, per_user=True), name='dispatch')
+class LabelView(TaggedPageCacheMixin, generic.DetailView):
     """
     View for displaying label details
     """
     model = Label
     template_name = 'music/label.html'
 
+    def get_cache_tags(self, context):
+        label = context['label']
+        return ['label:%d' % label.pk] + \
+                ['record:%d' % record.pk
+                 for record in label.get_related_records()]
+
 
-class RecordListView(generic.ListView):
+class CatalogueListView(TaggedPageCacheMixin, generic.ListView):
     """
-    View for displaying list of Records
+    Base view for paginated lists of catalogue objects. Numbered pages
+    (page_nb in URL) are read with OFFSET, which is fine for shallow pages;
+    following pages are read after an opaque ?cursor= with a keyset seek
     """
+    list_model = None
+    ordering_fields = ('name', 'pk')
+    per_page = 12
+    # how the total shown in "Page X of N" is counted, see music.pagination
+    count_strategy = ExactCount()
+    # numbered pages are served by url_name, keyset pages by url_name_cursor
+    url_name = None
+
+    def get_list_queryset(self):
+        """
+        Return unordered objects of the list, views filter them here
+        """
+        return self.list_model.objects.all()
 
-    template_name = 'music/record_list.html'
+    def get_ordering_fields(self):
+        return self.ordering_fields
 
-    def get_queryset(self):
+    def get_list_params(self):
         """
-        It seems that I must have a get_queryset method...
+        Return query parameters kept in links to other pages
         """
-        return [1]
+        return {}
+
+    def get_queryset(self):
+        return self.get_list_queryset().order_by(*self.get_ordering_fields())
 
     def get_context_data(self, **kwargs):
-        context = super(RecordListView, self).get_context_data(**kwargs)
-        paginator = Paginator(Record.objects.all().order_by('title'), 12)
-        page = self.kwargs['page_nb']
-        try:
-            context['objects'] = paginator.page(page)
-        except PageNotAnInteger:
-            context['objects'] = paginator.page(1)
-        except EmptyPage:
-            context['objects'] = paginator.page(paginator.num_pages)
+        context = super(CatalogueListView, self).get_context_data(**kwargs)
+        keyset = KeysetPaginator(self.get_list_queryset(),
+                                 self.get_ordering_fields(), self.per_page)
+        cursor = self.request.GET.get('cursor')
+        page_nb = self.kwargs.get('page_nb')
+        if cursor or not page_nb:
+            try:
+                objects = keyset.page(cursor)
+            except InvalidCursor:
+                objects = keyset.page()
+            previous_url = self.cursor_url(objects.previous_cursor())
+        else:
+            paginator = CountStrategyPaginator(self.get_queryset(),
+                self.per_page, count_strategy=self.count_strategy)
+            try:
+                objects = paginator.page(page_nb)
+            except PageNotAnInteger:
+                objects = paginator.page(1)
+            except EmptyPage:
+                objects = paginator.last_page()
+            previous_url = None
+            if objects.has_previous():
+                previous_url = reverse(self.url_name,
+                    kwargs={'page_nb': objects.previous_page_number()})
+                if self.get_list_params():
+                    previous_url += '?' + urlencode(self.get_list_params())
+        next_url = None
+        if objects.has_next():
+            next_url = self.cursor_url(keyset.cursor_for(objects[-1]))
+        context['objects'] = objects
+        context['previous_url'] = previous_url
+        context['next_url'] = next_url
         return context
 
+    def get_cache_tags(self, context):
+        return ['list:' + self.list_model._meta.model_name]
+
+    def cursor_url(self, cursor):
+        """
+        Return URL of the keyset page following given cursor
+        """
+        if cursor:
+            params = dict(self.get_list_params(), cursor=cursor)
+            return '%s?%s' % (reverse(self.url_name + '_cursor'),
+                              urlencode(sorted(params.items())))
+
 
-class LabelListView(generic.ListView):
+class RecordListView(CatalogueListView):
     """
-    View for displaying list of Labels
+    View for displaying list of Records
     """
 
-    template_name = 'music/label_list.html'
+    template_name = 'music/record_list.html'
+    list_model = Record
+    count_strategy = EstimatedCount()
+    ordering_fields = ('title', 'pk')
+    url_name = 'music:record_list'
+    list_param_names = ('ordering', 'min_runtime', 'max_runtime')
 
-    def get_queryset(self):
-        """
-        It seems that I must have a get_queryset method...
-        """
-        return [1]
+    def get_list_queryset(self):
+        return RecordSummary.objects.runtime_between(self.request.GET)
 
-    def get_context_data(self, **kwargs):
-        context = super(LabelListView, self).get_context_data(**kwargs)
-        paginator = Paginator(Label.objects.all().order_by('name'), 12)
-        page = self.kwargs['page_nb']
-        try:
-            context['objects'] = paginator.page(page)
-        except PageNotAnInteger:
-            context['objects'] = paginator.page(1)
-        except EmptyPage:
-            context['objects'] = paginator.page(paginator.num_pages)
+    def get_ordering_fields(self):
+        return Record.LIST_ORDERINGS.get(self.request.GET.get('ordering'),
+                                         self.ordering_fields)
+
+    def get_list_params(self):
+        return dict((name, self.request.GET[name])
+                    for name in self.list_param_names
+                    if self.request.GET.get(name))
 
+    def get_context_data(self, **kwargs):
+        context = super(RecordListView, self).get_context_data(**kwargs)
+        context['ordering'] = self.request.GET.get('ordering', 'title')
         return context
 
 
-class GenreListView(generic.ListView):
+class LabelListView(CatalogueListView):
     """
-    View for displaying list of genre
+    View for displaying list of Labels
     """
 
+    template_name = 'music/label_list.html'
+    list_model = Label
+    url_name = 'music:label_list'
 
-    template_name = 'music/genre_list.html'
 
-    def get_queryset(self):
-        """
-        It seems that I must have a get_queryset method...
-        """
-        return [1]
-
-    def get_context_data(self, **kwargs):
-        context = super(GenreListView, self).get_context_data(**kwargs)
-        paginator = Paginator(Genre.objects.all().order_by('name'), 12)
-        page = self.kwargs['page_nb']
-        try:
-            context['objects'] = paginator.page(page)
-        except PageNotAnInteger:
-            context['objects'] = paginator.page(1)
-        except EmptyPage:
-            context['objects'] = paginator.page(paginator.num_pages)
+class GenreListView(CatalogueListView):
+    """
+    View for displaying list of genre
+    """
 
-        return context
+    template_name = 'music/genre_list.html'
+    list_model = Genre
+    url_name = 'music:genre_list'
 
 
-class BandListView(generic.ListView):
+class BandListView(CatalogueListView):
     """
     view for displaying list of bands
     """
 
     template_name = 'music/band_list.html'
-
-    def get_queryset(self):
-        """
-        It seems that I must have a get_queryset method...
-        """
-        return [1]
-
-    def get_context_data(self, **kwargs):
-        context = super(BandListView, self).get_context_data(**kwargs)
-        paginator = Paginator(Band.objects.all().order_by('name'), 12)
-        page = self.kwargs['page_nb']
-        try:
-            context['objects'] = paginator.page(page)
-        except PageNotAnInteger:
-            context['objects'] = paginator.page(1)
-        except EmptyPage:
-            context['objects'] = paginator.page(paginator.num_pages)
-        return context
+    list_model = Band
+    count_strategy = CounterTableCount()
+    url_name = 'music:band_list'
 
 
-class IndexView(generic.ListView):
+class IndexView(TaggedPageCacheMixin, generic.ListView):
     """
     View for displaying home page.
     """
@@ -230,12 +297,16 @@ class IndexView(generic.ListView):
 
     def get_context_data(self, **kwargs):
         context = super(IndexView, self).get_context_data(**kwargs)
-        context['records'] = Record.objects.all()[:10]
+        context['records'] = RecordSummary.objects.all()[:10]
         context['ordered_bands'] = Band.objects.order_by('name')[:15]
         return context
 
+    def get_cache_tags(self, context):
+        return ['list:record', 'list:band']
 
-class BandView(generic.DetailView):
+
+@method_decorator(conditional(Band, per_user=True), name='dispatch')
+class BandView(TaggedPageCacheMixin, generic.DetailView):
     """
     View for displaying band details
     """
@@ -243,25 +314,169 @@ class BandView(generic.DetailView):
     model = Band
     template_name = 'music/band.html'
 
+    def get_cache_tags(self, context):
+        band = context['band']
+        tags = ['band:%d' % band.pk]
+        for record_id, label_id in band.record_set.values_list('pk',
+                                                               'label_fk'):
+            tags += ['record:%d' % record_id, 'label:%d' % label_id]
+        tags += ['record:%d' % record_id for record_id in
+                 band.track_set.values_list('record_fk', flat=True)]
+        return tags
+
 
-class RecordView(generic.DetailView):
+@method_decorator(conditional(Record, per_user=True), name='dispatch')
+class RecordView(TaggedPageCacheMixin, generic.DetailView):
     """
-    View for displaying record details
+    View for displaying record details. The page is the same for every
+    user, own review and the nav bar are filled into its holes
     """
 
     model = Record
     template_name = 'music/record.html'
+    holes = ('nav_user', 'user_review')
+    fragment_url_name = 'music:record_fragment'
+
+    def get_queryset(self):
+        """
+        Load record together with its bands, tracks and featured artists
+        """
+        return Record.objects.prefetch_related(
+            'bands',
+            Prefetch('track_set',
+                     queryset=Track.objects.prefetch_related('feat')))
 
     def get_context_data(self, **kwargs):
+        """
+        Build the whole page context from a fixed number of queries
+        """
         context = super(RecordView, self).get_context_data(**kwargs)
-        context['related_reviews'] = self.get_object().get_related_reviews\
-                    (self.request.user)
-        context['user_review'] = self.get_object().get_user_review\
-                (self.request.user)
+        record = self.object
+        context['bands'] = record.bands.all()
+        context['tracks'] = record.track_set.all()
+        # page is shared by all users, own review is dropped in punch(),
+        # one more review is read so that REVIEWS_SHOWN are left after it.
+        # With ESI the list is a fragment of its own instead
+        context['by_likes'] = self.request.GET.get('reviews') == 'likes'
+        context['esi'] = settings.MUSIC_PAGE_CACHE_ESI
+        if not context['esi']:
+            context['related_reviews'] = list(record.get_related_reviews(
+                AnonymousUser(), by_likes=context['by_likes'],
+                limit=REVIEWS_SHOWN + 1))
+        context['band_records'] = record.get_bands_other_records()
+        context['similar_records'] = record.get_similar_records()
         return context
 
+    def get_fragments(self, request):
+        return record_fragments(request, self.kwargs['slug'])
+
+    def get_fragment_url(self, name):
+        url = super(RecordView, self).get_fragment_url(name)
+        if name == 'related_reviews' and \
+                self.request.GET.get('reviews') == 'likes':
+            url += '?reviews=likes'
+        return url
+
+    def punch(self, request, response):
+        response = super(RecordView, self).punch(request, response)
+        if not settings.MUSIC_PAGE_CACHE_ESI:
+            response.content = drop_reviews(response.content,
+                                            request.user.pk, REVIEWS_SHOWN)
+        return response
+
+    def get_cache_tags(self, context):
+        tags = ['record:%d' % context['record'].pk]
+        tags += ['band:%d' % band.pk for band in context['bands']]
+        tags += ['band:%d' % band.pk
+                 for track in context['tracks'] for band in track.feat.all()]
+        tags += ['record:%d' % record.pk for record in context['band_records']]
+        tags += ['record:%d' % record.pk
+                 for record in context['similar_records']]
+        return tags
 
-class GenreView(generic.DetailView):
+
+# Reviews of other users shown on record page
+REVIEWS_SHOWN = 10
+
+# Review of the shared record page, author's id in group 1
+AUTHOR_BLOCK = re.compile(br'<!--author:(\d+)-->.*?<!--/author-->', re.DOTALL)
+
+
+def drop_reviews(content, user_id, limit):
+    """
+    Remove reviews written by user from shared record page content and
+    those beyond limit
+    """
+    shown = [0]
+
+    def keep(match):
+        if int(match.group(1)) == user_id or shown[0] == limit:
+            return b''
+        shown[0] += 1
+        return match.group(0)
+    return AUTHOR_BLOCK.sub(keep, content)
+
+
+# Record read together with own review of the user, if any
+USER_REVIEW_SQL = (
+    'SELECT review.*, record.title AS record_title '
+    'FROM music_record record LEFT JOIN music_review review '
+    'ON review.record_fk_id = record.id AND review.create_by_id = %s '
+    'WHERE record.slug = %s ORDER BY record.id LIMIT 1')
+
+
+def record_fragments(request, slug):
+    """
+    Render per-user fragments of record page. Logged user costs one query
+    using the slug index and the (record_fk, create_by) review index
+    """
+    user = request.user
+    context = {'user': user, 'user_review': None, 'record_slug': slug}
+    if user.is_authenticated():
+        rows = list(Review.objects.raw(USER_REVIEW_SQL, [user.pk, slug]))
+        if not rows:
+            raise Http404('No record found')
+        context['record_title'] = rows[0].record_title
+        if rows[0].pk is not None:
+            context['user_review'] = rows[0]
+    return {
+        'nav_user': render_to_string('music/fragments/nav_user.html',
+                                     context, request),
+        'user_review': render_to_string('music/fragments/user_review.html',
+                                        context, request),
+    }
+
+
+def related_reviews_fragment(request, slug):
+    """
+    Render reviews of other users than the logged one, the record page
+    includes them as a fragment in ESI mode
+    """
+    record = get_object_or_404(Record, slug=slug)
+    by_likes = request.GET.get('reviews') == 'likes'
+    return render_to_string('music/fragments/related_reviews.html', {
+        'related_reviews': record.get_related_reviews(
+            request.user, by_likes=by_likes, limit=REVIEWS_SHOWN)}, request)
+
+
+def record_fragment(request, slug, name):
+    """
+    Per-user fragment of record page, included by the edge in ESI mode
+    """
+    if name == 'related_reviews':
+        fragment = related_reviews_fragment(request, slug)
+    else:
+        fragments = record_fragments(request, slug)
+        if name not in fragments:
+            raise Http404('No such fragment')
+        fragment = fragments[name]
+    response = HttpResponse(fragment)
+    patch_cache_control(response, private=True, max_age=0)
+    return response
+
+
+@method_decorator(conditional(Genre, per_user=True), name='dispatch')
+class GenreView(TaggedPageCacheMixin, generic.DetailView):
     """
     View for displaying genre details
     """
@@ -269,6 +484,12 @@ class GenreView(generic.DetailView):
     model = Genre
     template_name = 'music/genre.html'
 
+    def get_cache_tags(self, context):
+        genre = context['genre']
+        return ['genre:%d' % genre.pk] + \
+                ['record:%d' % record.pk
+                 for record in genre.get_related_records()]
+
 
 
 class UserPanelView(generic.ListView):
@@ -281,7 +502,12 @@ class UserPanelView(generic.ListView):
 
     def get_context_data(self, **kwargs):
         context = super(UserPanelView, self).get_context_data(**kwargs)
-        #context['recent_records'] = OwnedRecord.get_recent_records(self.request.user)
+        context['recent_records'] = OwnedRecord.get_recent_records(
+            self.request.user)
+        context['collection_stats'] = OwnedRecord.get_collection_stats(
+            self.request.user)
+        context['recommended_records'] = RecommendedRecord.for_user(
+            self.request.user)
 
         return context
 
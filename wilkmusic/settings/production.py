@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'music.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -138,6 +139,12 @@ STATICFILES_DIRS = [
     #'/var/www/static/',
 ]
 STATIC_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'staticfiles')
+# collectstatic writes content-hashed names, gzip (and brotli, if installed)
+# variants and a manifest, served by music.middleware.StaticFilesMiddleware:
+# hashed names as immutable, original names for a short while
+STATICFILES_STORAGE = 'music.storage.CompressedManifestStaticFilesStorage'
+MUSIC_STATIC_MAX_AGE = 365 * 24 * 3600
+MUSIC_STATIC_UNHASHED_MAX_AGE = 300
 
 
 LOGIN_REDIRECT_URL = '/music/'
@@ -148,3 +155,77 @@ LOGOUT_REDIRECT_URL = '/music/'
 MEDIA_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'mediafiles')
 MEDIA_URL = '/media/'
 
+
+# Number of other records of the same bands shown on record page
+MUSIC_OTHER_RECORDS_LIMIT = 10
+
+# Typeahead index: seconds between incremental refreshes and full rebuilds
+MUSIC_TYPEAHEAD_REFRESH = 30
+MUSIC_TYPEAHEAD_REBUILD = 3600
+
+# Caches. Both are shared by all gunicorn workers and management commands,
+# so that invalidation reaches every worker: they live in database tables,
+# created with manage.py createcachetable. Full pages get a table of their
+# own so that it can be sized separately
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'music_cache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'music_page_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Full-page cache of anonymous traffic
+MUSIC_PAGE_CACHE_ALIAS = 'pages'
+MUSIC_PAGE_CACHE_TIMEOUT = 600
+# Hit and miss counters are written to the cache once per that many
+# requests of a process rather than on every request
+MUSIC_PAGE_CACHE_STATS_EVERY = 100
+# Per-user fragments of shared pages are left to the edge server as edge
+# side includes instead of being filled in by Django
+MUSIC_PAGE_CACHE_ESI = False
+
+# API lists are paginated with cursors, ?page_size= up to the maximum
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'music.api.pagination.KeysetCursorPagination',
+    'PAGE_SIZE': 50,
+}
+MUSIC_API_MAX_PAGE_SIZE = 500
+
+# Records read per query by the streaming catalogue export
+MUSIC_EXPORT_CHUNK_SIZE = 500
+
+# Largest JSON array accepted by the bulk create API endpoints
+MUSIC_API_MAX_BULK_CREATE = 500
+
+# Similar records shown on a record page and kept per record
+MUSIC_SIMILAR_RECORDS_LIMIT = 10
+
+# Recommended records shown on the user panel and kept per user
+MUSIC_RECOMMENDATIONS_LIMIT = 10
+
+# Collection statistics are dropped when the user's owned records change,
+# the timeout bounds staleness after catalogue edits (e.g. track lengths)
+MUSIC_COLLECTION_STATS_TIMEOUT = 24 * 3600
+
+# Widths of thumbnails rendered from uploaded images, and number of worker
+# processes of the render_thumbnails command rendering them, kept running
+# by the worker process of the Procfile. 0 renders them in the saving
+# process instead
+MUSIC_THUMBNAIL_SIZES = (150, 300, 600)
+MUSIC_THUMBNAIL_WORKERS = 2
+
+# Uploads are named by content hash and served by music.media.serve with
+# far-future caching, older uploads not named so for an hour.
+# MUSIC_MEDIA_ACCEL hands transfers to the front server:
+# 'nginx' answers with X-Accel-Redirect to MUSIC_MEDIA_ACCEL_PREFIX (an
+# internal location aliasing MEDIA_ROOT), 'sendfile' with X-Sendfile
+DEFAULT_FILE_STORAGE = 'music.storage.ContentHashStorage'
+MUSIC_MEDIA_ACCEL = None
+MUSIC_MEDIA_ACCEL_PREFIX = '/protected-media/'
+MUSIC_MEDIA_MAX_AGE = 365 * 24 * 3600
+MUSIC_MEDIA_UNHASHED_MAX_AGE = 3600
@@ -13,10 +13,11 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.conf.urls import include, url
 from django.contrib.auth import views as auth_views
-from music import views
+from music import views, media
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
@@ -27,6 +28,8 @@ urlpatterns = [
     url(r'^login/$', auth_views.login, name='login'),
     url(r'^logout/$', auth_views.logout, name='logout'),
     url(r'^$', views.IndexView.as_view(), name='index'),
-    url(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework'))
+    url(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework')),
+    url(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), media.serve,
+        name='media'),
 ]
 
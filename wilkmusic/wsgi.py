@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "wilkmusic.settings")
 
 application = get_wsgi_application()
+
+# Every worker builds its typeahead index at startup rather than on the
+# first keystroke. A database that is not reachable yet only postpones it
+from django.db import DatabaseError
+from music.typeahead import typeahead
+
+try:
+    typeahead.build()
+except DatabaseError:
+    pass